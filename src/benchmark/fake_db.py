@@ -0,0 +1,220 @@
+# src/benchmark/fake_db.py
+#
+# In-process stand-in for the PostGIS pool, so run_query can be benchmarked
+# without a database. install() puts a FakePool and a database.conf-style
+# config in place of database_helper's singletons; everything above the
+# cursor (query guard, prepared statements, encoding, result cache) runs
+# for real.
+#
+# Each EXECUTE (or, for streamed queries, each query run with the AOI bound
+# as %(aoi)s) sleeps for a fixed latency plus a per-row cost and returns
+# every fixture polygon (the AOI is not applied, nor is zoom simplification),
+# shaped like the wrapped query asks for: ST_AsGeoJSON text for the postgis
+# encoding, hex EWKB for shapely. EXPLAIN returns a plan whose row estimate
+# is the fixture size.
+
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import shapely
+
+from helper import database_helper, geojson_encoder, pagination
+
+# Roughly the state of Uttarakhand
+BOUNDS = (77.5, 28.7, 81.1, 31.5)
+FEATURE_TYPES = ["Village road (Pucca)", "Forest - Scrub Forest", "River", "Built Up", "Sandy Area"]
+
+_prepare_pattern = re.compile(r"PREPARE\s+(\w+)\([^)]*\)\s+AS\s+(.*)", re.DOTALL)
+_execute_pattern = re.compile(r"(EXPLAIN\s+\([^)]*\)\s+)?EXECUTE\s+(\w+)")
+_limit_pattern = re.compile(r"\) AS _limited LIMIT (\d+)")
+
+
+def fixture_features(count: int, vertices: int = 32, seed: int = 7):
+    """
+    `count` (gid, type, polygon) triples: small irregular polygons spread over BOUNDS.
+    """
+    rng = random.Random(seed)
+    features = []
+    for gid in range(1, count + 1):
+        x = rng.uniform(BOUNDS[0], BOUNDS[2])
+        y = rng.uniform(BOUNDS[1], BOUNDS[3])
+        radius = rng.uniform(0.002, 0.02)
+        ring = []
+        for i in range(vertices):
+            angle = 2 * math.pi * i / vertices
+            r = radius * rng.uniform(0.7, 1.0)
+            ring.append((x + r * math.cos(angle), y + r * math.sin(angle)))
+        features.append((gid, FEATURE_TYPES[gid % len(FEATURE_TYPES)], shapely.Polygon(ring)))
+    return features
+
+
+class Fixture:
+    """
+    The fixture rows in every shape a wrapped query can ask for, built once.
+    """
+
+    def __init__(self, count: int, vertices: int = 32):
+        features = fixture_features(count, vertices)
+        geometries = [geometry for _, _, geometry in features]
+        geojson = shapely.to_geojson(shapely.set_precision(geometries, 10 ** -geojson_encoder.COORDINATE_PRECISION))
+        ewkb = shapely.to_wkb(shapely.set_srid(geometries, 4326), hex=True, include_srid=True)
+        self.count = count
+        self.postgis = []
+        self.postgis_properties = []
+        self.shapely = []
+        for (gid, feature_type, _), geometry_json, hex_ewkb in zip(features, geojson, ewkb):
+            row = {geojson_encoder.GEOMETRY_ALIAS: geometry_json, geojson_encoder.PROPERTIES_ALIAS: None,
+                   pagination.PAGE_KEY_ALIAS: gid}
+            self.postgis.append(row)
+            self.postgis_properties.append(dict(
+                row, **{geojson_encoder.PROPERTIES_ALIAS: json.dumps({"gid": gid, "type": feature_type})}))
+            self.shapely.append({"gid": gid, "type": feature_type, geojson_encoder.GEOMETRY_COLUMN: hex_ewkb})
+
+    def rows(self, sql: str):
+        if geojson_encoder.GEOMETRY_ALIAS not in sql:
+            rows = self.shapely
+        elif "to_jsonb(_q)" in sql:
+            rows = self.postgis_properties
+        else:
+            rows = self.postgis
+        limit = _limit_pattern.search(sql)
+        return rows[:int(limit.group(1))] if limit else rows
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self._rows = []
+        self._position = 0
+        self.itersize = 2000
+
+    def _plan(self):
+        fixture = self.connection.pool.fixture
+        return [([{"Plan": {"Total Cost": 100.0 + fixture.count, "Plan Rows": fixture.count},
+                   "Planning Time": 0.1}],)]
+
+    def _run(self, statement: str):
+        rows = self.connection.pool.fixture.rows(statement)
+        time.sleep(self.connection.pool.latency + self.connection.pool.per_row * len(rows))
+        return rows
+
+    def execute(self, sql, params=None):
+        sql = str(sql)
+        self._position = 0
+        prepare = _prepare_pattern.match(sql)
+        if prepare:
+            self.connection.statements[prepare.group(1)] = prepare.group(2)
+            self._rows = []
+            return
+        execute = _execute_pattern.match(sql)
+        if execute:
+            statement = self.connection.statements[execute.group(2)]
+            self._rows = self._plan() if execute.group(1) else self._run(statement)
+        elif isinstance(params, dict) and "aoi" in params:
+            # Unprepared query over the AOI (streamed results, or its EXPLAIN)
+            self._rows = self._plan() if sql.startswith("EXPLAIN") else self._run(sql)
+        else:
+            # SET, DEALLOCATE, ... have no effect here
+            self._rows = []
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def fetchmany(self, size=None):
+        size = size or self.itersize
+        rows = self._rows[self._position:self._position + size]
+        self._position += len(rows)
+        return rows
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FakeConnection:
+    def __init__(self, pool):
+        self.pool = pool
+        self.prepared_statements = OrderedDict()
+        self.statements = {}
+        self.autocommit = False
+
+    def cursor(self, cursor_factory=None, name=None):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class FakePool:
+    """
+    Same connection() / stats() / closeall() surface as db_pool.ConnectionPool,
+    with at most max_size connections handed out at once.
+    """
+
+    def __init__(self, fixture: Fixture, latency: float = 0.02, per_row: float = 0.00001, max_size: int = 10):
+        self.fixture = fixture
+        self.latency = latency
+        self.per_row = per_row
+        self.max_size = max_size
+        self._free = [FakeConnection(self) for _ in range(max_size)]
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self, timeout: float = None):
+        if not self._slots.acquire(timeout=timeout if timeout is not None else -1):
+            raise TimeoutError("No free fake connection")
+        with self._lock:
+            connection = self._free.pop()
+        try:
+            yield connection
+        finally:
+            with self._lock:
+                self._free.append(connection)
+            self._slots.release()
+
+    def ping(self, timeout: float = None):
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"fake": True, "max_size": self.max_size, "in_use": self.max_size - len(self._free)}
+
+    def closeall(self):
+        pass
+
+
+def install(rows: int = 2000, latency: float = 0.02, per_row: float = 0.00001, encoding: str = "postgis",
+            pool_size: int = 10, result_cache: bool = False) -> FakePool:
+    """
+    Makes database_helper use a FakePool over `rows` fixture polygons, with
+    the given GEOMETRY_ENCODING and the result cache on or off.
+    """
+    pool = FakePool(Fixture(rows), latency, per_row, pool_size)
+    database_helper._config = {
+        "GEOMETRY_ENCODING": encoding,
+        "INCLUDE_PROPERTIES": "false",
+        "RESULT_CACHE_MAX_BYTES": str(64 * 1024 * 1024 if result_cache else 0),
+    }
+    database_helper._pool = pool
+    # Rebuilt from the config above on next use
+    database_helper._result_cache = None
+    database_helper._statement_cache = None
+    return pool
@@ -0,0 +1,215 @@
+# src/benchmark/fake_ollama.py
+#
+# Stand-in for the Ollama HTTP API, for benchmarks that must not depend on
+# the real model host. /api/generate and /api/chat answer after a fixed
+# time-to-first-token and then emit tokens at a fixed rate, streamed as
+# NDJSON or as one JSON body, with Ollama's timing fields filled in.
+# /api/tags lists the configured model.
+#
+# Answers are canned and shaped like the prompt examples: SQL prompts get
+# a SELECT over the tables named in their schema (one of
+# prompt_helper.SQL_EXAMPLES when its tables are all there), /chat prompts
+# get "LLM Response: ... View Operation: SELECT DISTINCT ...".
+#
+# Run from src/:  python -m benchmark.fake_ollama [--port 11434] [--ttft 0.3] [--tokens-per-sec 40]
+
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from helper import prompt_helper
+
+_table_name_pattern = re.compile(r'"table_name":\s*"([A-Za-z_][A-Za-z0-9_]*)"')
+_response_token_pattern = re.compile(r"\s*\S+")
+_example_query_pattern = re.compile(r"Query\s*:\s*(.*)", re.DOTALL)
+
+NO_DATA = "Sorry, no data found as per your query."
+
+
+def example_queries():
+    """
+    (tables, SQL) of each prompt example, SQL on one line.
+    """
+    examples = []
+    for example in prompt_helper.SQL_EXAMPLES:
+        sql = " ".join(_example_query_pattern.search(example).group(1).split())
+        examples.append((prompt_helper._example_tables(example), sql))
+    return examples
+
+
+def prompt_tables(prompt: str):
+    # The first table_name in a prompt is its best-matched dataset
+    return list(dict.fromkeys(_table_name_pattern.findall(prompt)))
+
+
+def sql_answer(prompt: str, examples) -> str:
+    tables = prompt_tables(prompt)
+    for example_tables, sql in examples:
+        if example_tables and example_tables <= set(tables):
+            return sql
+    if not tables:
+        return NO_DATA
+    return (f"SELECT t.gid, t.geom FROM {tables[0]} AS t "
+            f"JOIN aoi ON ST_Intersects(t.geom, aoi.geom);")
+
+
+def chat_answer(prompt: str) -> str:
+    # Only the matched context, not the fixed examples, names the tables for this question
+    tables = prompt_tables(prompt.rsplit("Dataset Context:", 1)[-1])
+    if not tables:
+        return NO_DATA
+    return (f" The {tables[0].replace('uttarakhand_', '').replace('_', ' ')} types are listed in {tables[0]}.\n"
+            f"View Operation: SELECT DISTINCT type FROM {tables[0]};")
+
+
+def tokenize(text: str):
+    # Whitespace-led words stand in for model tokens; joined they give back the text
+    return _response_token_pattern.findall(text) or [text]
+
+
+class FakeOllama:
+    """
+    Answer timing and content. At most `parallel` generations run at once
+    (like OLLAMA_NUM_PARALLEL); the rest wait, and their wait counts as load
+    time in the reported durations.
+    """
+
+    def __init__(self, model: str = "llama3:latest", ttft: float = 0.3, tokens_per_sec: float = 40.0,
+                 parallel: int = 4):
+        self.model = model
+        self.ttft = ttft
+        self.tokens_per_sec = tokens_per_sec
+        self.examples = example_queries()
+        self._slots = threading.BoundedSemaphore(parallel)
+        self._lock = threading.Lock()
+        self.requests = 0
+
+    def answer(self, prompt: str) -> str:
+        if "View Operation" in prompt:
+            return chat_answer(prompt)
+        return sql_answer(prompt, self.examples)
+
+    def generate(self, prompt: str):
+        """
+        Yields (token, final stats or None) as the model would produce them.
+        """
+        with self._lock:
+            self.requests += 1
+        queued = time.perf_counter()
+        with self._slots:
+            started = time.perf_counter()
+            time.sleep(self.ttft)
+            tokens = tokenize(self.answer(prompt))
+            first_token = time.perf_counter()
+            for i, token in enumerate(tokens):
+                if i:
+                    time.sleep(1.0 / self.tokens_per_sec)
+                yield token, None
+            finished = time.perf_counter()
+        yield "", {
+            "total_duration": int((finished - queued) * 1e9),
+            "load_duration": int((started - queued) * 1e9),
+            "prompt_eval_count": prompt_helper.estimate_tokens(prompt),
+            "prompt_eval_duration": int((first_token - started) * 1e9),
+            "eval_count": len(tokens),
+            "eval_duration": int((finished - first_token) * 1e9),
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    fake: FakeOllama = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json(200, {"models": [{"name": self.fake.model, "model": self.fake.model}]})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path not in ("/api/generate", "/api/chat"):
+            self._send_json(404, {"error": "not found"})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        chat = self.path == "/api/chat"
+        if chat:
+            prompt = "\n".join(message.get("content", "") for message in payload.get("messages", []))
+        else:
+            prompt = payload.get("prompt", "")
+        model = payload.get("model", self.fake.model)
+
+        def chunk(token: str, stats):
+            body = {"model": model, "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                    "done": stats is not None}
+            if chat:
+                body["message"] = {"role": "assistant", "content": token}
+            else:
+                body["response"] = token
+            if stats is not None:
+                body.update(stats, done_reason="stop")
+            return body
+
+        if payload.get("stream", True):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for token, stats in self.fake.generate(prompt):
+                line = json.dumps(chunk(token, stats)).encode("utf-8") + b"\n"
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+            return
+
+        parts = []
+        for token, stats in self.fake.generate(prompt):
+            parts.append(token)
+        body = chunk("".join(parts), stats)
+        self._send_json(200, body)
+
+
+def start(fake: FakeOllama, host: str = "127.0.0.1", port: int = 11434) -> ThreadingHTTPServer:
+    """
+    Serves `fake` on a daemon thread; call shutdown() on the result to stop.
+    """
+    handler = type("FakeOllamaHandler", (_Handler,), {"fake": fake})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Ollama server with fixed latency")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--model", default="llama3:latest")
+    parser.add_argument("--ttft", type=float, default=0.3, help="seconds to first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=40.0)
+    parser.add_argument("--parallel", type=int, default=4, help="generations served at once")
+    args = parser.parse_args()
+    server = start(FakeOllama(args.model, args.ttft, args.tokens_per_sec, args.parallel), args.host, args.port)
+    print(f"Fake Ollama on http://{args.host}:{args.port} (ttft {args.ttft}s, {args.tokens_per_sec} tokens/s)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
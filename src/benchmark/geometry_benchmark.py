@@ -0,0 +1,96 @@
+# src/benchmark/geometry_benchmark.py
+#
+# Rows/sec of the geometry encoding paths in run_query.
+# Run from src/:  python -m benchmark.geometry_benchmark
+#
+# "postgis" only measures the Python side (splicing ST_AsGeoJSON text);
+# the geometry rendering itself moves into the database.
+
+import json
+import random
+import time
+
+import geojson
+import shapely
+from shapely.wkb import loads
+
+from helper import geojson_encoder
+
+
+def synthetic_rows(count: int, vertices: int = 50):
+    rng = random.Random(7)
+    rows = []
+    for gid in range(count):
+        x, y = 78 + rng.random() * 3, 29 + rng.random() * 2
+        coords = []
+        for _ in range(vertices):
+            x += rng.uniform(-0.001, 0.001)
+            y += rng.uniform(-0.001, 0.001)
+            coords.append((x, y))
+        rows.append({"gid": gid, "type": "Village road (Pucca)", "geom": memoryview(shapely.LineString(coords).wkb)})
+    return rows
+
+
+def legacy_encode(rows) -> bytes:
+    """WKB -> Shapely -> __geo_interface__ -> dumps -> loads per row, then jsonify."""
+    features = []
+    for row in rows:
+        geometry = loads(bytes(row["geom"]))
+        features.append(geojson.Feature(
+            geometry=geojson.loads(geojson.dumps(geometry.__geo_interface__)),
+            properties={}
+        ))
+    return json.dumps(geojson.FeatureCollection(features)).encode("utf-8")
+
+
+def shapely_encode(rows, include_properties=False) -> bytes:
+    return geojson_encoder.feature_collection(geojson_encoder.encode_rows(rows, "shapely", include_properties))
+
+
+def postgis_rows(rows, include_properties=False):
+    # Stand-in for ST_AsGeoJSON(geom, 6) output
+    geometries = shapely.to_geojson(shapely.set_precision(
+        shapely.from_wkb([bytes(row["geom"]) for row in rows]), 1e-6, mode="pointwise"))
+    return [{
+        geojson_encoder.GEOMETRY_ALIAS: geometry,
+        geojson_encoder.PROPERTIES_ALIAS: json.dumps({"gid": row["gid"], "type": row["type"]}) if include_properties else None
+    } for row, geometry in zip(rows, geometries)]
+
+
+def postgis_encode(rows, include_properties=False) -> bytes:
+    return geojson_encoder.feature_collection(geojson_encoder.encode_rows(rows, "postgis", include_properties))
+
+
+def rows_per_second(fn, rows, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(rows)
+        best = min(best, time.perf_counter() - start)
+    return len(rows) / best
+
+
+def run(count: int = 20000):
+    rows = synthetic_rows(count)
+    db_rows = postgis_rows(rows)
+    db_rows_with_properties = postgis_rows(rows, include_properties=True)
+
+    # Same geometry out of every path
+    expected = [f["geometry"] for f in json.loads(legacy_encode(rows[:50]))["features"]]
+    assert [f["geometry"] for f in json.loads(shapely_encode(rows[:50]))["features"]] == expected
+
+    results = [
+        ("legacy (per-row round trip)", rows_per_second(legacy_encode, rows)),
+        ("shapely batch", rows_per_second(shapely_encode, rows)),
+        ("shapely batch + properties", rows_per_second(lambda r: shapely_encode(r, True), rows)),
+        ("postgis splice", rows_per_second(postgis_encode, db_rows)),
+        ("postgis splice + properties", rows_per_second(lambda r: postgis_encode(r, True), db_rows_with_properties)),
+    ]
+    baseline = results[0][1]
+    print(f"{count} rows, 50-vertex linestrings")
+    for name, rate in results:
+        print(f"{name:<30} {rate:>12,.0f} rows/s  {rate / baseline:>6.1f}x")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,100 @@
+# src/benchmark/matcher_benchmark.py
+#
+# Micro-benchmark: compiled KeywordIndex vs the original per-keyword difflib loop.
+# Run from src/:  python -m benchmark.matcher_benchmark
+
+import random
+import string
+import time
+from difflib import get_close_matches
+from typing import Dict, List
+
+from matcher.keyword_index import KeywordIndex
+from matcher.matcher import KEYWORD_MAPPINGS
+
+QUERIES = [
+    "what types of soil are found in uttarakhand?",
+    "tell me about roads in dehradun",
+    "what is the weather like today?",
+    "show me forest data",
+    "what are the earthquake zones?",
+    "hello, how are you?",
+    "show me the raods",
+    "show national highway passing through glacial lake area",
+    "find built-up area near drainage",
+    "show the barren lands within 10m of a water body",
+    "elevation contours in pithoragarh district",
+    "irrigated agriculture and farming in haridwar",
+]
+
+
+def legacy_match(keyword_mappings: Dict[str, List[str]], corrected_words: List[str]) -> List[str]:
+    """The pre-index loop from matcher.extract_keywords_from_query, kept as the baseline."""
+    corrected_query = " ".join(corrected_words)
+    matched_categories = []
+    for category, keywords in keyword_mappings.items():
+        for keyword in keywords:
+            if " " in keyword:
+                if keyword in corrected_query:
+                    matched_categories.append(category)
+                    break
+            else:
+                for cw in corrected_words:
+                    if keyword == cw:
+                        matched_categories.append(category)
+                        break
+                    close_matches = get_close_matches(keyword, [cw], n=1, cutoff=0.8)
+                    if close_matches:
+                        matched_categories.append(category)
+                        break
+                else:
+                    continue
+                break
+    return matched_categories
+
+
+def synthetic_mappings(extra_categories: int, keywords_per_category: int = 6) -> Dict[str, List[str]]:
+    """Pads the real mappings with random categories to simulate adding datasets."""
+    rng = random.Random(42)
+    mappings = dict(KEYWORD_MAPPINGS)
+    for i in range(extra_categories):
+        keywords = []
+        for _ in range(keywords_per_category):
+            word = "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 11)))
+            if rng.random() < 0.2:
+                word += " " + "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 8)))
+            keywords.append(word)
+        mappings[f"synthetic_{i}"] = keywords
+    return mappings
+
+
+def time_per_query(fn, queries: List[List[str]], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for words in queries:
+            fn(words)
+    return (time.perf_counter() - start) / (repeat * len(queries)) * 1e6
+
+
+def run(repeat: int = 20):
+    queries = [q.split() for q in QUERIES]
+    print(f"{'categories':>10} {'legacy us/query':>16} {'cold us/query':>14} {'warm us/query':>14} {'speedup':>8}")
+    for extra in (0, 50, 200, 1000):
+        mappings = synthetic_mappings(extra)
+        index = KeywordIndex(mappings, cutoff=0.8)
+
+        for words in queries:
+            expected = legacy_match(mappings, words)
+            actual = index.match(words)
+            assert actual == expected, f"mismatch for {words}: {actual} != {expected}"
+
+        legacy_us = time_per_query(lambda w: legacy_match(mappings, w), queries, max(1, repeat // (1 + extra // 50)))
+        # Fresh index: first pass fills the per-word cache, later passes hit it
+        index = KeywordIndex(mappings, cutoff=0.8)
+        cold_us = time_per_query(index.match, queries, 1)
+        warm_us = time_per_query(index.match, queries, repeat)
+        print(f"{len(mappings):>10} {legacy_us:>16.1f} {cold_us:>14.1f} {warm_us:>14.1f} {legacy_us / cold_us:>7.1f}x")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,262 @@
+# src/benchmark/pipeline_benchmark.py
+#
+# End-to-end load test of the /chat and /query pipelines without the real
+# Ollama host or database: query -> spell correction -> matcher -> prompt
+# -> LLM (benchmark.fake_ollama, served on the [llm] host/port from
+# server.conf, which must be local) -> run_query (benchmark.fake_db, or the
+# database from conf/database.conf with --db configured).
+#
+# A query corpus (the retrieval benchmark's labelled queries, or one query
+# per line from --corpus) is replayed at fixed concurrency: each of
+# --concurrency workers sends its next request as soon as the previous one
+# finishes. Each request runs the same steps as its route and is timed
+# per stage by the spans the pipeline records itself (helper.metrics), and
+# p50/p95/p99 per stage are written to a JSON file with stable key order,
+# so results from two commits can be diffed.
+#
+# Run from src/:  python -m benchmark.pipeline_benchmark [--concurrency 8] [--requests 200] [--output FILE]
+#
+# Caches that would hide the LLM and database (LangChain's prompt cache
+# and the query result cache) are off unless --caches is given; the /chat
+# answer cache is never consulted.
+
+import argparse
+import itertools
+import json
+import statistics
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from flask import Flask
+from langchain.globals import set_llm_cache
+
+from benchmark import fake_db, fake_ollama
+from benchmark.retrieval_benchmark import LABELLED_QUERIES
+from helper import metrics, prompt_helper, response_helper
+from llm import generate_responses, ollama_client
+from llm.scheduler import llm_scheduler
+from server import chat_pipeline
+
+SCENARIOS = ("chat", "query")
+PERCENTILES = (50, 95, 99)
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "0.0.0.0", "::1")
+
+# Dehradun district
+DEFAULT_AOI = "POLYGON((77.6 30.0, 78.3 30.0, 78.3 30.9, 77.6 30.9, 77.6 30.0))"
+
+
+# response_helper builds Flask responses, which need an app context
+_app = Flask(__name__)
+
+
+def traced(route: str, request, *args) -> dict:
+    """
+    Runs one request under a metrics trace; returns its stage timings in ms.
+    """
+    trace = metrics.start_trace(route)
+    try:
+        with _app.app_context():
+            request(*args)
+    finally:
+        trace.end()
+    return {stage: seconds * 1000 for stage, seconds in trace.spans.items()}
+
+
+def _chat(query: str, engine: str):
+    # routes.chat without the answer cache
+    prepared = chat_pipeline.prepare_chat(query, engine)
+    with llm_scheduler.acquire():
+        with metrics.span("llm"):
+            response = ollama_client.generate(prepared["payload"])
+    response.raise_for_status()
+    llm_json = response.json()
+    chat_pipeline.measure(prepared, llm_json)
+    with metrics.span("serialize"):
+        json.dumps(chat_pipeline.chat_result(llm_json, prepared["context"]))
+
+
+def _query(query: str, engine: str, aoi: str, zoom: int):
+    # routes.query_layers, non-streaming
+    query = query.strip()
+    context = prompt_helper.get_sql_context(query, engine=engine)
+    with llm_scheduler.acquire():
+        llm_response = generate_responses(query, context=context)
+    ok, response = response_helper.get_result_from_db(llm_response, aoi, None, zoom)
+    if not ok:
+        raise RuntimeError(response.get_json()["error"])
+
+
+def chat_request(query: str, engine: str = None, **_) -> dict:
+    return traced("/chat", _chat, query, engine)
+
+
+def query_request(query: str, engine: str = None, aoi: str = DEFAULT_AOI, zoom: int = None) -> dict:
+    return traced("/query", _query, query, engine, aoi, zoom)
+
+
+def percentile(ordered: list, p: float) -> float:
+    # Nearest rank
+    if not ordered:
+        return None
+    index = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(samples: list) -> dict:
+    ordered = sorted(samples)
+    summary = {"count": len(ordered), "mean_ms": round(statistics.mean(ordered), 3) if ordered else None,
+               "max_ms": round(ordered[-1], 3) if ordered else None}
+    for p in PERCENTILES:
+        value = percentile(ordered, p)
+        summary[f"p{p}_ms"] = round(value, 3) if value is not None else None
+    return summary
+
+
+def run_load(request, queries: list, concurrency: int, requests: int, warmup: int = 1, **options) -> dict:
+    """
+    Sends `requests` requests over `concurrency` closed-loop workers, cycling
+    through `queries`, and summarizes each stage and the total. The first
+    `warmup` requests run one at a time beforehand and are not counted, so
+    one-off loads (spell dictionary, metadata, index) stay out of the figures.
+    """
+    for query in itertools.islice(itertools.cycle(queries), warmup):
+        request(query, **options)
+    next_query = itertools.cycle(queries)
+    lock = threading.Lock()
+    sent = itertools.count()
+    results = []
+    errors = {}
+
+    def worker():
+        while next(sent) < requests:
+            with lock:
+                query = next(next_query)
+            started = time.perf_counter()
+            try:
+                timings = request(query, **options)
+            except Exception as e:
+                with lock:
+                    errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+                continue
+            timings["total"] = (time.perf_counter() - started) * 1000
+            with lock:
+                results.append(timings)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(worker)
+    elapsed = time.perf_counter() - started
+
+    stages = {}
+    for timings in results:
+        for name, ms in timings.items():
+            stages.setdefault(name, []).append(ms)
+    return {
+        "requests": requests,
+        "completed": len(results),
+        "errors": errors,
+        "wall_s": round(elapsed, 3),
+        "throughput_rps": round(len(results) / elapsed, 3) if elapsed else None,
+        "stages": {name: summarize(samples) for name, samples in stages.items()},
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def start_fake_llm(ttft: float, tokens_per_sec: float, parallel: int):
+    url = urlparse(ollama_client.LLM_CONFIG["base_url"])
+    if url.hostname not in LOCAL_HOSTS:
+        raise SystemExit(f"[llm] host is {url.hostname}; point it at localhost to use the fake Ollama server, "
+                         f"or pass --llm configured to benchmark the configured one")
+    fake = fake_ollama.FakeOllama(ollama_client.LLM_CONFIG["model"], ttft, tokens_per_sec, parallel)
+    return fake, fake_ollama.start(fake, "127.0.0.1", url.port or 11434)
+
+
+def load_corpus(path: str = None) -> list:
+    if path is None:
+        return [query for query, _ in LABELLED_QUERIES]
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def print_summary(name: str, result: dict):
+    print(f"\n{name}: {result['completed']}/{result['requests']} ok, {result['throughput_rps']} req/s, "
+          f"errors {result['errors'] or 'none'}")
+    print(f"  {'stage':<16} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'mean ms':>9}")
+    for stage_name, summary in result["stages"].items():
+        print(f"  {stage_name:<16} {summary['p50_ms']:>9.2f} {summary['p95_ms']:>9.2f} {summary['p99_ms']:>9.2f} "
+              f"{summary['mean_ms']:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end pipeline benchmark")
+    parser.add_argument("--scenario", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--warmup", type=int, default=1, help="uncounted requests per scenario before the load")
+    parser.add_argument("--corpus", help="file with one query per line")
+    parser.add_argument("--matcher", choices=("rules", "tfidf"))
+    parser.add_argument("--output", default="pipeline_benchmark.json")
+    parser.add_argument("--caches", action="store_true", help="keep the LLM prompt and query result caches on")
+    parser.add_argument("--llm", choices=("fake", "configured"), default="fake")
+    parser.add_argument("--ttft", type=float, default=0.3, help="fake LLM seconds to first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=40.0)
+    parser.add_argument("--llm-parallel", type=int, default=4, help="fake LLM generations served at once")
+    parser.add_argument("--db", choices=("fake", "configured"), default="fake")
+    parser.add_argument("--db-rows", type=int, default=2000, help="fake DB rows per query")
+    parser.add_argument("--db-latency", type=float, default=0.02, help="fake DB seconds per query")
+    parser.add_argument("--db-row-cost", type=float, default=0.00001, help="fake DB seconds per row")
+    parser.add_argument("--encoding", choices=("postgis", "shapely"), default="postgis")
+    parser.add_argument("--aoi", default=DEFAULT_AOI)
+    parser.add_argument("--zoom", type=int)
+    args = parser.parse_args()
+
+    queries = load_corpus(args.corpus)
+    fake, server = None, None
+    if args.llm == "fake":
+        fake, server = start_fake_llm(args.ttft, args.tokens_per_sec, args.llm_parallel)
+    if args.db == "fake":
+        fake_db.install(args.db_rows, args.db_latency, args.db_row_cost, args.encoding, result_cache=args.caches)
+    if not args.caches:
+        set_llm_cache(None)
+    # The stage timings are the pipeline's own metrics spans
+    metrics.METRICS_CONFIG["enabled"] = True
+
+    report = {
+        "benchmark": "pipeline",
+        "git_commit": git_commit(),
+        "settings": {key: value for key, value in vars(args).items() if key != "output"},
+        "corpus_size": len(queries),
+        "scenarios": {},
+    }
+    runners = {"chat": chat_request, "query": query_request}
+    try:
+        for name in args.scenario:
+            result = run_load(runners[name], queries, args.concurrency, args.requests, args.warmup,
+                              engine=args.matcher, aoi=args.aoi, zoom=args.zoom)
+            report["scenarios"][name] = result
+            print_summary(name, result)
+    finally:
+        if server is not None:
+            server.shutdown()
+    if fake is not None:
+        report["fake_llm_requests"] = fake.requests
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write("\n")
+    print(f"\nWrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
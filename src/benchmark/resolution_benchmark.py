@@ -0,0 +1,76 @@
+# src/benchmark/resolution_benchmark.py
+#
+# Response size and latency of /query results at different map zoom levels,
+# per dataset in metadata.json. Needs the database from conf/database.conf.
+# Run from src/:  python -m benchmark.resolution_benchmark [--limit 5000] [--aoi WKT]
+#
+# Each dataset is read with "SELECT geom FROM <table>" over the AOI through
+# the same build_sql / encode_rows path as run_query, once at full detail
+# and once per zoom level.
+
+import argparse
+import time
+
+import psycopg2.extras
+
+from helper import database_helper, geojson_encoder, metadata_registry
+
+ZOOMS = [None, 8, 10, 12, 14]
+
+# Roughly the state of Uttarakhand
+DEFAULT_AOI = "POLYGON((77.5 28.7, 81.1 28.7, 81.1 31.5, 77.5 31.5, 77.5 28.7))"
+
+
+def dataset_query(table: str, limit: int) -> str:
+    return f"SELECT t.geom FROM {table} AS t, aoi WHERE ST_Intersects(t.geom, aoi.geom) LIMIT {int(limit)}"
+
+
+def measure(connection, sql: str, aoi: str, encoding: str, zoom, repeat: int = 3):
+    """
+    Returns (bytes, best milliseconds) of the encoded FeatureCollection.
+    """
+    query = database_helper.build_sql(sql, aoi, encoding, False, zoom=zoom)
+    _, parameter = database_helper.aoi_parameter(aoi)
+    best = float("inf")
+    body = b""
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with connection.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
+            cursor.execute(query, {"aoi": parameter})
+            body = geojson_encoder.feature_collection(
+                geojson_encoder.encode_rows(cursor.fetchall(), encoding, False, zoom))
+        best = min(best, time.perf_counter() - start)
+        connection.rollback()
+    return len(body), best * 1000
+
+
+def run(limit: int = 5000, aoi: str = DEFAULT_AOI, encoding: str = "postgis"):
+    datasets = metadata_registry.get_snapshot().datasets
+    print(f"{encoding} encoding, up to {limit} features per dataset")
+    print(f"{'dataset':<40} {'zoom':>5} {'bytes':>12} {'ms':>9} {'size':>7}")
+    with database_helper.get_pool().connection() as connection:
+        for dataset in datasets:
+            name, table = dataset["name"], dataset["table_name"]
+            if not table:
+                continue
+            sql = dataset_query(table, limit)
+            baseline = None
+            for zoom in ZOOMS:
+                try:
+                    size, ms = measure(connection, sql, aoi, encoding, zoom)
+                except psycopg2.Error as e:
+                    connection.rollback()
+                    print(f"{name[:40]:<40} skipped: {e.pgerror or e}".rstrip())
+                    break
+                baseline = baseline or size or 1
+                label = "full" if zoom is None else str(zoom)
+                print(f"{name[:40]:<40} {label:>5} {size:>12,} {ms:>9.1f} {size / baseline:>6.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--limit", type=int, default=5000)
+    parser.add_argument("--aoi", default=DEFAULT_AOI)
+    parser.add_argument("--encoding", choices=geojson_encoder.ENCODINGS, default="postgis")
+    args = parser.parse_args()
+    run(args.limit, args.aoi, args.encoding)
@@ -0,0 +1,108 @@
+# src/benchmark/retrieval_benchmark.py
+#
+# Accuracy and latency of the two dataset matchers on a labelled query set:
+# the keyword rules (matcher.get_relevant_datasets) and the TF-IDF engine
+# (matcher.retrieval). Run from src/:  python -m benchmark.retrieval_benchmark
+#
+# A query counts as a hit when the expected dataset is among those returned;
+# precision is the share of returned datasets that were expected, and
+# "context" the average number of datasets that would go into the prompt
+# (an empty answer sends every dataset).
+
+import statistics
+import time
+
+from helper import metadata_registry
+from matcher import retrieval
+from matcher.matcher import get_relevant_datasets
+
+SOIL = "Uttarakhand Soil Data"
+ROADS = "Uttarakhand Roads Data"
+FOREST = "Uttarakhand Forest Data"
+DRAINAGE = "Uttarakhand Drainage Data"
+LULC = "Uttarakhand LULC (Land Use Land Cover) Data - 2015"
+EARTHQUAKE = "Uttarakhand earthqake Zone Data"
+FAULT = "Uttarakhand Fault Data"
+FLOOD = "Uttarakhand Flood Plains Data"
+FOLDS = "Uttarakhand Folds Data"
+CONTOUR_100 = "Uttarakhand Contour 100 meter Data"
+DISTRICTS = "Uttarakhand Districts Data"
+IRRIGATION = "Uttarakhand Irrigation Data"
+GLACIAL_LAKES = "Uttarakhand Glacial Lakes Data"
+GLACIER_2021 = "Uttarakhand Glacier area 2021"
+
+LABELLED_QUERIES = [
+    ("what types of soil are found in uttarakhand?", {SOIL}),
+    ("show soil erosion levels", {SOIL}),
+    ("highly productive loamy soils", {SOIL}),
+    ("tell me about roads in dehradun", {ROADS}),
+    ("show me the raods", {ROADS}),
+    ("show national highway passing through glacial lake area", {ROADS, GLACIAL_LAKES}),
+    ("village roads and cart tracks", {ROADS}),
+    ("show me forest data", {FOREST}),
+    ("dense evergreen vegetation cover", {FOREST}),
+    ("rivers and streams in chamoli", {DRAINAGE}),
+    ("find built-up area near drainage", {LULC, DRAINAGE}),
+    ("land use classes in haridwar", {LULC}),
+    ("show the barren lands within 10m of a water body", {LULC}),
+    ("what are the earthquake zones?", {EARTHQUAKE}),
+    ("seismic zone map", {EARTHQUAKE}),
+    ("major thrust faults", {FAULT}),
+    ("flood prone plains along the ganga", {FLOOD}),
+    ("anticline and syncline folds", {FOLDS}),
+    ("elevation contours every 100 meter", {CONTOUR_100}),
+    ("district boundaries", {DISTRICTS}),
+    ("irrigated agriculture and farming in haridwar", {IRRIGATION}),
+    ("glacier extent in 2021", {GLACIER_2021}),
+    ("moraine dammed glacial lakes", {GLACIAL_LAKES}),
+    ("hello, how are you?", set()),
+    ("what is the weather like today?", set()),
+]
+
+
+def evaluate(match, all_datasets: int, repeat: int = 20) -> dict:
+    hits = 0
+    precisions = []
+    context_sizes = []
+    latencies = []
+    for query, expected in LABELLED_QUERIES:
+        returned = match(query)
+        for _ in range(repeat):
+            start = time.perf_counter()
+            match(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+        if expected:
+            hits += bool(expected & set(returned))
+            if returned:
+                precisions.append(len(expected & set(returned)) / len(returned))
+        else:
+            # Off-topic queries should match nothing
+            hits += not returned
+        context_sizes.append(len(returned) or all_datasets)
+    latencies.sort()
+    return {
+        "hit_rate": hits / len(LABELLED_QUERIES),
+        "precision": statistics.mean(precisions) if precisions else 0.0,
+        "context": statistics.mean(context_sizes),
+        "p50_ms": latencies[len(latencies) // 2],
+        "p95_ms": latencies[int(len(latencies) * 0.95)],
+    }
+
+
+def run():
+    all_datasets = len(metadata_registry.get_metadata())
+    retrieval.get_index()  # built once per metadata version, like at load time
+    engines = [
+        ("rules", lambda query: get_relevant_datasets(query, engine="rules")),
+        ("tfidf", lambda query: get_relevant_datasets(query, engine="tfidf")),
+    ]
+    print(f"{len(LABELLED_QUERIES)} labelled queries, {all_datasets} datasets")
+    print(f"{'engine':<8} {'hit rate':>9} {'precision':>10} {'context':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for name, match in engines:
+        result = evaluate(match, all_datasets)
+        print(f"{name:<8} {result['hit_rate']:>9.0%} {result['precision']:>10.0%} {result['context']:>8.1f} "
+              f"{result['p50_ms']:>8.3f} {result['p95_ms']:>8.3f}")
+
+
+if __name__ == "__main__":
+    run()
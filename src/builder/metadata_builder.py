@@ -1,6 +1,13 @@
+import argparse
+import datetime
 import psycopg2
+import psycopg2.errors
+import psycopg2.sql
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from helper.db_pool import ConnectionPool
 
 def read_config(file_path):
     config = {}
@@ -90,3 +97,250 @@ def build():
         print("Metadata file already exists.")
 
 
+
+STATS_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "metadata", "table_stats.json")
+
+# Tables the application creates for itself
+EXCLUDED_TABLES = {"spatial_ref_sys", "aoi_registry", "aoi_registry_parts"}
+
+# Text columns with at most this many distinct values get a value sample
+SAMPLE_MAX_DISTINCT = 50
+SAMPLE_TIMEOUT_MS = 5000
+
+# One catalog query for every table: a table is re-introspected only when
+# its columns, its row estimate or its last analyze time changed
+FINGERPRINT_SQL = """
+    SELECT c.relname,
+           md5(string_agg(a.attname || ':' || format_type(a.atttypid, a.atttypmod), ',' ORDER BY a.attnum)),
+           c.reltuples::bigint,
+           greatest(s.last_analyze, s.last_autoanalyze)
+    FROM pg_class AS c
+    JOIN pg_namespace AS n ON n.oid = c.relnamespace
+    JOIN pg_attribute AS a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+    LEFT JOIN pg_stat_user_tables AS s ON s.relid = c.oid
+    WHERE n.nspname = %s AND c.relkind IN ('r', 'p')
+    GROUP BY c.relname, c.reltuples, s.last_analyze, s.last_autoanalyze
+"""
+
+COLUMNS_SQL = """
+    SELECT c.column_name, c.data_type,
+           col_description((quote_ident(c.table_schema) || '.' || quote_ident(c.table_name))::regclass, c.ordinal_position)
+    FROM information_schema.columns AS c
+    WHERE c.table_schema = %s AND c.table_name = %s
+    ORDER BY c.ordinal_position
+"""
+
+GEOMETRY_SQL = """
+    SELECT f_geometry_column, type, srid
+    FROM geometry_columns
+    WHERE f_table_schema = %s AND f_table_name = %s
+"""
+
+EXTENT_SQL = """
+    SELECT ST_XMin(e), ST_YMin(e), ST_XMax(e), ST_YMax(e)
+    FROM (SELECT ST_EstimatedExtent(%s, %s, %s)::box2d AS e) AS extent
+"""
+
+COLUMN_STATS_SQL = """
+    SELECT attname, n_distinct, most_common_vals::text::text[]
+    FROM pg_stats
+    WHERE schemaname = %s AND tablename = %s
+"""
+
+TEXT_TYPES = {"text", "character varying", "character"}
+
+
+def get_table_fingerprints(connection, schema):
+    with connection.cursor() as cursor:
+        cursor.execute(FINGERPRINT_SQL, (schema,))
+        rows = cursor.fetchall()
+    return {
+        table: f"{columns_hash}:{reltuples}:{analyzed_at.isoformat() if analyzed_at else ''}"
+        for table, columns_hash, reltuples, analyzed_at in rows
+        if table not in EXCLUDED_TABLES
+    }
+
+
+def _distinct_count(n_distinct, row_estimate):
+    # pg_stats stores a negative n_distinct as a fraction of the row count
+    if n_distinct is None:
+        return None
+    if n_distinct >= 0:
+        return int(n_distinct)
+    return int(-n_distinct * row_estimate) if row_estimate else None
+
+
+def sample_values(connection, schema, table, column, column_stats, row_estimate):
+    """
+    Distinct values of a low-cardinality text column, or None. Taken from
+    pg_stats when its most-common-values list is complete, otherwise read
+    with a bounded DISTINCT under a short statement_timeout.
+    """
+    n_distinct, most_common = column_stats.get(column, (None, None))
+    distinct = _distinct_count(n_distinct, row_estimate)
+    if distinct is not None and distinct > SAMPLE_MAX_DISTINCT:
+        return None
+    if distinct is not None and most_common and len(most_common) >= distinct:
+        return sorted(most_common)
+
+    query = psycopg2.sql.SQL("SELECT DISTINCT {column} FROM {table} WHERE {column} IS NOT NULL LIMIT %s").format(
+        column=psycopg2.sql.Identifier(column), table=psycopg2.sql.Identifier(schema, table))
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL statement_timeout = %s", (SAMPLE_TIMEOUT_MS,))
+            cursor.execute(query, (SAMPLE_MAX_DISTINCT + 1,))
+            values = [row[0] for row in cursor.fetchall()]
+        connection.commit()
+    except psycopg2.errors.QueryCanceled:
+        connection.rollback()
+        return sorted(most_common) if most_common else None
+    if len(values) > SAMPLE_MAX_DISTINCT:
+        return None
+    return sorted(values)
+
+
+def introspect_table(pool, schema, table, fingerprint):
+    """
+    Columns, row estimate, geometry type/SRID, estimated extent and value
+    samples of one table, on a connection of its own.
+    """
+    with pool.connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute(COLUMNS_SQL, (schema, table))
+            columns = {name: {"data_type": data_type, "description": description}
+                       for name, data_type, description in cursor.fetchall()}
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = (quote_ident(%s) || '.' || quote_ident(%s))::regclass",
+                           (schema, table))
+            row_estimate = cursor.fetchone()[0]
+            # -1 means the table was never analyzed (PostgreSQL 14+)
+            row_estimate = row_estimate if row_estimate >= 0 else None
+            cursor.execute(GEOMETRY_SQL, (schema, table))
+            geometry_rows = cursor.fetchall()
+            cursor.execute(COLUMN_STATS_SQL, (schema, table))
+            column_stats = {name: (n_distinct, most_common) for name, n_distinct, most_common in cursor.fetchall()}
+        connection.commit()
+
+        geometry = None
+        if geometry_rows:
+            column, geometry_type, srid = geometry_rows[0]
+            geometry = {"column": column, "type": geometry_type, "srid": srid, "extent": None}
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(EXTENT_SQL, (schema, table, column))
+                    extent = cursor.fetchone()
+                connection.commit()
+                if extent and extent[0] is not None:
+                    geometry["extent"] = [round(value, 6) for value in extent]
+            except psycopg2.Error:
+                # No planner statistics yet
+                connection.rollback()
+
+        samples = {}
+        for name, info in columns.items():
+            if info["data_type"] in TEXT_TYPES:
+                values = sample_values(connection, schema, table, name, column_stats, row_estimate)
+                if values is not None:
+                    samples[name] = values
+
+    return {
+        "fingerprint": fingerprint,
+        "row_estimate": row_estimate,
+        "geometry": geometry,
+        "columns": columns,
+        "samples": samples,
+        "refreshed_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+
+
+def load_stats(file_path):
+    try:
+        with open(file_path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_stats(data, file_path):
+    # Written next to the target and renamed, so readers never see half a file
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=4, sort_keys=True)
+    os.replace(tmp_path, file_path)
+
+
+def get_pool(workers):
+    conf_path = os.path.join(os.path.dirname(__file__), "..", "..", "conf", "database.conf")
+    config = read_config(conf_path)
+    return ConnectionPool(
+        connect_kwargs={
+            "host": config['SERVER'],
+            "port": config['PORT'],
+            "user": config['USER'],
+            "password": config['PASSWORD'],
+            "database": config['DATABASE']
+        },
+        min_size=1,
+        max_size=workers
+    )
+
+
+def build_stats(full=False, workers=4, schema="public", stats_path=STATS_PATH):
+    """
+    Refreshes metadata/table_stats.json: only tables whose fingerprint changed
+    since the last run are introspected (all of them with full=True), over a
+    pool of `workers` connections. Returns the refreshed, unchanged, removed
+    and failed table names.
+    """
+    pool = get_pool(workers)
+    previous = load_stats(stats_path)
+    try:
+        with pool.connection() as connection:
+            fingerprints = get_table_fingerprints(connection, schema)
+
+        stale = [table for table, fingerprint in fingerprints.items()
+                 if full or previous.get(table, {}).get("fingerprint") != fingerprint]
+        stats = {table: previous[table] for table in fingerprints if table in previous and table not in stale}
+        failed = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(introspect_table, pool, schema, table, fingerprints[table]): table for table in stale}
+            for future in as_completed(futures):
+                table = futures[future]
+                try:
+                    stats[table] = future.result()
+                except Exception as e:
+                    print(f"Failed to introspect {table}: {e}")
+                    failed.append(table)
+                    if table in previous:
+                        stats[table] = previous[table]
+    finally:
+        pool.closeall()
+
+    save_stats(stats, stats_path)
+    summary = {
+        "refreshed": sorted(set(stale) - set(failed)),
+        "unchanged": sorted(set(fingerprints) - set(stale)),
+        "removed": sorted(set(previous) - set(fingerprints)),
+        "failed": sorted(failed),
+    }
+    print(f"Table stats: {len(summary['refreshed'])} refreshed, {len(summary['unchanged'])} unchanged, "
+          f"{len(summary['removed'])} removed, {len(summary['failed'])} failed")
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build metadata.json (if missing) and refresh table_stats.json, "
+                                                 "or audit the spatial indexes")
+    parser.add_argument("--full", action="store_true", help="re-introspect every table")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--schema", default="public")
+    parser.add_argument("--audit", action="store_true",
+                        help="report missing GiST indexes, degree SRIDs used with metre distances and oversized polygons")
+    parser.add_argument("--apply", action="store_true",
+                        help="with --audit: create the missing indexes (CONCURRENTLY) and subdivided tables")
+    args = parser.parse_args()
+    if args.audit:
+        from builder import spatial_audit
+        spatial_audit.run(schema=args.schema, apply_fixes=args.apply)
+    else:
+        build()
+        build_stats(full=args.full, workers=args.workers, schema=args.schema)
@@ -0,0 +1,238 @@
+import re
+
+import psycopg2
+import psycopg2.errors
+import psycopg2.sql
+
+from builder import metadata_builder
+
+# Polygons with more vertices than this make every ST_Intersects against them slow
+OVERSIZED_VERTICES = 10000
+SUBDIVIDE_MAX_VERTICES = 256
+SCAN_TIMEOUT_MS = 60000
+
+GEOMETRY_COLUMNS_SQL = """
+    SELECT g.f_table_name, g.f_geometry_column, g.type, g.srid,
+           coalesce(r.proj4text LIKE '%%+proj=longlat%%', g.srid = 4326) AS geographic,
+           coalesce(bool_or(ix.indisvalid), false) AS has_index,
+           coalesce(array_agg(ix.relname ORDER BY ix.relname) FILTER (WHERE NOT ix.indisvalid), '{}') AS invalid_indexes
+    FROM geometry_columns AS g
+    LEFT JOIN spatial_ref_sys AS r ON r.srid = g.srid
+    -- GiST / SP-GiST indexes on the column; a failed CREATE INDEX CONCURRENTLY leaves one marked invalid
+    LEFT JOIN LATERAL (
+        SELECT ic.relname, i.indisvalid
+        FROM pg_index AS i
+        JOIN pg_class AS ic ON ic.oid = i.indexrelid
+        JOIN pg_am AS am ON am.oid = ic.relam
+        JOIN pg_attribute AS a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+        WHERE i.indrelid = (quote_ident(g.f_table_schema) || '.' || quote_ident(g.f_table_name))::regclass
+          AND am.amname IN ('gist', 'spgist')
+          AND a.attname = g.f_geometry_column
+    ) AS ix ON true
+    WHERE g.f_table_schema = %s
+    GROUP BY g.f_table_schema, g.f_table_name, g.f_geometry_column, g.type, g.srid, r.proj4text
+    ORDER BY g.f_table_name
+"""
+
+_alias_pattern = re.compile(r"\b([a-z_][a-z0-9_]*)\s+AS\s+([a-z_][a-z0-9_]*)", re.IGNORECASE)
+_dwithin_pattern = re.compile(
+    r"ST_DWithin\s*\(\s*([a-z_][a-z0-9_]*)\.geom\s*,\s*([a-z_][a-z0-9_]*)\.geom\s*,\s*([0-9.]+)\s*\)",
+    re.IGNORECASE
+)
+
+
+def metre_distance_tables(examples):
+    """
+    Tables that the prompt examples compare with ST_DWithin(a.geom, b.geom, N)
+    on the raw geometry, i.e. where N is only metres in a projected CRS.
+    Returns {table: [distances]}.
+    """
+    tables = {}
+    for example in examples:
+        aliases = {alias.lower(): table.lower() for table, alias in _alias_pattern.findall(example)}
+        for left, right, distance in _dwithin_pattern.findall(example):
+            for alias in (left, right):
+                table = aliases.get(alias.lower(), alias.lower())
+                tables.setdefault(table, [])
+                if float(distance) not in tables[table]:
+                    tables[table].append(float(distance))
+    return tables
+
+
+def vertex_stats(connection, schema, table, column):
+    """
+    (features over OVERSIZED_VERTICES, largest vertex count), or None when
+    the scan does not finish within SCAN_TIMEOUT_MS.
+    """
+    query = psycopg2.sql.SQL(
+        "SELECT count(*) FILTER (WHERE ST_NPoints({column}) > %s), coalesce(max(ST_NPoints({column})), 0) FROM {table}"
+    ).format(column=psycopg2.sql.Identifier(column), table=psycopg2.sql.Identifier(schema, table))
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL statement_timeout = %s", (SCAN_TIMEOUT_MS,))
+            cursor.execute(query, (OVERSIZED_VERTICES,))
+            row = cursor.fetchone()
+        connection.commit()
+        return row
+    except psycopg2.errors.QueryCanceled:
+        connection.rollback()
+        return None
+
+
+def table_exists(connection, schema, table):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(quote_ident(%s) || '.' || quote_ident(%s)) IS NOT NULL", (schema, table))
+        exists = cursor.fetchone()[0]
+    connection.commit()
+    return exists
+
+
+def audit(connection, schema="public", examples=None):
+    """
+    Returns one finding dict per geometry column:
+        missing_index     no valid GiST / SP-GiST index on the column
+        invalid_indexes   GiST / SP-GiST indexes left invalid (e.g. by a failed CREATE INDEX CONCURRENTLY)
+        metre_distances   prompt examples use ST_DWithin(..., N) metres on a geographic SRID
+        oversized         polygons above OVERSIZED_VERTICES vertices, without a <table>_subdivided companion
+    """
+    if examples is None:
+        from helper.prompt_helper import SQL_EXAMPLES
+        examples = SQL_EXAMPLES
+    distances = metre_distance_tables(examples)
+
+    with connection.cursor() as cursor:
+        cursor.execute(GEOMETRY_COLUMNS_SQL, (schema,))
+        columns = cursor.fetchall()
+    connection.commit()
+
+    findings = []
+    for table, column, geometry_type, srid, geographic, has_index, invalid_indexes in columns:
+        if table in metadata_builder.EXCLUDED_TABLES:
+            continue
+        finding = {
+            "table": table, "column": column, "type": geometry_type, "srid": srid,
+            "missing_index": not has_index,
+            "invalid_indexes": list(invalid_indexes),
+            "metre_distances": distances.get(table, []) if geographic else [],
+            "oversized": None,
+        }
+        if "POLYGON" in geometry_type.upper():
+            stats = vertex_stats(connection, schema, table, column)
+            if stats is None:
+                finding["oversized"] = {"error": "scan timed out"}
+            elif stats[0]:
+                finding["oversized"] = {
+                    "features": stats[0],
+                    "max_vertices": stats[1],
+                    "subdivided_table": f"{table}_subdivided",
+                    "subdivided_exists": table_exists(connection, schema, f"{table}_subdivided"),
+                }
+        findings.append(finding)
+    return findings
+
+
+def _index_name(table, column):
+    return f"{table}_{column}_gist_idx"[:63]
+
+
+def apply(connection, schema, findings):
+    """
+    Drops invalid indexes and creates the missing GiST indexes and the
+    missing <table>_subdivided companions (ST_Subdivide pieces keyed by gid,
+    with their own GiST index). Indexes are built and dropped CONCURRENTLY,
+    so the tables stay writable.
+
+    Each fix runs on its own: a failing statement is reported and skips only
+    the statements of the same fix that depend on it (a companion's indexes
+    after its CREATE TABLE). Returns (statements run, (statement, error) failures).
+    """
+    fixes = []
+    for finding in findings:
+        table, column = finding["table"], finding["column"]
+        for index in finding.get("invalid_indexes", []):
+            fixes.append([psycopg2.sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {index}").format(
+                index=psycopg2.sql.Identifier(schema, index))])
+        if finding["missing_index"]:
+            fixes.append([psycopg2.sql.SQL(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS {index} ON {table} USING gist ({column})"
+            ).format(index=psycopg2.sql.Identifier(_index_name(table, column)),
+                     table=psycopg2.sql.Identifier(schema, table), column=psycopg2.sql.Identifier(column))])
+        oversized = finding["oversized"]
+        if oversized and not oversized.get("error") and not oversized["subdivided_exists"]:
+            companion = oversized["subdivided_table"]
+            statements = []
+            statements.append(psycopg2.sql.SQL(
+                "CREATE TABLE IF NOT EXISTS {companion} AS "
+                "SELECT gid, ST_Subdivide({column}, {max_vertices}) AS geom FROM {table}"
+            ).format(companion=psycopg2.sql.Identifier(schema, companion), column=psycopg2.sql.Identifier(column),
+                     max_vertices=psycopg2.sql.Literal(SUBDIVIDE_MAX_VERTICES),
+                     table=psycopg2.sql.Identifier(schema, table)))
+            statements.append(psycopg2.sql.SQL(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS {index} ON {companion} USING gist (geom)"
+            ).format(index=psycopg2.sql.Identifier(_index_name(companion, "geom")),
+                     companion=psycopg2.sql.Identifier(schema, companion)))
+            statements.append(psycopg2.sql.SQL(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS {index} ON {companion} (gid)"
+            ).format(index=psycopg2.sql.Identifier(f"{companion}_gid_idx"[:63]),
+                     companion=psycopg2.sql.Identifier(schema, companion)))
+            statements.append(psycopg2.sql.SQL("ANALYZE {companion}").format(
+                companion=psycopg2.sql.Identifier(schema, companion)))
+            fixes.append(statements)
+
+    executed = []
+    failed = []
+    # CREATE / DROP INDEX CONCURRENTLY cannot run inside a transaction block
+    connection.autocommit = True
+    try:
+        with connection.cursor() as cursor:
+            for statements in fixes:
+                for statement in statements:
+                    text = statement.as_string(connection)
+                    print(f"Running: {text}")
+                    try:
+                        cursor.execute(statement)
+                    except psycopg2.Error as e:
+                        error = (e.pgerror or str(e)).strip()
+                        print(f"Failed: {error}")
+                        failed.append((text, error))
+                        break
+                    executed.append(text)
+    finally:
+        connection.autocommit = False
+    return executed, failed
+
+
+def print_report(findings):
+    for finding in findings:
+        problems = []
+        if finding["missing_index"]:
+            problems.append(f"no GiST index on {finding['column']}")
+        if finding["invalid_indexes"]:
+            problems.append(f"invalid index {', '.join(finding['invalid_indexes'])} (--apply drops it and creates a new one if no valid index is left)")
+        if finding["metre_distances"]:
+            distances = ", ".join(f"{distance:g}" for distance in finding["metre_distances"])
+            problems.append(f"SRID {finding['srid']} is in degrees but prompt examples use ST_DWithin distances "
+                            f"of {distances} as metres (cast to geography or store in a projected CRS)")
+        oversized = finding["oversized"]
+        if oversized and oversized.get("error"):
+            problems.append(f"vertex scan skipped: {oversized['error']}")
+        elif oversized:
+            state = "exists" if oversized["subdivided_exists"] else "missing"
+            problems.append(f"{oversized['features']} polygons over {OVERSIZED_VERTICES} vertices "
+                            f"(max {oversized['max_vertices']}); {oversized['subdivided_table']} {state}")
+        status = "; ".join(problems) if problems else "ok"
+        print(f"{finding['table']}.{finding['column']} ({finding['type']}, SRID {finding['srid']}): {status}")
+
+
+def run(schema="public", apply_fixes=False):
+    pool = metadata_builder.get_pool(1)
+    try:
+        with pool.connection() as connection:
+            findings = audit(connection, schema)
+            print_report(findings)
+            if apply_fixes:
+                executed, failed = apply(connection, schema, findings)
+                print(f"Applied {len(executed)} statements, {len(failed)} failed")
+    finally:
+        pool.closeall()
+    return findings
@@ -0,0 +1,178 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from configparser import ConfigParser
+from typing import Optional
+
+from helper import metadata_registry, logger
+
+CONF_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "conf", "server.conf")
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "cache", "answers.sqlite3")
+
+# Words that do not change what a portal question asks for
+_FILLER_WORDS = {"a", "an", "the", "me", "us", "please", "kindly", "can", "could", "would", "you"}
+_token_pattern = re.compile(r"[a-z0-9]+")
+
+# Part of every key; bumped whenever the cached /chat body changes shape, so
+# entries persisted by an older version are never served
+BODY_FORMAT = 2
+
+
+def normalize_query(query: str) -> str:
+    """
+    Lower-cases, drops punctuation and filler words so that "Show me the roads?"
+    and "show roads" share a cache entry. Expects an already spell-corrected query.
+    """
+    return " ".join(t for t in _token_pattern.findall(query.lower()) if t not in _FILLER_WORDS)
+
+
+def make_key(query: str, context: str, model: str, options: dict) -> str:
+    material = json.dumps({
+        "query": normalize_query(query),
+        "context": hashlib.sha256(context.encode("utf-8")).hexdigest(),
+        "model": model,
+        "options": options,
+        "format": BODY_FORMAT,
+    }, sort_keys=True)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """
+    LRU + TTL cache of /chat answers, optionally backed by sqlite so entries
+    survive restarts and are shared by every worker on the host. Entries are
+    tagged with the metadata digest; a metadata.json change drops them all.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600.0, db_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+        self._memory = OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._digest = None
+        self.hits = 0
+        self.misses = 0
+
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            with self._db() as db:
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS answers ("
+                    " key TEXT PRIMARY KEY, digest TEXT, value TEXT, stored_at REAL, accessed_at REAL)"
+                )
+                db.execute("CREATE INDEX IF NOT EXISTS answers_accessed ON answers (accessed_at)")
+
+    def _db(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=5)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def _check_digest(self) -> str:
+        digest = metadata_registry.get_snapshot().digest
+        if digest != self._digest:
+            with self._lock:
+                if digest != self._digest:
+                    self._memory.clear()
+                    if self.db_path:
+                        with self._db() as db:
+                            db.execute("DELETE FROM answers WHERE digest != ?", (digest,))
+                    if self._digest is not None:
+                        logger.log("INFO", "metadata.json changed; answer cache invalidated")
+                    self._digest = digest
+        return digest
+
+    def get(self, key: str) -> Optional[dict]:
+        digest = self._check_digest()
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if now - entry[0] <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._memory[key]
+
+        if self.db_path:
+            with self._db() as db:
+                row = db.execute(
+                    "SELECT value, stored_at FROM answers WHERE key = ? AND digest = ?", (key, digest)
+                ).fetchone()
+                if row is not None and now - row[1] <= self.ttl:
+                    db.execute("UPDATE answers SET accessed_at = ? WHERE key = ?", (now, key))
+                    value = json.loads(row[0])
+                    self._remember(key, row[1], value)
+                    with self._lock:
+                        self.hits += 1
+                    return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _remember(self, key: str, stored_at: float, value: dict):
+        with self._lock:
+            self._memory[key] = (stored_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def put(self, key: str, value: dict):
+        digest = self._check_digest()
+        now = time.time()
+        self._remember(key, now, value)
+        if self.db_path:
+            with self._db() as db:
+                db.execute(
+                    "INSERT OR REPLACE INTO answers (key, digest, value, stored_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, digest, json.dumps(value), now, now)
+                )
+                db.execute("DELETE FROM answers WHERE stored_at < ?", (now - self.ttl,))
+                db.execute(
+                    "DELETE FROM answers WHERE key IN ("
+                    " SELECT key FROM answers ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._memory),
+                "hits": self.hits,
+                "misses": self.misses,
+                "backend": "sqlite" if self.db_path else "memory",
+            }
+
+
+def load_cache() -> Optional[AnswerCache]:
+    """
+    Builds the answer cache from the [cache] section of conf/server.conf:
+        enabled = true | false       (default true)
+        max_entries = 1024
+        ttl_seconds = 3600
+        backend = memory | sqlite    (default memory)
+        path = <sqlite file>         (default cache/answers.sqlite3)
+    """
+    config = ConfigParser()
+    config.read(CONF_PATH)
+    if not config.getboolean("cache", "enabled", fallback=True):
+        return None
+    backend = config.get("cache", "backend", fallback="memory")
+    return AnswerCache(
+        max_entries=config.getint("cache", "max_entries", fallback=1024),
+        ttl=config.getfloat("cache", "ttl_seconds", fallback=3600.0),
+        db_path=config.get("cache", "path", fallback=DEFAULT_DB_PATH) if backend == "sqlite" else None,
+    )
+
+
+answer_cache = load_cache()
@@ -0,0 +1,181 @@
+import re
+import threading
+
+import psycopg2
+import psycopg2.extras
+from helper import database_helper, logger, result_cache
+
+_id_pattern = re.compile(r"^[0-9a-f]{24}$")
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS aoi_registry (
+        id text PRIMARY KEY,
+        geom geometry(MultiPolygon, 4326) NOT NULL,
+        bbox geometry(Polygon, 4326) NOT NULL,
+        simplified geometry(MultiPolygon, 4326) NOT NULL,
+        vertices integer NOT NULL,
+        parts integer NOT NULL,
+        area_km2 double precision NOT NULL,
+        created_at timestamptz NOT NULL DEFAULT now(),
+        last_registered_at timestamptz NOT NULL DEFAULT now()
+    );
+    CREATE TABLE IF NOT EXISTS aoi_registry_parts (
+        aoi_id text NOT NULL REFERENCES aoi_registry (id) ON DELETE CASCADE,
+        part_no integer NOT NULL,
+        geom geometry(Geometry, 4326) NOT NULL,
+        PRIMARY KEY (aoi_id, part_no)
+    );
+    CREATE INDEX IF NOT EXISTS aoi_registry_parts_geom_idx ON aoi_registry_parts USING gist (geom);
+"""
+
+# ST_MakeValid may return a collection with stray lines/points; only the areal part is an AOI
+REGISTER_SQL = """
+    WITH src AS (
+        SELECT ST_Multi(ST_CollectionExtract(ST_MakeValid(ST_GeomFromText(%(wkt)s, 4326)), 3)) AS geom
+    )
+    INSERT INTO aoi_registry (id, geom, bbox, simplified, vertices, parts, area_km2)
+    SELECT %(id)s, geom, ST_Envelope(geom),
+           ST_Multi(ST_SimplifyPreserveTopology(geom, %(tolerance)s)),
+           ST_NPoints(geom), 0, ST_Area(geom::geography) / 1e6
+    FROM src
+    WHERE NOT ST_IsEmpty(geom)
+    ON CONFLICT (id) DO UPDATE SET last_registered_at = now()
+    RETURNING (xmax = 0) AS inserted
+"""
+
+SUBDIVIDE_SQL = """
+    WITH pieces AS (
+        SELECT ST_Subdivide(geom, %(max_vertices)s) AS geom FROM aoi_registry WHERE id = %(id)s
+    ), parts AS (
+        INSERT INTO aoi_registry_parts (aoi_id, part_no, geom)
+        SELECT %(id)s, row_number() OVER (), geom
+        FROM pieces
+        RETURNING 1
+    )
+    UPDATE aoi_registry SET parts = (SELECT count(*) FROM parts) WHERE id = %(id)s
+"""
+
+DESCRIBE_SQL = """
+    SELECT id, vertices, parts, area_km2, created_at, last_registered_at,
+           ST_AsGeoJSON(bbox)::json AS bbox, ST_AsGeoJSON(simplified, 6)::json AS simplified
+    FROM aoi_registry
+    WHERE id = %s
+"""
+
+# Plain column references only: "alias.geom" or "geom"
+_intersects_pattern = re.compile(
+    r"ST_Intersects\s*\(\s*([A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)?)\s*,\s*aoi\.geom\s*\)"
+    r"|ST_Intersects\s*\(\s*aoi\.geom\s*,\s*([A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)?)\s*\)",
+    re.IGNORECASE
+)
+
+
+class RegisteredAOI:
+    """
+    Reference to an AOI stored with register_aoi(); pass it wherever a WKT AOI is accepted.
+    """
+
+    def __init__(self, aoi_id: str):
+        if not is_valid_id(aoi_id):
+            raise ValueError(f"Invalid AOI id: {aoi_id}")
+        self.id = aoi_id
+
+
+def is_valid_id(aoi_id) -> bool:
+    return isinstance(aoi_id, str) and bool(_id_pattern.match(aoi_id))
+
+
+def get_settings():
+    """
+    Optional database.conf keys:
+        AOI_SIMPLIFY_TOLERANCE        tolerance of the stored simplified AOI, in degrees (default 0.0001)
+        AOI_SUBDIVIDE_MAX_VERTICES    max vertices per indexed AOI piece (default 256)
+    """
+    config = database_helper.get_config()
+    return (
+        float(config.get('AOI_SIMPLIFY_TOLERANCE', 0.0001)),
+        int(config.get('AOI_SUBDIVIDE_MAX_VERTICES', 256))
+    )
+
+
+def ensure_schema(connection):
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if not _schema_ready:
+            with connection.cursor() as cursor:
+                cursor.execute(SCHEMA_SQL)
+            connection.commit()
+            _schema_ready = True
+
+
+def register_aoi(wkt: str) -> dict:
+    """
+    Validates the AOI (made valid with ST_MakeValid, reduced to its polygons)
+    and stores it once with its bbox, a simplified copy and ST_Subdivide pieces.
+    The id is derived from the canonical geometry, so registering the same AOI
+    again returns the existing entry. Raises ValueError for unusable input.
+    """
+    aoi_id = result_cache.aoi_fingerprint(wkt)[:24]
+    tolerance, max_vertices = get_settings()
+    with database_helper.get_pool().connection() as connection:
+        ensure_schema(connection)
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(REGISTER_SQL, {"wkt": wkt, "id": aoi_id, "tolerance": tolerance})
+                row = cursor.fetchone()
+                if row is None:
+                    raise ValueError("AOI has no polygonal area")
+                if row[0]:
+                    cursor.execute(SUBDIVIDE_SQL, {"id": aoi_id, "max_vertices": max_vertices})
+            connection.commit()
+        except (psycopg2.DataError, psycopg2.InternalError) as e:
+            # Unparseable WKT, mixed SRIDs, ... (PostGIS reports parse errors as internal errors)
+            raise ValueError(f"Invalid AOI geometry: {e.pgerror or e}") from e
+        if row[0]:
+            logger.log("INFO", f"Registered AOI {aoi_id}")
+    return describe_aoi(aoi_id)
+
+
+def describe_aoi(aoi_id: str):
+    """
+    Returns the stored AOI's bbox, simplified geometry and sizes, or None.
+    """
+    if not is_valid_id(aoi_id):
+        return None
+    with database_helper.get_pool().connection() as connection:
+        ensure_schema(connection)
+        with connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+            cursor.execute(DESCRIBE_SQL, (aoi_id,))
+            row = cursor.fetchone()
+    if row is None:
+        return None
+    row["created_at"] = row["created_at"].isoformat()
+    row["last_registered_at"] = row["last_registered_at"].isoformat()
+    return dict(row)
+
+
+def aoi_cte(placeholder: str) -> str:
+    """
+    The aoi CTE for a registered AOI whose id is bound to `placeholder`.
+    """
+    return f"WITH aoi AS (SELECT geom FROM aoi_registry WHERE id = {placeholder})"
+
+
+def use_parts(select_sql: str, placeholder: str) -> str:
+    """
+    Rewrites ST_Intersects(<column>, aoi.geom) so the exact test runs against
+    the AOI's small subdivided pieces (through their GiST index) while the
+    bbox test against the whole AOI still drives the index on <column>.
+    Both forms are true for the same rows, and aoi stays a single row.
+    """
+    def replace(match):
+        column = match.group(1) or match.group(2)
+        return (
+            f"({column} && aoi.geom AND EXISTS (SELECT 1 FROM aoi_registry_parts AS _aoi_part "
+            f"WHERE _aoi_part.aoi_id = {placeholder} AND ST_Intersects({column}, _aoi_part.geom)))"
+        )
+    return _intersects_pattern.sub(replace, select_sql)
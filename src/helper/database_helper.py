@@ -1,11 +1,28 @@
 import re
 import psycopg2
+import psycopg2.errors
 import psycopg2.extras
 import json
 import os
-from shapely.wkb import loads
-import geojson
-from helper import logger
+import threading
+import uuid
+import shapely
+from helper import logger, geojson_encoder, mvt_encoder, result_cache, aoi_registry, query_guard, pagination, metrics
+from helper.db_pool import ConnectionPool
+from helper.query_guard import GuardLimits, QueryRejected
+from helper.result_cache import ResultCache
+from helper.statement_cache import StatementCache
+from helper.tile_store import ResultSet, ResultSetStore, result_set_id
+
+CONF_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "conf", "database.conf")
+
+_config = None
+_pool = None
+_pool_lock = threading.Lock()
+_result_cache = None
+_statement_cache = None
+_tile_cache = None
+_result_sets = None
 
 def read_config(file_path):
     config = {}
@@ -18,6 +35,157 @@ def read_config(file_path):
             config[key.strip()] = value.strip()
     return config
 
+def get_config():
+    """
+    Parses conf/database.conf once per process.
+    """
+    global _config
+    if _config is None:
+        _config = read_config(CONF_PATH)
+    return _config
+
+def get_pool() -> ConnectionPool:
+    """
+    Returns the process-wide connection pool, creating it on first use.
+
+    Optional database.conf keys:
+        POOL_MIN_SIZE, POOL_MAX_SIZE    pool bounds (default 1 / 10)
+        POOL_TIMEOUT                    seconds to wait for a free connection (default 10)
+        POOL_HEALTH_CHECK_IDLE          ping connections idle longer than this many seconds (default 30)
+        STATEMENT_TIMEOUT               per-session statement_timeout in ms
+        CONNECT_TIMEOUT                 seconds to wait for a new connection (default 5)
+        SEARCH_PATH                     comma-separated schemas
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                config = get_config()
+                search_path = [s.strip() for s in config.get('SEARCH_PATH', '').split(',') if s.strip()]
+                _pool = ConnectionPool(
+                    connect_kwargs={
+                        "host": config['SERVER'],
+                        "port": config['PORT'],
+                        "user": config['USER'],
+                        "password": config['PASSWORD'],
+                        "database": config['DATABASE'],
+                        "connect_timeout": int(config.get('CONNECT_TIMEOUT', 5))
+                    },
+                    min_size=int(config.get('POOL_MIN_SIZE', 1)),
+                    max_size=int(config.get('POOL_MAX_SIZE', 10)),
+                    timeout=float(config.get('POOL_TIMEOUT', 10)),
+                    health_check_idle=float(config.get('POOL_HEALTH_CHECK_IDLE', 30)),
+                    statement_timeout=int(config['STATEMENT_TIMEOUT']) if config.get('STATEMENT_TIMEOUT') else None,
+                    search_path=search_path or None
+                )
+                logger.log("INFO", f"Database pool ready: {_pool.stats()}")
+    return _pool
+
+def get_pool_stats():
+    """
+    Pool metrics (in use, waiting, wait time, ...) or None before first use.
+    """
+    return _pool.stats() if _pool is not None else None
+
+def get_result_cache():
+    """
+    Returns the process-wide query result cache, or None when it is disabled.
+
+    Optional database.conf keys:
+        RESULT_CACHE_MAX_BYTES          total size of cached results (default 268435456, 0 disables)
+        RESULT_CACHE_MAX_ENTRY_BYTES    larger results are not cached (default 1/8 of the total)
+        RESULT_CACHE_FINGERPRINT_TTL    seconds a table's change fingerprint is trusted (default 5)
+    """
+    global _result_cache
+    if _result_cache is None:
+        with _pool_lock:
+            if _result_cache is None:
+                config = get_config()
+                max_bytes = int(config.get('RESULT_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+                _result_cache = ResultCache(
+                    max_bytes=max_bytes,
+                    max_entry_bytes=int(config.get('RESULT_CACHE_MAX_ENTRY_BYTES', 0)) or None,
+                    fingerprint_ttl=float(config.get('RESULT_CACHE_FINGERPRINT_TTL', 5))
+                ) if max_bytes > 0 else False
+    return _result_cache or None
+
+def get_statement_cache() -> StatementCache:
+    """
+    Optional database.conf keys:
+        MAX_PREPARED_STATEMENTS    prepared query shapes kept per pooled connection (default 64)
+        PLAN_TIMING_EVERY          sample planning time on every Nth execution of a shape (default 20, 0 = first only)
+    """
+    global _statement_cache
+    if _statement_cache is None:
+        with _pool_lock:
+            if _statement_cache is None:
+                config = get_config()
+                _statement_cache = StatementCache(
+                    max_per_connection=int(config.get('MAX_PREPARED_STATEMENTS', 64)),
+                    plan_timing_every=int(config.get('PLAN_TIMING_EVERY', 20))
+                )
+    return _statement_cache
+
+def get_guard_limits() -> GuardLimits:
+    """
+    Query guard thresholds; see query_guard.GuardLimits for the database.conf keys.
+    """
+    return GuardLimits.from_config(get_config())
+
+def get_tile_cache():
+    """
+    Returns the process-wide vector tile cache, or None when it is disabled.
+    Tiles are invalidated with the tables they read, like query results.
+
+    Optional database.conf keys:
+        TILE_CACHE_MAX_BYTES     total size of cached tiles (default 33554432, 0 disables)
+        TILE_RESULT_SETS         result sets kept for tile and page requests (default 1000)
+        TILE_RESULT_SET_TTL      seconds a result set is kept after its last tile or page request (default 3600)
+    """
+    global _tile_cache
+    if _tile_cache is None:
+        with _pool_lock:
+            if _tile_cache is None:
+                config = get_config()
+                max_bytes = int(config.get('TILE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+                _tile_cache = ResultCache(
+                    max_bytes=max_bytes,
+                    fingerprint_ttl=float(config.get('RESULT_CACHE_FINGERPRINT_TTL', 5))
+                ) if max_bytes > 0 else False
+    return _tile_cache or None
+
+def get_result_sets() -> ResultSetStore:
+    global _result_sets
+    if _result_sets is None:
+        with _pool_lock:
+            if _result_sets is None:
+                config = get_config()
+                _result_sets = ResultSetStore(
+                    max_sets=int(config.get('TILE_RESULT_SETS', 1000)),
+                    ttl=float(config.get('TILE_RESULT_SET_TTL', 3600))
+                )
+    return _result_sets
+
+def get_tile_stats():
+    if _result_sets is None:
+        return None
+    return dict(_result_sets.stats(), cache=_tile_cache.stats() if _tile_cache else None)
+
+def get_page_sizes():
+    """
+    Optional database.conf keys:
+        PAGE_SIZE        features per page when the request does not ask for a size (default 1000)
+        MAX_PAGE_SIZE    largest page a request may ask for (default 10000)
+    """
+    config = get_config()
+    return int(config.get('PAGE_SIZE', 1000)), int(config.get('MAX_PAGE_SIZE', 10000))
+
+def get_statement_stats():
+    return _statement_cache.stats() if _statement_cache is not None else None
+
+def get_result_cache_stats():
+    return _result_cache.stats() if _result_cache else None
+
 def extract_sql_query(text: str) -> str:
     # Define a basic pattern to identify spatial SQL queries for PostGIS
     sql_keywords = ["SELECT", "ST_", "INSERT", "UPDATE", "DELETE", "CREATE", "DROP", "ALTER"]
@@ -35,45 +203,324 @@ def extract_sql_query(text: str) -> str:
 
 
 
-def run_query(response_from_llm: str, aoi: str):
-    aoi_prefix = f"WITH aoi AS (SELECT ST_GeomFromText('{aoi}', 4326) AS geom)"
+def get_encoding_options(include_properties: bool = None):
+    """
+    Geometry encoding from database.conf:
+        GEOMETRY_ENCODING     postgis (ST_AsGeoJSON, default) or shapely (batched WKB decode)
+        INCLUDE_PROPERTIES    true to carry non-geometry columns into properties
+    """
+    config = get_config()
+    encoding = config.get('GEOMETRY_ENCODING', 'postgis').lower()
+    if encoding not in geojson_encoder.ENCODINGS:
+        raise ValueError(f"Unknown GEOMETRY_ENCODING: {encoding}")
+    if include_properties is None:
+        include_properties = config.get('INCLUDE_PROPERTIES', 'false').lower() == 'true'
+    return encoding, include_properties
+
+def aoi_parameter(aoi):
+    """
+    Returns (SQL type, value) binding the AOI: a registered AOI's id, or a WKT
+    AOI converted to hex EWKB, which Postgres reads without parsing WKT.
+    """
+    if isinstance(aoi, aoi_registry.RegisteredAOI):
+        return "text", aoi.id
+    try:
+        geometry = shapely.from_wkt(aoi)
+    except shapely.errors.GEOSException as e:
+        raise ValueError(f"Invalid AOI WKT: {e}") from e
+    return "geometry", shapely.to_wkb(shapely.set_srid(geometry, 4326), hex=True, include_srid=True)
+
+@metrics.timed("sql_extract")
+def build_sql(response_from_llm: str, aoi, encoding: str = None, include_properties: bool = False,
+              placeholder: str = "%(aoi)s", limit: int = None, zoom: int = None,
+              page_size: int = None, after: bool = False):
+    """
+    Prefixes the LLM's SQL with the AOI CTE, wrapped for the given geometry
+    encoding. `aoi` is WKT or an aoi_registry.RegisteredAOI, whose stored
+    geometry and subdivided pieces are used instead. The AOI itself is never
+    spliced in: the CTE refers to `placeholder` ("%(aoi)s" for cursor.execute
+    with {"aoi": value}, "$1" for PREPARE), bound to aoi_parameter(aoi).
+    `limit` caps the LLM's rows (see query_guard.check_plan); `zoom`
+    simplifies GeoJSON geometries for that map zoom (see geojson_encoder.wrap_query).
+    `page_size` selects one keyset page, after %(after)s when `after` is set
+    (see pagination.page_query).
+    Returns None if no SQL was found; raises QueryRejected unless the SQL is a single SELECT.
+    """
     sql_query_from_llm = extract_sql_query(response_from_llm)
     if sql_query_from_llm == "FALSE":
-        return False, "Sorry couldn't understand your request"
+        return None
+    query_guard.check_select(sql_query_from_llm)
 
-    sql_query = f"{aoi_prefix} {sql_query_from_llm}"
-    conf_path = os.path.join(os.path.dirname(__file__), "..", "..", "conf", "database.conf")
-    config = read_config(conf_path)
+    # Trailing semicolons break DECLARE ... CURSOR FOR <query> and subquery wrapping
+    sql_query_from_llm = sql_query_from_llm.strip().rstrip(";").strip()
+    if placeholder.startswith("%"):
+        # LIKE '%...' in the LLM's SQL must survive psycopg2's parameter formatting
+        sql_query_from_llm = sql_query_from_llm.replace("%", "%%")
+    if isinstance(aoi, aoi_registry.RegisteredAOI):
+        aoi_prefix = aoi_registry.aoi_cte(placeholder)
+        sql_query_from_llm = aoi_registry.use_parts(sql_query_from_llm, placeholder)
+    else:
+        aoi_prefix = f"WITH aoi AS (SELECT {placeholder}::geometry AS geom)"
+    if limit:
+        sql_query_from_llm = query_guard.limit_query(sql_query_from_llm, limit)
+    if page_size:
+        sql_query_from_llm = pagination.page_query(sql_query_from_llm, page_size, after)
+    if encoding == "mvt":
+        sql_query_from_llm = mvt_encoder.wrap_query(sql_query_from_llm, include_properties)
+    elif encoding is not None:
+        sql_query_from_llm = geojson_encoder.wrap_query(sql_query_from_llm, encoding, include_properties, zoom,
+                                                        key_column=pagination.KEY_COLUMN if page_size else None)
+    return f"{aoi_prefix} {sql_query_from_llm}"
 
-    connection = None
+def run_query(response_from_llm: str, aoi, include_properties: bool = None, zoom: int = None):
+    """
+    Runs the LLM's SQL over the AOI in a read-only transaction, after the
+    query guard has checked the statement and its EXPLAIN estimate.
+    Returns (True, serialized FeatureCollection bytes, plan estimate) or
+    (False, error message, plan estimate or None); the estimate of a refused
+    query carries "rejected": True. With `zoom`, geometries are simplified
+    and coordinates rounded for that web map zoom level.
+    """
+    plan = None
     try:
-        connection = psycopg2.connect(
-            host=config['SERVER'],
-            port=config['PORT'],
-            user=config['USER'],
-            password=config['PASSWORD'],
-            database=config['DATABASE']
-        )
-        cursor = connection.cursor(cursor_factory=psycopg2.extras.DictCursor)  # Use DictCursor
-
-        cursor.execute(sql_query)
-        features = []
-        for row in cursor.fetchall():
-            geom_wkb = row['geom']  # Now it's safe to use column names
-            geometry = loads((geom_wkb))  # Convert WKB to a Shapely geometry
-            feature = geojson.Feature(
-                geometry=geojson.loads(geojson.dumps(geometry.__geo_interface__)),  
-                properties={}  # Add additional properties if needed
-            )
-            features.append(feature)
-
-        feature_collection = geojson.FeatureCollection(features)
-        return True, feature_collection
+        encoding, include_properties = get_encoding_options(include_properties)
+        sql_query = build_sql(response_from_llm, aoi, encoding, include_properties, placeholder="$1", zoom=zoom)
+        if sql_query is None:
+            return False, "Sorry couldn't understand your request", None
+        parameter_type, parameter = aoi_parameter(aoi)
+        limits = get_guard_limits()
+
+        cache = get_result_cache()
+        with get_pool().connection() as connection:
+            cursor = connection.cursor(cursor_factory=psycopg2.extras.DictCursor)  # Use DictCursor
+            query_guard.begin(cursor, limits)
+
+            if cache is not None:
+                with metrics.span("result_cache"):
+                    # Keyed on the LLM's SQL and the AOI geometry, not on the AOI's WKT spelling
+                    key = result_cache.make_key(extract_sql_query(response_from_llm), aoi, encoding, include_properties, zoom)
+                    cached = cache.get(connection, key)
+                    if cached is not None:
+                        body, plan = cached
+                        return True, body, plan
+                    # Taken before the query runs, so a concurrent write can only make the entry stale early
+                    tables = result_cache.referenced_tables(sql_query)
+                    fingerprints = cache.table_fingerprints(connection, tables)
+
+            # Repeated query shapes reuse a prepared statement (and its plan) on this connection
+            statements = get_statement_cache()
+            limit = None
+            with metrics.span("db_plan"):
+                name = statements.prepare(connection, cursor, sql_query, parameter_type)
+                if limits.checks_plan:
+                    plan = statements.explain(cursor, name, parameter)
+                    limit = query_guard.check_plan(plan, limits)
+                elif statements.sample_due(name):
+                    plan = statements.explain(cursor, name, parameter)
+            if limit:
+                # Rebuilt between the db_plan spans; build_sql is timed as sql_extract
+                sql_query = build_sql(response_from_llm, aoi, encoding, include_properties,
+                                      placeholder="$1", limit=limit, zoom=zoom)
+                with metrics.span("db_plan"):
+                    name = statements.prepare(connection, cursor, sql_query, parameter_type)
+                    plan = statements.explain(cursor, name, parameter)
+                    plan["limited_to"] = limit
+                    query_guard.check_plan(plan, limits, limited=True)
+
+            with metrics.span("db_execute"):
+                statements.execute(connection, cursor, name, parameter, plan)
+                rows = cursor.fetchall()
+            with metrics.span("encode"):
+                features = geojson_encoder.encode_rows(rows, encoding, include_properties, zoom)
+            cursor.close()
 
+        with metrics.span("serialize"):
+            body = geojson_encoder.feature_collection(features)
+        if cache is not None:
+            cache.put(key, body, tables, fingerprints, plan)
+        return True, body, plan
+
+    except QueryRejected as e:
+        logger.log("WARNING", str(e))
+        return False, str(e), dict(e.plan or {}, rejected=True)
     except Exception as e:
         logger.log("ERROR", str(e))
-        return False, str(e)
+        return False, str(e), plan
+
+def stream_features(response_from_llm: str, aoi, include_properties: bool = None, itersize: int = None,
+                    plan: dict = None, zoom: int = None):
+    """
+    Yields one serialized GeoJSON feature (bytes) per result row.
+
+    The query guard applies as in run_query(); its plan estimate is written
+    into `plan` when a dict is passed.
+
+    Rows are pulled through a named server-side cursor `itersize` at a time
+    and encoded a batch at a time, so memory stays bounded regardless of
+    result size. The query runs on the first next(); closing the generator
+    early closes the cursor and returns the connection to the pool.
+    """
+    encoding, include_properties = get_encoding_options(include_properties)
+    if itersize is None:
+        itersize = int(get_config().get('STREAM_ITERSIZE', 2000))
+    sql_query = build_sql(response_from_llm, aoi, encoding, include_properties, zoom=zoom)
+    if sql_query is None:
+        raise ValueError("Sorry couldn't understand your request")
+    _, parameter = aoi_parameter(aoi)
+    limits = get_guard_limits()
+
+    # DECLARE ... CURSOR cannot run EXECUTE, so streamed queries bind the AOI without preparing
+    with get_pool().connection() as connection:
+        with connection.cursor() as guard_cursor:
+            query_guard.begin(guard_cursor, limits)
+            if limits.checks_plan:
+                with metrics.span("db_plan"):
+                    estimate = query_guard.explain(guard_cursor, sql_query, {"aoi": parameter})
+                    limit = query_guard.check_plan(estimate, limits)
+                if limit:
+                    # Rebuilt between the db_plan spans; build_sql is timed as sql_extract
+                    sql_query = build_sql(response_from_llm, aoi, encoding, include_properties, limit=limit, zoom=zoom)
+                    with metrics.span("db_plan"):
+                        estimate = query_guard.explain(guard_cursor, sql_query, {"aoi": parameter})
+                        estimate["limited_to"] = limit
+                        query_guard.check_plan(estimate, limits, limited=True)
+                if plan is not None:
+                    plan.update(estimate)
+        cursor = connection.cursor(name=f"geojson_stream_{uuid.uuid4().hex}", cursor_factory=psycopg2.extras.DictCursor)
+        cursor.itersize = itersize
+        try:
+            with metrics.span("db_execute"):
+                cursor.execute(sql_query, {"aoi": parameter})
+            while True:
+                with metrics.span("db_execute"):
+                    rows = cursor.fetchmany(itersize)
+                if not rows:
+                    break
+                with metrics.span("encode"):
+                    features = geojson_encoder.encode_rows(rows, encoding, include_properties, zoom)
+                yield from features
+        finally:
+            try:
+                cursor.close()
+            except psycopg2.Error:
+                pass  # the connection is rolled back when it goes back to the pool
+
+def create_result_set(response_from_llm: str, aoi, include_properties: bool = None) -> ResultSet:
+    """
+    Registers the LLM's SQL over the AOI for tile requests (see get_tile).
+    The tile query is checked once here: the query guard's SELECT check, and
+    an EXPLAIN of the whole-world tile against QUERY_MAX_COST. Raises
+    QueryRejected or ValueError when it cannot be served.
+    """
+    _, include_properties = get_encoding_options(include_properties)
+    sql_query = build_sql(response_from_llm, aoi, "mvt", include_properties)
+    if sql_query is None:
+        raise ValueError("Sorry couldn't understand your request")
+    _, parameter = aoi_parameter(aoi)
+    limits = get_guard_limits()
+
+    with get_pool().connection() as connection:
+        with connection.cursor() as cursor:
+            query_guard.begin(cursor, limits)
+            plan = query_guard.explain(cursor, sql_query, {"aoi": parameter, "z": 0, "x": 0, "y": 0})
+    # A tile is bounded by its envelope, so only the cost is checked
+    query_guard.check_plan(plan, limits, limited=True)
+
+    result_set = ResultSet(
+        result_set_id(extract_sql_query(response_from_llm), aoi, "mvt", include_properties),
+        response_from_llm, aoi, include_properties, plan
+    )
+    get_result_sets().put(result_set)
+    return result_set
+
+def get_tile(result_set: ResultSet, z: int, x: int, y: int) -> bytes:
+    """
+    Renders one z/x/y Mapbox Vector Tile of a result set (empty bytes when no
+    feature touches the tile).
+    """
+    sql_query = build_sql(result_set.sql, result_set.aoi, "mvt", result_set.include_properties)
+    _, parameter = aoi_parameter(result_set.aoi)
+    cache = get_tile_cache()
+    with get_pool().connection() as connection:
+        with connection.cursor() as cursor:
+            query_guard.begin(cursor, get_guard_limits())
+            if cache is not None:
+                key = result_cache.make_key(extract_sql_query(result_set.sql), result_set.aoi, "mvt",
+                                            result_set.include_properties, z, x, y)
+                cached = cache.get(connection, key)
+                if cached is not None:
+                    return cached[0]
+                tables = result_cache.referenced_tables(sql_query)
+                fingerprints = cache.table_fingerprints(connection, tables)
+
+            # ST_AsMVT encodes in the database, so the whole tile is one stage
+            with metrics.span("db_execute"):
+                cursor.execute(sql_query, {"aoi": parameter, "z": z, "x": x, "y": y})
+                row = cursor.fetchone()
+    tile = bytes(row[0]) if row and row[0] is not None else b""
+    if cache is not None:
+        cache.put(key, tile, tables, fingerprints)
+    return tile
+
+def create_page_set(response_from_llm: str, aoi, include_properties: bool = None, zoom: int = None) -> ResultSet:
+    """
+    Registers the LLM's SQL over the AOI for keyset pagination (see get_page).
+    The whole query is planned once: its estimated rows stand in for a
+    COUNT(*) and its cost is checked against QUERY_MAX_COST; a row limit does
+    not apply since every page is bounded. Raises QueryRejected or ValueError.
+    """
+    encoding, include_properties = get_encoding_options(include_properties)
+    sql_query = build_sql(response_from_llm, aoi)
+    if sql_query is None:
+        raise ValueError("Sorry couldn't understand your request")
+    _, parameter = aoi_parameter(aoi)
+    limits = get_guard_limits()
+
+    with get_pool().connection() as connection:
+        with connection.cursor() as cursor:
+            query_guard.begin(cursor, limits)
+            plan = query_guard.explain(cursor, sql_query, {"aoi": parameter})
+    query_guard.check_plan(plan, limits, limited=True)
+
+    result_set = ResultSet(
+        result_set_id(extract_sql_query(response_from_llm), aoi, "page", encoding, include_properties, zoom),
+        response_from_llm, aoi, include_properties, plan, zoom
+    )
+    get_result_sets().put(result_set)
+    return result_set
+
+def get_page(result_set: ResultSet, after, page_size: int):
+    """
+    Runs one page of a result set: the features with gid greater than
+    `after` (None for the first page), in gid order. Raises ValueError when
+    the result has no single gid column or repeats a gid.
+    Returns (serialized FeatureCollection bytes, last gid or None when this is the last page).
+    """
+    encoding, include_properties = get_encoding_options(result_set.include_properties)
+    sql_query = build_sql(result_set.sql, result_set.aoi, encoding, include_properties,
+                          zoom=result_set.zoom, page_size=page_size, after=after is not None)
+    _, parameter = aoi_parameter(result_set.aoi)
+    with get_pool().connection() as connection:
+        cursor = connection.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        query_guard.begin(cursor, get_guard_limits())
+        try:
+            with metrics.span("db_execute"):
+                cursor.execute(sql_query, {"aoi": parameter, "after": after})
+                rows = cursor.fetchall()
+        except psycopg2.errors.UndefinedColumn as e:
+            raise ValueError(f"Pagination needs a {pagination.KEY_COLUMN} column in the query result: {e.pgerror or e}") from e
+        except psycopg2.errors.AmbiguousColumn as e:
+            raise ValueError(f"Pagination needs exactly one {pagination.KEY_COLUMN} column in the query result: "
+                             f"{e.pgerror or e}") from e
+        cursor.close()
 
-    finally:
-        if connection:
-            connection.close()
\ No newline at end of file
+    key = pagination.PAGE_KEY_ALIAS if encoding == "postgis" else pagination.KEY_COLUMN
+    pagination.check_unique_keys([row[key] for row in rows])
+    next_after = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_after = rows[-1][key]
+    with metrics.span("encode"):
+        features = geojson_encoder.encode_rows(rows, encoding, include_properties, result_set.zoom)
+    with metrics.span("serialize"):
+        return geojson_encoder.feature_collection(features), next_after
@@ -0,0 +1,233 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+from psycopg2 import sql
+from helper import logger
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection became free within the pool timeout."""
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """
+    psycopg2 connection that remembers the statements prepared on its session
+    (name -> True, least recently used first).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = OrderedDict()
+
+
+class ConnectionPool:
+    """
+    Thread-safe PostgreSQL connection pool.
+
+    Connections are opened lazily up to max_size (min_size are opened up
+    front), checked before being handed out and prepared with the session
+    settings once, right after connecting.
+    """
+
+    def __init__(self, connect_kwargs: Dict, min_size: int = 1, max_size: int = 10,
+                 timeout: float = 10.0, health_check_idle: float = 30.0,
+                 statement_timeout: Optional[int] = None, search_path: Optional[List[str]] = None):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"Invalid pool size: min={min_size}, max={max_size}")
+        self.connect_kwargs = connect_kwargs
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_idle = health_check_idle
+        self.statement_timeout = statement_timeout
+        self.search_path = search_path
+
+        # Guards the counters below as well as the pool state; reentrant, so
+        # _discard() can be called with or without it held
+        self._cond = threading.Condition(threading.RLock())
+        self._idle = deque()  # (connection, returned_at)
+        self._size = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._closed = False
+
+        self._connections_created = 0
+        self._connections_discarded = 0
+        self._health_check_failures = 0
+        self._wait_count = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+        self._timeouts = 0
+
+        for _ in range(min_size):
+            connection = self._connect()
+            with self._cond:
+                self._size += 1
+                self._idle.append((connection, time.monotonic()))
+
+    def _connect(self):
+        connection = psycopg2.connect(connection_factory=PooledConnection, **self.connect_kwargs)
+        try:
+            with connection.cursor() as cursor:
+                if self.statement_timeout is not None:
+                    cursor.execute("SET statement_timeout = %s", (int(self.statement_timeout),))
+                if self.search_path:
+                    cursor.execute(sql.SQL("SET search_path TO {}").format(
+                        sql.SQL(", ").join(sql.Identifier(schema) for schema in self.search_path)
+                    ))
+            connection.commit()
+        except Exception:
+            connection.close()
+            raise
+        with self._cond:
+            self._connections_created += 1
+        return connection
+
+    def _is_healthy(self, connection, returned_at: float) -> bool:
+        if connection.closed:
+            return False
+        if time.monotonic() - returned_at < self.health_check_idle:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            connection.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+        with self._cond:
+            self._connections_discarded += 1
+
+    def getconn(self, timeout: float = None):
+        """
+        Returns a healthy connection, waiting up to `timeout` seconds (default
+        the pool timeout) for one.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        waited = False
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise psycopg2.pool.PoolError("connection pool is closed")
+                if self._idle:
+                    connection, returned_at = self._idle.pop()
+                    self._in_use += 1
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    self._in_use += 1
+                    connection = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeoutError(f"No database connection available after {timeout}s")
+                waited = True
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+            if waited:
+                wait_time = time.monotonic() - started
+                self._wait_count += 1
+                self._wait_time_total += wait_time
+                self._wait_time_max = max(self._wait_time_max, wait_time)
+
+        # Connecting and health checks happen outside the lock
+        try:
+            if connection is not None and not self._is_healthy(connection, returned_at):
+                with self._cond:
+                    self._health_check_failures += 1
+                logger.log("WARNING", "Discarding unhealthy pooled database connection")
+                self._discard(connection)
+                connection = None
+            if connection is None:
+                connection = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        return connection
+
+    def putconn(self, connection, discard: bool = False):
+        """
+        Returns a connection to the pool, rolling back any open transaction.
+        """
+        if not discard and not connection.closed:
+            try:
+                connection.rollback()
+            except psycopg2.Error:
+                discard = True
+        with self._cond:
+            self._in_use -= 1
+            if discard or connection.closed or self._closed:
+                self._size -= 1
+                self._discard(connection)
+            else:
+                self._idle.append((connection, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout: float = None):
+        connection = self.getconn(timeout)
+        discard = False
+        try:
+            yield connection
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            discard = True
+            raise
+        finally:
+            self.putconn(connection, discard=discard)
+
+    def ping(self, timeout: float = None):
+        """
+        Liveness probe: borrows a connection (waiting at most `timeout`) and runs SELECT 1.
+        """
+        with self.connection(timeout) as connection:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                "size": self._size,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "waiting": self._waiting,
+                "wait_count": self._wait_count,
+                "wait_time_total_s": round(self._wait_time_total, 6),
+                "wait_time_max_s": round(self._wait_time_max, 6),
+                "timeouts": self._timeouts,
+                "connections_created": self._connections_created,
+                "connections_discarded": self._connections_discarded,
+                "health_check_failures": self._health_check_failures,
+            }
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                connection, _ = self._idle.pop()
+                self._size -= 1
+                self._discard(connection)
+            self._cond.notify_all()
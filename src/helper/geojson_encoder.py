@@ -0,0 +1,135 @@
+import datetime
+import decimal
+import math
+from typing import Iterable, List
+
+import orjson
+import shapely
+
+from helper import pagination
+
+# "postgis": the database renders geometry JSON with ST_AsGeoJSON
+# "shapely": WKB is decoded a whole batch at a time with shapely 2's array API
+ENCODINGS = ("postgis", "shapely")
+
+# Decimal places in output coordinates; the old geojson.dumps path rounded to 6 too
+COORDINATE_PRECISION = 6
+
+# Zoom levels of a 256 px web map; resolution() is degrees per pixel at the equator
+MAX_ZOOM = 22
+TILE_SIZE = 256
+
+GEOMETRY_COLUMN = "geom"
+GEOMETRY_ALIAS = "geojson_geometry"
+PROPERTIES_ALIAS = "geojson_properties"
+
+_FEATURE_HEAD = b'{"type":"Feature","geometry":'
+_FEATURE_MIDDLE = b',"properties":'
+_FEATURE_TAIL = b'}'
+_EMPTY_PROPERTIES = b'{}'
+_NULL = b'null'
+
+
+def _json_default(value):
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).hex()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def resolution(zoom: int) -> float:
+    return 360.0 / (TILE_SIZE * 2 ** zoom)
+
+
+def zoom_for_resolution(degrees_per_pixel: float) -> int:
+    """
+    The coarsest zoom level at least as detailed as `degrees_per_pixel`.
+    """
+    if degrees_per_pixel <= 0:
+        raise ValueError("resolution must be positive")
+    zoom = math.ceil(math.log2(360.0 / (TILE_SIZE * degrees_per_pixel)) - 1e-9)
+    return min(max(zoom, 0), MAX_ZOOM)
+
+
+def precision(zoom: int = None) -> int:
+    """
+    Decimal places that still resolve one pixel at `zoom` (all of
+    COORDINATE_PRECISION without a zoom).
+    """
+    if zoom is None:
+        return COORDINATE_PRECISION
+    return min(max(math.ceil(-math.log10(resolution(zoom))), 0), COORDINATE_PRECISION)
+
+
+def wrap_query(select_sql: str, encoding: str, include_properties: bool, zoom: int = None, key_column: str = None) -> str:
+    """
+    Wraps the generated SELECT so that the database does the geometry (and
+    property) encoding. With a zoom level, geometries are simplified to one
+    pixel (ST_SimplifyPreserveTopology) and coordinates rounded to precision(zoom).
+    The "shapely" encoding keeps the query unchanged and does both in encode_rows.
+    `key_column` is also returned as pagination.PAGE_KEY_ALIAS, and the
+    rows are ordered by it (a subquery's ORDER BY is not kept by the outer query).
+    """
+    if encoding != "postgis":
+        return select_sql
+    properties = f"(to_jsonb(_q) - '{GEOMETRY_COLUMN}')::text" if include_properties else "NULL::text"
+    geometry = f"_q.{GEOMETRY_COLUMN}"
+    if zoom is not None:
+        geometry = f"ST_SimplifyPreserveTopology({geometry}, {resolution(zoom)!r})"
+    key = f", _q.{key_column} AS {pagination.PAGE_KEY_ALIAS}" if key_column else ""
+    order = f" ORDER BY {pagination.PAGE_KEY_ALIAS}" if key_column else ""
+    return (
+        f"SELECT ST_AsGeoJSON({geometry}, {precision(zoom)}) AS {GEOMETRY_ALIAS}, {properties} AS {PROPERTIES_ALIAS}{key} "
+        f"FROM ({select_sql}) AS _q{order}"
+    )
+
+
+def splice_feature(geometry_json: bytes, properties_json: bytes) -> bytes:
+    """
+    Builds a Feature by splicing already-serialized JSON, without re-parsing it.
+    """
+    return b"".join((
+        _FEATURE_HEAD, geometry_json or _NULL,
+        _FEATURE_MIDDLE, properties_json or _EMPTY_PROPERTIES,
+        _FEATURE_TAIL
+    ))
+
+
+def encode_rows(rows: List, encoding: str, include_properties: bool, zoom: int = None) -> List[bytes]:
+    """
+    Encodes a batch of DictCursor rows into serialized GeoJSON features.
+    `zoom` must match the one given to wrap_query().
+    """
+    if encoding == "postgis":
+        return [
+            splice_feature(
+                row[GEOMETRY_ALIAS].encode("utf-8") if row[GEOMETRY_ALIAS] is not None else None,
+                row[PROPERTIES_ALIAS].encode("utf-8") if row[PROPERTIES_ALIAS] is not None else None
+            )
+            for row in rows
+        ]
+
+    # psycopg2 hands geometry columns over as hex EWKB strings (bytea as memoryview)
+    wkb = [bytes(row[GEOMETRY_COLUMN]) if isinstance(row[GEOMETRY_COLUMN], memoryview) else row[GEOMETRY_COLUMN] for row in rows]
+    geometries = shapely.from_wkb(wkb)
+    if zoom is not None:
+        geometries = shapely.simplify(geometries, resolution(zoom), preserve_topology=True)
+    geometries = shapely.to_geojson(shapely.set_precision(geometries, 10 ** -precision(zoom), mode="pointwise"))
+    features = []
+    for row, geometry_json in zip(rows, geometries):
+        properties_json = None
+        if include_properties:
+            properties = {key: value for key, value in row.items() if key != GEOMETRY_COLUMN}
+            properties_json = orjson.dumps(properties, default=_json_default)
+        features.append(splice_feature(
+            geometry_json.encode("utf-8") if geometry_json is not None else None,
+            properties_json
+        ))
+    return features
+
+
+def feature_collection(features: Iterable[bytes]) -> bytes:
+    return b'{"type":"FeatureCollection","features":[' + b",".join(features) + b']}'
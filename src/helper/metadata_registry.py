@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, Optional
+
+from helper import logger
+
+METADATA_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "metadata", "metadata.json")
+# Written by builder.metadata_builder.build_stats; optional
+TABLE_STATS_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "metadata", "table_stats.json")
+
+
+def format_context_block(dataset_name: str, dataset_info: Dict) -> str:
+    """
+    Formats a single dataset entry the way the LLM context expects it.
+    """
+    context_block = f"""
+Dataset: {dataset_name}
+Table: {dataset_info.get('table_name', 'N/A')}
+Description: {dataset_info.get('description', 'N/A')}
+Columns:"""
+
+    for col_name, col_desc in dataset_info.get('columns', {}).items():
+        context_block += f"\n  - {col_name}: {col_desc}"
+
+    return context_block
+
+
+class MetadataSnapshot:
+    """
+    One parse of metadata.json together with every view derived from it.
+    Snapshots are never mutated; a reload swaps in a new one.
+    """
+
+    def __init__(self, metadata: Dict, digest: str = "", error: Optional[str] = None):
+        self.metadata = metadata
+        self.digest = digest
+        self.error = error
+        self.metadata_str = json.dumps(metadata, indent=2)
+        self.context_blocks = {
+            name: format_context_block(name, info) for name, info in metadata.items()
+        }
+        self.columns = {
+            name: list(info.get("columns", {}).keys()) for name, info in metadata.items()
+        }
+        self.datasets = [{
+            "name": name,
+            "table_name": info.get("table_name"),
+            "description": info.get("description"),
+            "columns": self.columns[name]
+        } for name, info in metadata.items()]
+
+
+class MetadataRegistry:
+    """
+    Process-wide cache of metadata.json. The file is parsed once and only
+    re-parsed when its mtime/size changes and the content hash differs.
+    """
+
+    def __init__(self, path: str, required: bool = True):
+        self.path = path
+        self.required = required
+        self._lock = threading.Lock()
+        self._signature = None
+        self._snapshot = None
+
+    def _stat_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _load(self, signature) -> MetadataSnapshot:
+        previous = self._snapshot
+        if signature is None:
+            if not self.required:
+                return MetadataSnapshot({})
+            error = f"Error: Metadata file not found. at {self.path}"
+            logger.log("ERROR", error)
+            return MetadataSnapshot({}, error=error)
+
+        with open(self.path, "rb") as file:
+            raw = file.read()
+        digest = hashlib.sha256(raw).hexdigest()
+        if previous is not None and previous.error is None and previous.digest == digest:
+            return previous
+
+        try:
+            metadata = json.loads(raw.decode("utf-8"))
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            logger.log("ERROR", f"Error parsing metadata.json: {e}")
+            if previous is not None and previous.error is None:
+                # Keep serving the last good metadata while the file is being edited
+                return previous
+            return MetadataSnapshot({}, error="Error: Metadata file is not a valid JSON.")
+
+        logger.log("INFO", f"Loaded {len(metadata)} metadata entries ({digest[:12]}).")
+        return MetadataSnapshot(metadata, digest=digest)
+
+    def snapshot(self) -> MetadataSnapshot:
+        """
+        Returns the current snapshot, reloading it first if the file changed.
+        """
+        signature = self._stat_signature()
+        if self._snapshot is not None and signature == self._signature:
+            return self._snapshot
+
+        with self._lock:
+            if self._snapshot is None or signature != self._signature:
+                self._snapshot = self._load(signature)
+                self._signature = signature
+            return self._snapshot
+
+
+_registry = MetadataRegistry(os.path.abspath(METADATA_PATH))
+_stats_registry = MetadataRegistry(os.path.abspath(TABLE_STATS_PATH), required=False)
+
+
+def get_snapshot() -> MetadataSnapshot:
+    return _registry.snapshot()
+
+
+def get_metadata() -> Dict:
+    return get_snapshot().metadata
+
+
+def get_table_stats_snapshot() -> MetadataSnapshot:
+    return _stats_registry.snapshot()
+
+
+def get_table_stats() -> Dict:
+    """
+    Per-table stats (row estimate, geometry type/SRID, extent, value samples)
+    keyed by table name; empty until the builder has run.
+    """
+    return get_table_stats_snapshot().metadata
@@ -0,0 +1,244 @@
+import bisect
+import contextvars
+import functools
+import os
+import threading
+import time
+from configparser import ConfigParser
+from contextlib import contextmanager
+from typing import Optional
+
+CONF_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "conf", "server.conf")
+
+PREFIX = "geohimalaya"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+TIMING_REQUEST_HEADER = "X-Server-Timing"
+# Route label of stages timed outside an HTTP request (CLI, benchmarks, warm-up)
+NO_ROUTE = "none"
+
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+
+def load_config() -> dict:
+    """
+    Reads the [metrics] section of conf/server.conf:
+        enabled = true           time request stages and serve them on /metrics
+        server_timing = false    add the Server-Timing header to every response
+                                 (otherwise only when the request sends X-Server-Timing: 1)
+    """
+    config = ConfigParser()
+    config.read(CONF_PATH)
+    return {
+        "enabled": config.getboolean("metrics", "enabled", fallback=True),
+        "server_timing": config.getboolean("metrics", "server_timing", fallback=False),
+    }
+
+
+METRICS_CONFIG = load_config()
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(value: float) -> str:
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+
+class Histogram:
+    """
+    Prometheus histogram with one series per label-value tuple. Counts are
+    kept per bucket and made cumulative when rendered.
+    """
+
+    def __init__(self, name: str, help_text: str, label_names: tuple, buckets: tuple):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [per-bucket counts..., +Inf count], sum
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        # First bucket whose upper bound (le) is >= value; len(buckets) is +Inf
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, list(counts), total) for labels, (counts, total) in self._series.items())
+        for label_values, counts, total in series:
+            labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                separator = "," if labels else ""
+                lines.append(f'{self.name}_bucket{{{labels}{separator}le="{_format(bound)}"}} {cumulative}')
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {repr(total)}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram(
+    f"{PREFIX}_request_duration_seconds", "Time from the start of a request until its response is finished.",
+    ("route", "status"), SECONDS_BUCKETS
+)
+STAGE_SECONDS = Histogram(
+    f"{PREFIX}_stage_duration_seconds", "Time spent in one pipeline stage of a request.",
+    ("route", "stage"), SECONDS_BUCKETS
+)
+LLM_TOKENS = Histogram(
+    f"{PREFIX}_llm_tokens", "Prompt and generated token counts per LLM call "
+    "(prompt_estimate is counted before the call, prompt_eval and eval are reported by Ollama).",
+    ("route", "kind"), TOKEN_BUCKETS
+)
+HISTOGRAMS = (REQUEST_SECONDS, STAGE_SECONDS, LLM_TOKENS)
+
+
+class Trace:
+    """
+    Stage timings of one request. Time spent in a stage more than once
+    (e.g. SQL built twice) is summed; everything is observed into the
+    histograms once, by end().
+    """
+
+    def __init__(self, route: str):
+        self.route = route
+        self.started = time.perf_counter()
+        self.spans = {}  # stage -> seconds, in first-seen order
+        self.tokens = {}  # kind -> count
+        self.status = None
+        self.ended = False
+
+    def add(self, stage: str, seconds: float):
+        self.spans[stage] = self.spans.get(stage, 0.0) + seconds
+
+    def server_timing(self) -> str:
+        """
+        Server-Timing header value: each stage so far, then the total, in ms.
+        """
+        entries = [f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in self.spans.items()]
+        entries.extend(f'{kind}_tokens;desc="{count}"' for kind, count in self.tokens.items())
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.2f}")
+        return ", ".join(entries)
+
+    def end(self):
+        """
+        Observes the request and its stages; only the first call counts. A
+        streamed response calls this once its body is sent.
+        """
+        if self.ended:
+            return
+        self.ended = True
+        if _current.get() is self:
+            _current.set(None)
+        total = time.perf_counter() - self.started
+        REQUEST_SECONDS.observe(total, self.route, str(self.status or ""))
+        for stage, seconds in self.spans.items():
+            STAGE_SECONDS.observe(seconds, self.route, stage)
+        for kind, count in self.tokens.items():
+            LLM_TOKENS.observe(count, self.route, kind)
+
+
+_current = contextvars.ContextVar("metrics_trace", default=None)
+
+
+def start_trace(route: str) -> Optional[Trace]:
+    """
+    Starts timing a request in the current context (None when metrics are disabled).
+    """
+    if not METRICS_CONFIG["enabled"]:
+        return None
+    trace = Trace(route)
+    _current.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+def record(stage: str, seconds: float):
+    """
+    Adds a stage timing to the current request, or observes it straight
+    away (route "none") outside a request.
+    """
+    if not METRICS_CONFIG["enabled"]:
+        return
+    trace = _current.get()
+    if trace is not None and not trace.ended:
+        trace.add(stage, seconds)
+    else:
+        STAGE_SECONDS.observe(seconds, NO_ROUTE, stage)
+
+
+def record_tokens(kind: str, count: int):
+    if not METRICS_CONFIG["enabled"] or count is None:
+        return
+    trace = _current.get()
+    if trace is not None and not trace.ended:
+        trace.tokens[kind] = trace.tokens.get(kind, 0) + count
+    else:
+        LLM_TOKENS.observe(count, NO_ROUTE, kind)
+
+
+@contextmanager
+def span(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started)
+
+
+def timed(stage: str):
+    """
+    Decorator form of span().
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_llm(llm_json: dict):
+    """
+    Records what Ollama reports for a finished generation: model load,
+    prompt evaluation and generation time (ns in its JSON) as stages
+    llm_load / llm_prompt_eval / llm_eval, and the prompt and generated
+    token counts.
+    """
+    if not llm_json:
+        return
+    for key, stage in (("load_duration", "llm_load"), ("prompt_eval_duration", "llm_prompt_eval"),
+                       ("eval_duration", "llm_eval")):
+        if llm_json.get(key) is not None:
+            record(stage, llm_json[key] / 1e9)
+    record_tokens("prompt_eval", llm_json.get("prompt_eval_count"))
+    record_tokens("eval", llm_json.get("eval_count"))
+
+
+def wants_server_timing(request_headers) -> bool:
+    return METRICS_CONFIG["server_timing"] or \
+        request_headers.get(TIMING_REQUEST_HEADER, "").strip().lower() in ("1", "true", "yes")
+
+
+def render() -> bytes:
+    """
+    All histograms in the Prometheus text exposition format (version 0.0.4).
+    """
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    return ("\n".join(lines) + "\n").encode("utf-8")
@@ -0,0 +1,34 @@
+from helper.geojson_encoder import GEOMETRY_COLUMN
+
+# Tile grid: web mercator z/x/y (ST_TileEnvelope), 4096 units per tile side
+EXTENT = 4096
+BUFFER = 64
+LAYER_NAME = "layer"
+MAX_ZOOM = 22
+CONTENT_TYPE = "application/vnd.mapbox-vector-tile"
+
+
+def valid_tile(z: int, x: int, y: int) -> bool:
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def wrap_query(select_sql: str, include_properties: bool) -> str:
+    """
+    Wraps the generated SELECT so that the database clips its geometries to
+    one tile and encodes them with ST_AsMVT. The tile is bound as %(z)s,
+    %(x)s and %(y)s. Rows are pre-filtered with the tile's bbox in EPSG:4326
+    so the source table's spatial index is used; non-geometry columns become
+    feature properties through a jsonb column when include_properties is set.
+    """
+    properties = f", (to_jsonb(_q) - '{GEOMETRY_COLUMN}') AS properties" if include_properties else ""
+    return (
+        f"SELECT ST_AsMVT(_mvt, '{LAYER_NAME}', {EXTENT}, '{GEOMETRY_COLUMN}') "
+        f"FROM ("
+        f"SELECT ST_AsMVTGeom(ST_Transform(_q.{GEOMETRY_COLUMN}, 3857), _tile.envelope, {EXTENT}, {BUFFER}, true) "
+        f"AS {GEOMETRY_COLUMN}{properties} "
+        f"FROM ({select_sql}) AS _q, "
+        f"(SELECT ST_TileEnvelope(%(z)s, %(x)s, %(y)s) AS envelope) AS _tile "
+        f"WHERE _q.{GEOMETRY_COLUMN} && ST_Transform(_tile.envelope, 4326)"
+        f") AS _mvt "
+        f"WHERE _mvt.{GEOMETRY_COLUMN} IS NOT NULL"
+    )
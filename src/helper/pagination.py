@@ -0,0 +1,67 @@
+import base64
+from typing import Optional, Tuple
+
+import orjson
+
+# Every dataset has a unique integer gid; pages are ordered by it, so a
+# result must carry exactly one gid column and each gid at most once
+KEY_COLUMN = "gid"
+PAGE_KEY_ALIAS = "page_key"
+
+
+class DuplicateKeyError(ValueError):
+    """Raised when a result repeats a gid, which keyset pages cannot split."""
+
+
+def page_query(select_sql: str, page_size: int, after: bool) -> str:
+    """
+    Keyset page of the generated SELECT: the rows after %(after)s in gid
+    order, plus one extra row that tells whether another page follows.
+    The generated query is wrapped as a subquery; whether the predicate
+    reaches a gid index is up to the planner.
+    """
+    predicate = f" WHERE _page.{KEY_COLUMN} > %(after)s" if after else ""
+    return (
+        f"SELECT * FROM ({select_sql}) AS _page{predicate} "
+        f"ORDER BY _page.{KEY_COLUMN} LIMIT {int(page_size) + 1}"
+    )
+
+
+def check_unique_keys(keys: list):
+    """
+    Raises DuplicateKeyError when the (gid-ordered) keys of a fetched page,
+    extra row included, repeat a gid. Rows sharing the gid a page ends on
+    would otherwise be skipped by the next page.
+    """
+    for previous, key in zip(keys, keys[1:]):
+        if key == previous:
+            raise DuplicateKeyError(
+                f"Pagination needs a unique {KEY_COLUMN} per result row, but {KEY_COLUMN} {key!r} repeats "
+                f"(e.g. from a join); select one row per {KEY_COLUMN} or request the result without paging"
+            )
+
+
+def encode_token(result_set_id: str, after, page_size: int) -> str:
+    """
+    Opaque continuation token: the result set, the last gid returned and the page size.
+    """
+    raw = orjson.dumps({"r": result_set_id, "a": after, "n": page_size})
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def decode_token(token: str) -> Optional[Tuple[str, object, int]]:
+    """
+    Returns (result set id, last gid, page size), or None for a malformed
+    token. The token is not signed, so the last gid must be None or an
+    integer before it is bound into the page query.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        data = orjson.loads(raw)
+        page_size = int(data["n"])
+    except (ValueError, KeyError, TypeError):
+        return None
+    after = data["a"]
+    if page_size < 1 or not (after is None or (isinstance(after, int) and not isinstance(after, bool))):
+        return None
+    return str(data["r"]), after, page_size
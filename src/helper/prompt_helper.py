@@ -2,53 +2,21 @@
 
 import json
 import os
+import re
+import time
+from configparser import ConfigParser
+from typing import Dict, List, Tuple
 from langchain.prompts import PromptTemplate
+from helper import metadata_registry, logger, metrics
+from matcher.matcher import get_relevant_datasets
 
-def get_prompt_template()-> PromptTemplate:
-    """
-    Reutrns pronpmt template
-    """
-    metadata_path = os.path.join(os.path.dirname(__file__), "..","..","metadata", "metadata.json")
-
-
-    # Load metadata
-    try:
-        with open(metadata_path, "r", encoding="utf-8") as file:
-            metadata = json.load(file)
-    except FileNotFoundError:
-        return f"Error: Metadata file not found. at {metadata_path}"
-    except json.JSONDecodeError:
-        return "Error: Metadata file is not a valid JSON."
-
-    # Format metadata into a readable context
-    metadata_str = json.dumps(metadata, indent=2)
-    # Construct the prompt
-    prompt_template = PromptTemplate(
-    input_variables=["user_query"],
-    template="""
-        ### SYSTEM MESSAGE:
-        You are a SQL query generation expert with access to a PostGIS-enabled geospatial database. Your task is to generate **accurate and optimized SQL queries** based strictly on the following metadata:
-
-        **Database Schema:**
-        {metadata}
-
-        
-
-        ### Instructions:
-        1. Generate SQL queries that **only** use the provided metadata.
-        2. **Table names are case sensitive**
-        3. **Column names are case sensitive**
-        4. **Restrict** the SQL Query to be performed only within the given Area of Interest.
-        5. The Area of Interest geoemtry is provided in WKT format.
-        6. **DO NOT** assume any missing table or column.
-        7.  Use **only** available column names.
-        8. Ensure the SQL is syntactically correct and optimized for PostGIS.
-        9. Retuern SQL Query **only** , **No explanation required**
+CONF_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "conf", "server.conf")
+DEFAULT_SQL_CONTEXT_TOKEN_BUDGET = 2000
 
-        ### Examples
-            Question: Show Forest area which passes through city roads
+SQL_EXAMPLES = [
+r"""            Question: Show Forest area which passes through city roads
             AOI : aoi
-            Query:  SELECT forest.geom
+            Query:  SELECT forest.gid, forest.geom
                         FROM uttarakhand_forest AS forest
                         JOIN aoi ON ST_Intersects(forest.geom, aoi.geom)  
                         WHERE EXISTS (
@@ -56,12 +24,10 @@ def get_prompt_template()-> PromptTemplate:
                             WHERE ST_Intersects(forest.geom, roads.geom)  
                             AND roads.type = 'City road'  
                             AND ST_Intersects(roads.geom, aoi.geom)  
-                        );
-
-
-            Question: Find all soil types that are located within 500 meters of a river.
+                        );""",
+r"""            Question: Find all soil types that are located within 500 meters of a river.
             AOI : aoi
-            Query: SELECT soil.geom, soil.type
+            Query: SELECT soil.gid, soil.geom, soil.type
                     FROM uttarakhand_soil AS soil
                     JOIN aoi ON ST_Intersects(soil.geom, aoi.geom)  
                     WHERE EXISTS (
@@ -69,26 +35,25 @@ def get_prompt_template()-> PromptTemplate:
                         WHERE ST_DWithin(soil.geom, river.geom, 500)  
                         AND ST_Intersects(river.geom, aoi.geom)  
                     )
-                    ORDER BY ST_Distance(soil.geom, (SELECT geom FROM aoi)) ASC;
-            Question: Show the longest road and its type
+                    ORDER BY ST_Distance(soil.geom, (SELECT geom FROM aoi)) ASC;""",
+r"""            Question: Show the longest road and its type
             AOI : aoi
-            Query: SELECT roads.type, roads.geom, ST_Length(roads.geom::geography) AS length
+            Query: SELECT roads.gid, roads.type, roads.geom, ST_Length(roads.geom::geography) AS length
                     FROM uttarakhand_roads AS roads
                     JOIN aoi ON ST_Intersects(roads.geom, aoi.geom)  
                     ORDER BY length DESC
-                    LIMIT 1;
-            
-            Question : Show largest area of land use as forest
+                    LIMIT 1;""",
+r"""            Question : Show largest area of land use as forest
             AOI : aoi
-            Query : SELECT lulc.type, lulc.geom, ST_Area(lulc.geom::geography) AS area
+            Query : SELECT lulc.gid, lulc.type, lulc.geom, ST_Area(lulc.geom::geography) AS area
                         FROM uttarakhand_lulc AS lulc
                         JOIN aoi ON ST_Intersects(lulc.geom, aoi.geom) 
                         WHERE lulc.type  ~* 'forest.*$'  
                         ORDER BY area DESC
-                        LIMIT 1;
-            Question : Show the  barren lands with 10m vicinity of  water body
+                        LIMIT 1;""",
+r"""            Question : Show the  barren lands with 10m vicinity of  water body
             AOI : aoi
-            Query : SELECT barren_lands.type, barren_lands.geom
+            Query : SELECT barren_lands.gid, barren_lands.type, barren_lands.geom
                         FROM uttarakhand_lulc AS barren_lands
                         JOIN aoi ON ST_Intersects(barren_lands.geom, aoi.geom)  
                         WHERE barren_lands.type IN ('Barren Rocky', 'Gullied / Ravinous land', 'Sandy Area')  
@@ -97,10 +62,10 @@ def get_prompt_template()-> PromptTemplate:
                             WHERE water_bodies.type IN ('Water Body', 'Lakes/Ponds', 'Reservoir/tanks', 'Canal', 'Waterlogged / Marshy Land') 
                             AND ST_DWithin(barren_lands.geom, water_bodies.geom, 10)  
                             AND ST_Intersects(water_bodies.geom, aoi.geom)  
-                        );
-             Question : Find built-up area near drainage
+                        );""",
+r"""             Question : Find built-up area near drainage
             AOI : aoi
-            Query : SELECT built_ups.type, built_ups.geom
+            Query : SELECT built_ups.gid, built_ups.type, built_ups.geom
                         FROM uttarakhand_lulc AS built_ups
                         JOIN aoi ON ST_Intersects(built_ups.geom, aoi.geom)  
                         WHERE built_ups.type  ~* 'built[\s_-]*up.*$'  
@@ -109,7 +74,48 @@ def get_prompt_template()-> PromptTemplate:
                             WHERE water_bodies.type IN ('Branch canal', 'River', 'Distributory canal', 'Stream', 'Drain','Main canal') 
                             AND ST_DWithin(built_ups.geom, water_bodies.geom, 10)  
                             AND ST_Intersects(water_bodies.geom, aoi.geom)  
-                        );
+                        );"""
+]
+
+_prompt_template = None
+
+def get_prompt_template()-> PromptTemplate:
+    """
+    Reutrns pronpmt template
+    """
+    global _prompt_template
+    snapshot = metadata_registry.get_snapshot()
+    if snapshot.error:
+        return snapshot.error
+    if _prompt_template is not None:
+        return _prompt_template
+
+    # Construct the prompt
+    prompt_template = PromptTemplate(
+    input_variables=["user_query", "metadata", "examples"],
+    template="""
+        ### SYSTEM MESSAGE:
+        You are a SQL query generation expert with access to a PostGIS-enabled geospatial database. Your task is to generate **accurate and optimized SQL queries** based strictly on the following metadata:
+
+        **Database Schema:**
+        {metadata}
+
+        
+
+        ### Instructions:
+        1. Generate SQL queries that **only** use the provided metadata.
+        2. **Table names are case sensitive**
+        3. **Column names are case sensitive**
+        4. **Restrict** the SQL Query to be performed only within the given Area of Interest.
+        5. The Area of Interest geoemtry is provided in WKT format.
+        6. **DO NOT** assume any missing table or column.
+        7.  Use **only** available column names.
+        8. Ensure the SQL is syntactically correct and optimized for PostGIS.
+        9. Retuern SQL Query **only** , **No explanation required**
+        10. Always select the main table's gid and geom columns.
+
+        ### Examples
+{examples}
 
         ---
 
@@ -127,25 +133,300 @@ def get_prompt_template()-> PromptTemplate:
         ### **Response:**
         """
     )
+    _prompt_template = prompt_template
     return prompt_template
 
+_token_pattern = re.compile(r"\w+|[^\w\s]")
+_table_pattern = re.compile(r"\b(?:FROM|JOIN)\s+([A-Za-z_][A-Za-z0-9_]*)", re.IGNORECASE)
+
+def estimate_tokens(text : str) -> int:
+    """
+    Rough token count (words plus punctuation marks); close enough to the
+    model tokenizer to compare prompt sizes without loading it.
+    """
+    return len(_token_pattern.findall(text))
+
+def get_sql_context_token_budget() -> int:
+    """
+    Reads sql_context_token_budget from the [prompt] section of conf/server.conf.
+    """
+    config = ConfigParser()
+    config.read(CONF_PATH)
+    return config.getint("prompt", "sql_context_token_budget", fallback=DEFAULT_SQL_CONTEXT_TOKEN_BUDGET)
+
+SQL_CONTEXT_TOKEN_BUDGET = get_sql_context_token_budget()
+
+def _example_tables(example : str) -> set:
+    return {table for table in _table_pattern.findall(example) if table != "aoi"}
+
+def with_table_stats(info : Dict, table_stats : Dict) -> Dict:
+    """
+    Adds what the builder recorded for the dataset's table: its row
+    estimate, geometry type and SRID, and the actual values of its
+    low-cardinality text columns (which the hand-written lists may lack).
+    """
+    stats = table_stats.get(info.get("table_name"))
+    if not stats:
+        return info
+    enriched = dict(info)
+    if stats.get("row_estimate") is not None:
+        enriched["row_estimate"] = stats["row_estimate"]
+    if stats.get("geometry"):
+        enriched["geometry"] = f"{stats['geometry']['type']}, SRID {stats['geometry']['srid']}"
+    values = {column: samples for column, samples in stats.get("samples", {}).items() if column in info.get("columns", {})}
+    if values:
+        enriched["values"] = values
+    return enriched
+
+def get_sql_context(user_query : str, token_budget : int = None, engine : str = None) -> Dict[str, str]:
+    """
+    Builds the {metadata} and {examples} values for the SQL prompt from only the
+    datasets the matcher picks for the query (all datasets when nothing matches)
+    and the examples that touch those tables, then trims it to the token budget:
+    examples are dropped from the end, then the JSON is compacted, then datasets
+    are dropped from the end (the best match is always kept).
+    """
+    snapshot = metadata_registry.get_snapshot()
+    if snapshot.error:
+        return {"metadata": snapshot.error, "examples": ""}
+    token_budget = token_budget or SQL_CONTEXT_TOKEN_BUDGET
+
+    table_stats = metadata_registry.get_table_stats()
+    datasets = get_relevant_datasets(user_query, engine=engine) or list(snapshot.metadata.keys())
+    started = time.perf_counter()
+    tables = {snapshot.metadata[name].get("table_name") for name in datasets}
+    examples = [example for example in SQL_EXAMPLES if _example_tables(example) <= tables]
+
+    def render(names : List[str], chosen : List[str], indent) -> Tuple[str, str, int]:
+        metadata_str = json.dumps({name: with_table_stats(snapshot.metadata[name], table_stats) for name in names}, indent=indent)
+        examples_str = "\n\n".join(chosen)
+        return metadata_str, examples_str, estimate_tokens(metadata_str) + estimate_tokens(examples_str)
+
+    indent = 2
+    metadata_str, examples_str, tokens = render(datasets, examples, indent)
+    full_tokens = estimate_tokens(snapshot.metadata_str) + sum(estimate_tokens(example) for example in SQL_EXAMPLES)
+    while tokens > token_budget:
+        if examples:
+            examples = examples[:-1]
+        elif indent is not None:
+            indent = None
+        elif len(datasets) > 1:
+            datasets = datasets[:-1]
+        else:
+            break
+        metadata_str, examples_str, tokens = render(datasets, examples, indent)
+
+    logger.log("INFO", f"SQL prompt context: {full_tokens} -> {tokens} tokens "
+                       f"({len(datasets)} datasets, {len(examples)} examples, budget {token_budget})")
+    metrics.record("prompt", time.perf_counter() - started)
+    return {"metadata": metadata_str, "examples": examples_str}
+
 def get_metadata() : 
     """
-    Reads metadata.json from the metadata directory and returns the same.
+    Returns the pretty-printed metadata.json from the shared metadata registry.
+    """
+    snapshot = metadata_registry.get_snapshot()
+    if snapshot.error:
+        return snapshot.error
+    return snapshot.metadata_str
+
+CHAT_SYSTEM_PROMPT = (
+    "You are a GIS data assistant for Uttarakhand. Follow these STRICT rules:\n"
+    "1. Response format MUST be EXACTLY:\n"
+    "   LLM Response: The <objects> are: <comma-separated values from type column>.\n"
+    "   View Operation: SELECT DISTINCT type FROM <correct_table>;\n"
+    "\n"
+    "2. For 'show me <objects>' queries:\n"
+    "   - List ALL distinct values from the 'type' column (or equivalent)\n"
+    "   - Use EXACT values as stored in the database\n"
+    "   - Maintain original capitalization and formatting\n"
+    "\n"
+    "3. Never:\n"
+    "   - Summarize or categorize data\n"
+    "   - Add explanations or interpretations\n"
+    "   - Skip any values from the 'type' column\n"
+    "\n"
+    "4. If no matching data exists, respond EXACTLY:\n"
+    "   LLM Response: No data found for this query.\n"
+    "   View Operation: SELECT * FROM unknown_table;\n"
+    "\n"
+    "5. Example responses REQUIRED:\n"
+    "   For 'show me roads':\n"
+    "   LLM Response: The roads are: Foot path, Village road (Pucca), Cart track, District road, National highway, Village road (Kuchha), City road, State highway.\n"
+    "   View Operation: SELECT DISTINCT type FROM uttarakhand_roads;\n"
+    "\n"
+    "   For 'show me forests':\n"
+    "   LLM Response: The forests are: Forest Evergreen/Semi Evergreen - Dense/Close, Forest Evergreen/Semi Evergreen - Open, Forest - Deciduous (Dry/Moist/Thorn) - Dense/Close, Forest - Forest Blank, Forest - Scrub Forest, Forest - Deciduous (Dry/Moist/Thorn) - Open, Forest - Forest Plantation.\n"
+    "   View Operation: SELECT DISTINCT forest_description FROM uttarakhand_forest;"
+)
+
+# Everything that does not depend on the request comes first and never changes,
+# so Ollama can keep the evaluated prefix in its KV cache between calls
+CHAT_PROMPT_PREFIX = f"""{CHAT_SYSTEM_PROMPT}
+
+You must return both:
+1. LLM Response: Answer to the user query.
+2. View Operation: A SQL SELECT query matching the query. If no data matches, write: SELECT * FROM unknown_table WHERE condition;
+"""
+
+def get_chat_prompt_suffix(context : str, query : str) -> str:
+    """
+    Returns the request-specific tail of the /chat prompt.
+    """
+    return f"""
+Dataset Context:
+{context}
+
+User Query: {query}
+
+Begin your response:
+
+LLM Response:"""
+
+def get_chat_prompt(context : str, query : str) -> str:
+    """
+    Returns the /chat prompt for the matched dataset context and user query.
     """
-    metadata_path = os.path.join(os.path.dirname(__file__), "..","..","metadata", "metadata.json")
+    return CHAT_PROMPT_PREFIX + get_chat_prompt_suffix(context, query)
+
+CLI_SYSTEM_PROMPT = """
+### SYSTEM MESSAGE:
+You are a SQL query generation expert with access to a PostGIS-enabled geospatial database. Your task is to generate accurate SQL queries strictly using the metadata provided.
+
+### RULES:
+1. Use only table/column names available in metadata.
+2. AOI filtering must always be done using:
+   JOIN aoi ON ST_Intersects(table.geom, aoi.geom)
+3. Output format MUST be:
+
+---
+LLM Response: <natural language result summary based on metadata like this - LLM Response: The roads are: Foot path, Village road (Pucca), Cart track, District road, National highway, Village road (Kuchha), City road, State highway.>
+
+
+View Operation:
+<valid SQL query here>
+---
+
+4. If query is invalid or no match found:
+LLM Response: No data found for this query.
+View Operation: SELECT * FROM unknown_table;
 
+5. Never include explanations, assumptions or unused columns.
 
-    # Load metadata
-    try:
-        with open(metadata_path, "r", encoding="utf-8") as file:
-            metadata = json.load(file)
-    except FileNotFoundError:
-        return f"Error: Metadata file not found. at {metadata_path}"
-    except json.JSONDecodeError:
-        return "Error: Metadata file is not a valid JSON."
+### Examples:
 
-    # Format metadata into a readable context
-    metadata_str = json.dumps(metadata, indent=2)
-    return metadata_str
+Query: show me roads
+LLM Response: The roads are: Foot path, Village road (Pucca), Cart track, District road, National highway, Village road (Kuchha), City road, State highway.
+View Operation:
+SELECT DISTINCT type FROM uttarakhand_roads
+JOIN aoi ON ST_Intersects(uttarakhand_roads.geom, aoi.geom);
 
+Query: show forests
+LLM Response: The forests are: Forest Evergreen/Semi Evergreen - Dense/Close, Forest Evergreen/Semi Evergreen - Open, Forest - Deciduous (Dry/Moist/Thorn) - Dense/Close, Forest - Forest Blank, Forest - Scrub Forest, Forest - Deciduous (Dry/Moist/Thorn) - Open, Forest - Forest Plantation.
+View Operation:
+SELECT DISTINCT forest_description FROM uttarakhand_forest
+JOIN aoi ON ST_Intersects(uttarakhand_forest.geom, aoi.geom);
+
+
+Question: Show Forest area which passes through city roads  
+AOI : aoi  
+Query:  
+SELECT forest.geom  
+FROM uttarakhand_forest AS forest  
+JOIN aoi ON ST_Intersects(forest.geom, aoi.geom)  
+WHERE EXISTS (  
+    SELECT 1 FROM uttarakhand_roads AS roads  
+    WHERE ST_Intersects(forest.geom, roads.geom)  
+    AND roads.type = 'City road'  
+    AND ST_Intersects(roads.geom, aoi.geom)  
+);  
+
+Question: Find all soil types that are located within 500 meters of a river.  
+AOI : aoi  
+Query:  
+SELECT soil.geom, soil.type  
+FROM uttarakhand_soil AS soil  
+JOIN aoi ON ST_Intersects(soil.geom, aoi.geom)  
+WHERE EXISTS (  
+    SELECT 1 FROM uttarakhand_drainage AS river  
+    WHERE ST_DWithin(soil.geom, river.geom, 500)  
+    AND ST_Intersects(river.geom, aoi.geom)  
+)  
+ORDER BY ST_Distance(soil.geom, (SELECT geom FROM aoi)) ASC;  
+
+Question: Show the longest road and its type  
+AOI : aoi  
+Query:  
+SELECT roads.type, roads.geom, ST_Length(roads.geom::geography) AS length  
+FROM uttarakhand_roads AS roads  
+JOIN aoi ON ST_Intersects(roads.geom, aoi.geom)  
+ORDER BY length DESC  
+LIMIT 1;  
+
+Question: Show largest area of land use as forest  
+AOI : aoi  
+Query:  
+SELECT lulc.type, lulc.geom, ST_Area(lulc.geom::geography) AS area  
+FROM uttarakhand_lulc AS lulc  
+JOIN aoi ON ST_Intersects(lulc.geom, aoi.geom)  
+WHERE lulc.type  ~* 'forest.*$'  
+ORDER BY area DESC  
+LIMIT 1;  
+
+Question: Show the barren lands within 10m of a water body  
+AOI : aoi  
+Query:  
+SELECT barren_lands.type, barren_lands.geom  
+FROM uttarakhand_lulc AS barren_lands  
+JOIN aoi ON ST_Intersects(barren_lands.geom, aoi.geom)  
+WHERE barren_lands.type IN ('Barren Rocky', 'Gullied / Ravinous land', 'Sandy Area')  
+AND EXISTS (  
+    SELECT 1 FROM uttarakhand_lulc AS water_bodies  
+    WHERE water_bodies.type IN ('Water Body', 'Lakes/Ponds', 'Reservoir/tanks', 'Canal', 'Waterlogged / Marshy Land')  
+    AND ST_DWithin(barren_lands.geom, water_bodies.geom, 10)  
+    AND ST_Intersects(water_bodies.geom, aoi.geom)  
+);  
+
+Question: Find built-up area near drainage  
+AOI : aoi  
+Query:  
+SELECT built_ups.type, built_ups.geom  
+FROM uttarakhand_lulc AS built_ups  
+JOIN aoi ON ST_Intersects(built_ups.geom, aoi.geom)  
+WHERE built_ups.type  ~* 'built[_-]*up.*$'  
+AND EXISTS (  
+    SELECT 1 FROM uttarakhand_drainage AS water_bodies  
+    WHERE water_bodies.type IN ('Branch canal', 'River', 'Distributory canal', 'Stream', 'Drain','Main canal')  
+    AND ST_DWithin(built_ups.geom, water_bodies.geom, 10)  
+    AND ST_Intersects(water_bodies.geom, aoi.geom)  
+);  
+
+---"""
+
+def get_cli_messages(context : str, query : str) -> list:
+    """
+    Returns the /api/chat messages for main.py: the fixed system prompt and a
+    user message carrying the dataset context and the question.
+    """
+    return [
+        {"role": "system", "content": CLI_SYSTEM_PROMPT},
+        {"role": "user", "content": f"### CONTEXT FROM METADATA:\n{context}\n\n### USER QUERY:\n{query}\n\n--- RESPONSE:"}
+    ]
+
+def parse_chat_response(text : str) -> dict:
+    """
+    Splits an LLM answer into its "LLM Response" and "View Operation" sections.
+    """
+    parts = re.split(r"View Operation\s*:", text, maxsplit=1, flags=re.IGNORECASE)
+    llm_response = re.sub(r"^\s*(---\s*)?(LLM Response\s*:)?", "", parts[0], flags=re.IGNORECASE).strip()
+    view_operation = ""
+    if len(parts) > 1:
+        # Drop code fences and the "---" separators some models echo back
+        view_operation = "\n".join(
+            line for line in parts[1].splitlines()
+            if line.strip().lower() not in ("```", "```sql", "---")
+        ).strip()
+    return {
+        "llm_response": llm_response,
+        "view_operation": view_operation
+    }
@@ -0,0 +1,139 @@
+import re
+from typing import Optional
+
+# Literals, quoted identifiers and comments are matched first so that keywords
+# inside them are never mistaken for statements
+_token_pattern = re.compile(
+    r"'(?:[^']|'')*'"
+    r"|\"(?:[^\"]|\"\")*\""
+    r"|\$([A-Za-z_][A-Za-z0-9_]*|)\$.*?\$\1\$"
+    r"|--[^\n]*"
+    r"|/\*.*?\*/"
+    r"|;"
+    r"|[A-Za-z_][A-Za-z0-9_]*"
+    r"|.",
+    re.DOTALL
+)
+
+# Anything that writes, locks or changes the session has no place in a map query
+FORBIDDEN_KEYWORDS = {
+    "INSERT", "UPDATE", "DELETE", "MERGE", "UPSERT", "CREATE", "DROP", "ALTER", "TRUNCATE",
+    "GRANT", "REVOKE", "COPY", "VACUUM", "ANALYZE", "CLUSTER", "REINDEX", "CALL", "DO",
+    "LOCK", "INTO", "SET", "RESET", "LISTEN", "NOTIFY", "PREPARE", "EXECUTE", "DEALLOCATE",
+}
+
+
+class QueryRejected(ValueError):
+    """Raised when generated SQL is not a single SELECT or its plan is too expensive."""
+
+    def __init__(self, message: str, plan: dict = None):
+        super().__init__(message)
+        self.plan = plan
+
+
+class GuardLimits:
+    """
+    Thresholds from database.conf (0 disables a check):
+        QUERY_MAX_COST            refuse plans with a higher estimated total cost (default 10000000)
+        QUERY_MAX_ROWS            add a LIMIT when more rows are estimated (default 50000)
+        QUERY_STATEMENT_TIMEOUT   per-query statement_timeout in ms (default 30000)
+    """
+
+    def __init__(self, max_cost: float = 1e7, max_rows: int = 50000, statement_timeout: int = 30000):
+        self.max_cost = max_cost
+        self.max_rows = max_rows
+        self.statement_timeout = statement_timeout
+
+    @classmethod
+    def from_config(cls, config: dict) -> "GuardLimits":
+        return cls(
+            max_cost=float(config.get('QUERY_MAX_COST', 1e7)),
+            max_rows=int(config.get('QUERY_MAX_ROWS', 50000)),
+            statement_timeout=int(config.get('QUERY_STATEMENT_TIMEOUT', 30000))
+        )
+
+    @property
+    def checks_plan(self) -> bool:
+        return bool(self.max_cost or self.max_rows)
+
+
+def check_select(sql: str):
+    """
+    Accepts a single read-only SELECT (optionally WITH ...) and raises
+    QueryRejected for anything else.
+    """
+    words = []
+    for match in _token_pattern.finditer(sql):
+        token = match.group(0)
+        if token.startswith(("--", "/*", "'", '"', "$")):
+            continue
+        if token == ";":
+            words.append(";")
+        elif token[0].isalpha() or token[0] == "_":
+            words.append(token.upper())
+
+    while words and words[-1] == ";":
+        words.pop()
+    if not words:
+        raise QueryRejected("No SQL statement found")
+    if ";" in words:
+        raise QueryRejected("Only a single SQL statement is allowed")
+    if words[0] not in ("SELECT", "WITH"):
+        raise QueryRejected(f"Only SELECT queries are allowed, got {words[0]}")
+    forbidden = sorted(FORBIDDEN_KEYWORDS.intersection(words))
+    if forbidden:
+        raise QueryRejected(f"Query contains forbidden keyword(s): {', '.join(forbidden)}")
+
+
+def begin(cursor, limits: GuardLimits):
+    """
+    Makes the current transaction read-only and bounds its statements by
+    the per-query timeout; both end when the connection is rolled back.
+    """
+    cursor.execute("SET TRANSACTION READ ONLY")
+    if limits.statement_timeout:
+        cursor.execute("SET LOCAL statement_timeout = %s", (int(limits.statement_timeout),))
+
+
+def plan_estimate(explain_json) -> dict:
+    """
+    Reduces EXPLAIN (FORMAT JSON, SUMMARY) output to the figures we report.
+    """
+    root = explain_json[0]
+    plan = root["Plan"]
+    return {
+        "total_cost": plan.get("Total Cost"),
+        "plan_rows": plan.get("Plan Rows"),
+        "planning_ms": root.get("Planning Time"),
+        "limited_to": None,
+    }
+
+
+def explain(cursor, sql: str, params=None) -> dict:
+    cursor.execute(f"EXPLAIN (FORMAT JSON, SUMMARY) {sql}", params)
+    return plan_estimate(cursor.fetchone()[0])
+
+
+def check_plan(plan: dict, limits: GuardLimits, limited: bool = False) -> Optional[int]:
+    """
+    Raises QueryRejected when the estimated cost is too high; otherwise
+    returns the row limit to add when the plan estimates more rows than
+    allowed, None when the query may run as is.
+
+    The cost is checked first, on the plan without a LIMIT: the planner
+    scales a Limit node's total cost down by limit/rows, so a LIMIT would
+    let an expensive join (e.g. a cross join under ST_DWithin) slip under
+    the threshold while still doing most of its work.
+    """
+    if limits.max_cost and plan["total_cost"] > limits.max_cost:
+        raise QueryRejected(
+            f"Query refused: estimated cost {plan['total_cost']:.0f} exceeds the limit of {limits.max_cost:.0f}",
+            plan
+        )
+    if limits.max_rows and not limited and plan["plan_rows"] > limits.max_rows:
+        return limits.max_rows
+    return None
+
+
+def limit_query(select_sql: str, limit: int) -> str:
+    return f"SELECT * FROM ({select_sql}) AS _limited LIMIT {int(limit)}"
@@ -1,18 +1,181 @@
-from helper import database_helper
-from flask import jsonify
 
-def get_result_from_db(llm_response : str, aoi : str) :
-    result = database_helper.run_query(llm_response, aoi)
+import json
+from helper import database_helper, logger, pagination, metrics
+from helper.query_guard import QueryRejected
+from flask import jsonify, Response
+
+STREAM_CHUNK_BYTES = 64 * 1024
+
+def _tighter_cap(configured : int, requested : int) -> int :
+    # 0 means unlimited; a requested cap may only tighten the configured one
+    caps = [cap for cap in (configured, requested) if cap]
+    return min(caps) if caps else 0
+
+def get_result_from_db(llm_response : str, aoi : str, include_properties : bool = None, zoom : int = None) :
+    """
+    Returns (ok, response). Error responses carry their status: 422 when the
+    query guard refused the SQL, 500 otherwise.
+    """
+    result = database_helper.run_query(llm_response, aoi, include_properties, zoom)
     if result[0] : 
-        response = jsonify({
-            "sql_query" : llm_response,
-            "data" : result[1]
-        })
+        # The FeatureCollection is already serialized; splice it in instead of re-encoding
+        with metrics.span("serialize"):
+            body = b'{"sql_query": ' + json.dumps(llm_response).encode("utf-8") + \
+                   b', "plan": ' + json.dumps(result[2]).encode("utf-8") + b', "data": ' + result[1] + b'}'
+        response = Response(body, mimetype="application/json")
         return True, response
     else :
         error_str = f"{result[1]}"
         response = jsonify({
             "sql_query" : llm_response,
-           "error" : error_str
+           "error" : error_str,
+           "plan" : result[2]
+        })
+        response.status_code = 422 if result[2] and result[2].get("rejected") else 500
+        return False, response
+
+def _page_size(requested : int) -> int :
+    default_size, max_size = database_helper.get_page_sizes()
+    return min(int(requested or default_size), max_size)
+
+def _page_response(result_set, after, page_size : int) :
+    try:
+        body, next_after = database_helper.get_page(result_set, after, page_size)
+    except ValueError as e:
+        response = jsonify({"sql_query" : result_set.sql, "error" : f"{e}"})
+        response.status_code = 422
+        return False, response
+    except Exception as e:
+        logger.log("ERROR", str(e))
+        response = jsonify({"sql_query" : result_set.sql, "error" : f"{e}"})
+        response.status_code = 500
+        return False, response
+    page = {
+        "size" : page_size,
+        "next_cursor" : pagination.encode_token(result_set.id, next_after, page_size) if next_after is not None else None,
+        # The planner's row estimate for the whole result, not an exact count
+        "estimated_total" : result_set.plan.get("plan_rows") if result_set.plan else None
+    }
+    with metrics.span("serialize"):
+        body = b'{"sql_query": ' + json.dumps(result_set.sql).encode("utf-8") + \
+               b', "plan": ' + json.dumps(result_set.plan).encode("utf-8") + \
+               b', "page": ' + json.dumps(page).encode("utf-8") + b', "data": ' + body + b'}'
+    return True, Response(body, mimetype="application/json")
+
+def first_page_from_db(llm_response : str, aoi : str, page_size : int = None, include_properties : bool = None, zoom : int = None) :
+    """
+    First keyset page of the result (ordered by gid) with a continuation
+    cursor for next_page_from_db. Page sizes default to PAGE_SIZE and are
+    capped at MAX_PAGE_SIZE (database.conf).
+    """
+    try:
+        result_set = database_helper.create_page_set(llm_response, aoi, include_properties, zoom)
+    except QueryRejected as e:
+        response = jsonify({
+            "sql_query" : llm_response,
+            "error" : f"{e}",
+            "plan" : dict(e.plan or {}, rejected=True)
+        })
+        response.status_code = 422
+        return False, response
+    except Exception as e:
+        logger.log("ERROR", str(e))
+        response = jsonify({"sql_query" : llm_response, "error" : f"{e}"})
+        response.status_code = 500
+        return False, response
+    return _page_response(result_set, None, _page_size(page_size))
+
+def next_page_from_db(cursor : str) :
+    """
+    The page after the one that returned `cursor`; 404 once the result set has expired.
+    """
+    token = pagination.decode_token(cursor)
+    if token is None:
+        response = jsonify({"error" : "Invalid cursor"})
+        response.status_code = 400
+        return False, response
+    result_set_id, after, page_size = token
+    result_set = database_helper.get_result_sets().get(result_set_id)
+    if result_set is None:
+        response = jsonify({"error" : "Unknown or expired cursor, run the query again"})
+        response.status_code = 404
+        return False, response
+    return _page_response(result_set, after, _page_size(page_size))
+
+def stream_result_from_db(llm_response : str, aoi : str, max_features : int = None, max_bytes : int = None, include_properties : bool = None, zoom : int = None) :
+    """
+    Same payload as get_result_from_db, written to a chunked response as rows
+    arrive from a server-side cursor. Output stops cleanly at max_features
+    features or max_bytes bytes of feature data (STREAM_MAX_FEATURES /
+    STREAM_MAX_BYTES in database.conf, which callers can only lower); the
+    trailer reports feature_count, whether the result was truncated and the
+    query guard's plan estimate.
+    """
+    config = database_helper.get_config()
+    max_features = _tighter_cap(int(config.get('STREAM_MAX_FEATURES', 0)), int(max_features or 0))
+    max_bytes = _tighter_cap(int(config.get('STREAM_MAX_BYTES', 0)), int(max_bytes or 0))
+
+    plan = {}
+    features = database_helper.stream_features(llm_response, aoi, include_properties, plan=plan, zoom=zoom)
+    try:
+        # Runs the query, so SQL errors still get a normal error response
+        first_feature = next(features, None)
+    except QueryRejected as e:
+        logger.log("WARNING", str(e))
+        response = jsonify({
+            "sql_query" : llm_response,
+            "error" : f"{e}",
+            "plan" : dict(e.plan or {}, rejected=True)
+        })
+        response.status_code = 422
+        return False, response
+    except Exception as e:
+        logger.log("ERROR", str(e))
+        response = jsonify({
+            "sql_query" : llm_response,
+            "error" : f"{e}"
         })
+        response.status_code = 500
         return False, response
+
+    def generate():
+        feature_count = 0
+        feature_bytes = 0
+        truncated = False
+        error = None
+        chunk = [b'{"sql_query": ', json.dumps(llm_response).encode("utf-8"),
+                 b', "data": {"type": "FeatureCollection", "features": [']
+        chunk_size = 0
+        try:
+            pending = first_feature
+            while pending is not None:
+                if (max_features and feature_count >= max_features) or \
+                        (max_bytes and feature_bytes + len(pending) > max_bytes):
+                    truncated = True
+                    break
+                if feature_count:
+                    chunk.append(b", ")
+                chunk.append(pending)
+                feature_count += 1
+                feature_bytes += len(pending)
+                chunk_size += len(pending)
+                if chunk_size >= STREAM_CHUNK_BYTES:
+                    yield b"".join(chunk)
+                    chunk = []
+                    chunk_size = 0
+                pending = next(features, None)
+        except Exception as e:
+            # Headers are already sent; report the failure in the trailer instead
+            logger.log("ERROR", str(e))
+            error = f"{e}"
+        finally:
+            features.close()
+
+        trailer = {"feature_count": feature_count, "truncated": truncated, "plan": plan or None}
+        if error is not None:
+            trailer["error"] = error
+        chunk.append(b"]}, ")
+        chunk.append(json.dumps(trailer).encode("utf-8")[1:])
+        yield b"".join(chunk)
+
+    return True, Response(generate(), mimetype="application/json")
@@ -0,0 +1,163 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+import shapely
+
+_sql_token_pattern = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|\s+|[^'\"\s]+")
+_table_pattern = re.compile(r"\b(?:FROM|JOIN)\s+([A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)?)", re.IGNORECASE)
+
+# One cheap catalog read per lookup: relfilenode changes on TRUNCATE / VACUUM FULL,
+# the tuple counters on every committed insert, update and delete
+TABLE_FINGERPRINT_SQL = """
+    SELECT c.relname, c.relfilenode, s.n_tup_ins, s.n_tup_upd, s.n_tup_del
+    FROM pg_class AS c
+    LEFT JOIN pg_stat_user_tables AS s ON s.relid = c.oid
+    WHERE c.relname = ANY(%s)
+"""
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Collapses whitespace and lower-cases everything outside string literals and
+    quoted identifiers, so layout differences in the LLM's SQL share an entry.
+    """
+    parts = []
+    for token in _sql_token_pattern.findall(sql.strip().rstrip(";")):
+        if token.isspace():
+            parts.append(" ")
+        elif token[0] in "'\"":
+            parts.append(token)
+        else:
+            parts.append(token.lower())
+    return "".join(parts).strip()
+
+
+def referenced_tables(sql: str) -> list:
+    """
+    Table names after FROM / JOIN (schema dropped), without the aoi CTE.
+    """
+    tables = {name.split(".")[-1].lower() for name in _table_pattern.findall(sql)}
+    tables.discard("aoi")
+    return sorted(tables)
+
+
+def aoi_fingerprint(aoi: str) -> str:
+    """
+    Hash of the AOI geometry in canonical form (vertex order, ring start and
+    WKT formatting do not matter); falls back to the whitespace-normalized text.
+    """
+    try:
+        geometry = shapely.normalize(shapely.from_wkt(aoi))
+        material = shapely.to_wkb(geometry)
+    except Exception:
+        material = " ".join(aoi.split()).upper().encode("utf-8")
+    return hashlib.sha256(material).hexdigest()
+
+
+def make_key(sql: str, aoi, *options) -> str:
+    # A registered AOI (see aoi_registry) is identified by its id
+    aoi_key = aoi_fingerprint(aoi) if isinstance(aoi, str) else f"registered:{aoi.id}"
+    material = "\n".join([normalize_sql(sql), aoi_key, *map(str, options)])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    LRU cache of serialized FeatureCollections bounded by total bytes.
+
+    Each entry remembers the fingerprints of the tables its query read; an
+    entry whose tables changed since it was stored is dropped on lookup.
+    Table fingerprints are themselves reused for fingerprint_ttl seconds, so
+    a burst of lookups costs one catalog query.
+    """
+
+    def __init__(self, max_bytes: int, max_entry_bytes: int = None, fingerprint_ttl: float = 5.0):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes or max(max_bytes // 8, 1)
+        self.fingerprint_ttl = fingerprint_ttl
+        self._entries = OrderedDict()  # key -> (body, tables, fingerprints, plan)
+        self._bytes = 0
+        self._fingerprints = {}  # table -> (checked_at, fingerprint)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def table_fingerprints(self, connection, tables: Iterable[str]) -> Dict[str, tuple]:
+        now = time.monotonic()
+        fingerprints = {}
+        stale = []
+        with self._lock:
+            for table in tables:
+                cached = self._fingerprints.get(table)
+                if cached is not None and now - cached[0] < self.fingerprint_ttl:
+                    fingerprints[table] = cached[1]
+                else:
+                    stale.append(table)
+        if stale:
+            with connection.cursor() as cursor:
+                cursor.execute(TABLE_FINGERPRINT_SQL, (stale,))
+                rows = {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+            with self._lock:
+                for table in stale:
+                    fingerprints[table] = rows.get(table)
+                    self._fingerprints[table] = (now, fingerprints[table])
+        return fingerprints
+
+    def get(self, connection, key: str) -> Optional[tuple]:
+        """
+        Returns (body, plan estimate) of a still-valid entry, or None.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        body, tables, fingerprints, plan = entry
+        if self.table_fingerprints(connection, tables) != fingerprints:
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+                    self._bytes -= len(body)
+                self.invalidations += 1
+                self.misses += 1
+            return None
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self.hits += 1
+        return body, plan
+
+    def put(self, key: str, body: bytes, tables: list, fingerprints: Dict[str, tuple], plan: dict = None):
+        if len(body) > self.max_entry_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous[0])
+            self._entries[key] = (body, tables, fingerprints, plan)
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes:
+                _, (evicted, _, _, _) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,94 @@
+import re
+import threading
+from functools import lru_cache
+from typing import Dict, Optional, Set
+
+from spellchecker import SpellChecker
+from helper import metadata_registry, logger, metrics
+
+CACHE_SIZE = 8192
+
+_word_pattern = re.compile(r"[a-z][a-z']+")
+
+
+def build_domain_vocabulary(metadata: Dict) -> Set[str]:
+    """
+    Collects words the spell checker must treat as known: dataset and table
+    names, column names and the values listed in column descriptions
+    (district names, road types, soil classes, ...).
+    """
+    texts = []
+    for dataset_name, dataset_info in metadata.items():
+        texts.append(dataset_name)
+        texts.append(str(dataset_info.get("table_name", "")).replace("_", " "))
+        texts.append(str(dataset_info.get("description", "")))
+        for col_name, col_desc in dataset_info.get("columns", {}).items():
+            texts.append(col_name.replace("_", " "))
+            texts.append(str(col_desc))
+
+    vocabulary = set()
+    for text in texts:
+        vocabulary.update(_word_pattern.findall(text.lower()))
+    return vocabulary
+
+
+class SpellService:
+    """
+    Process-wide spell corrector seeded with the metadata vocabulary and
+    fronted by a bounded LRU of word -> correction results.
+    """
+
+    def __init__(self, cache_size: int = CACHE_SIZE):
+        self._spell = SpellChecker()
+        self._lock = threading.Lock()
+        self._digest = None
+        self._correction = lru_cache(maxsize=cache_size)(self._correction_uncached)
+
+    def _correction_uncached(self, word: str) -> Optional[str]:
+        return self._spell.correction(word)
+
+    def refresh_vocabulary(self):
+        """
+        Loads the domain vocabulary again if metadata.json changed.
+        """
+        snapshot = metadata_registry.get_snapshot()
+        if snapshot.digest == self._digest:
+            return
+        with self._lock:
+            if snapshot.digest == self._digest:
+                return
+            vocabulary = build_domain_vocabulary(snapshot.metadata)
+            self._spell.word_frequency.load_words(vocabulary)
+            self._correction.cache_clear()
+            self._digest = snapshot.digest
+            logger.log("INFO", f"Spell checker seeded with {len(vocabulary)} domain words.")
+
+    def correct_word(self, word: str) -> str:
+        corrected = self._correction(word.lower())
+        return corrected if corrected else word
+
+    def correct(self, text: str) -> str:
+        self.refresh_vocabulary()
+        return " ".join(self.correct_word(word) for word in text.split())
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_spell_service() -> SpellService:
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = SpellService()
+    return _service
+
+
+def correct_query(text: str) -> str:
+    """
+    Spell-corrects a whole query once; callers pass the result on instead
+    of correcting again.
+    """
+    with metrics.span("spell"):
+        return get_spell_service().correct(text)
@@ -0,0 +1,156 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import psycopg2
+import psycopg2.errors
+from helper import logger, query_guard
+from helper.result_cache import normalize_sql
+
+
+class StatementCache:
+    """
+    Runs generated queries as server-side prepared statements so that a
+    repeated query shape is parsed once per pooled connection and can reuse
+    its plan. Statements are named after the normalized SQL and tracked per
+    connection (see db_pool.PooledConnection), at most max_per_connection
+    each, least recently used deallocated first.
+
+    Per shape it keeps execution counts, PREPARE time and planning times
+    read from EXPLAIN (SUMMARY) EXECUTE, which plans without running the
+    query: on every execution while the query guard checks plans, otherwise
+    on the first and every plan_timing_every-th one (see sample_due()).
+    """
+
+    def __init__(self, max_per_connection: int = 64, plan_timing_every: int = 20, max_shapes: int = 500):
+        self.max_per_connection = max_per_connection
+        self.plan_timing_every = plan_timing_every
+        self.max_shapes = max_shapes
+        self._shapes = OrderedDict()  # name -> stats dict
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def statement_name(sql_text: str, parameter_type: str) -> str:
+        digest = hashlib.sha1(f"{parameter_type}\n{normalize_sql(sql_text)}".encode("utf-8")).hexdigest()
+        return f"llm_{digest[:20]}"
+
+    def _shape(self, name: str, sql_text: str) -> dict:
+        with self._lock:
+            shape = self._shapes.get(name)
+            if shape is None:
+                shape = {
+                    "statement": name, "sql": sql_text[:200], "executions": 0, "prepares": 0,
+                    "prepare_ms_total": 0.0, "planning_samples": 0, "planning_ms_total": 0.0,
+                    "planning_ms_last": None,
+                }
+                self._shapes[name] = shape
+                while len(self._shapes) > self.max_shapes:
+                    self._shapes.popitem(last=False)
+            else:
+                self._shapes.move_to_end(name)
+            return shape
+
+    def prepare(self, connection, cursor, sql_text: str, parameter_type: str) -> str:
+        """
+        Makes sure `sql_text` (which refers to its single parameter as $1) is
+        prepared on this connection and returns the statement name.
+        """
+        name = self.statement_name(sql_text, parameter_type)
+        shape = self._shape(name, sql_text)
+        prepared = connection.prepared_statements
+        if name in prepared:
+            prepared.move_to_end(name)
+            return name
+
+        started = time.perf_counter()
+        # A failed PREPARE aborts the open transaction; the savepoint lets the
+        # duplicate case below carry on with EXPLAIN/EXECUTE in the same one
+        savepoint = not connection.autocommit
+        if savepoint:
+            cursor.execute("SAVEPOINT prepare_statement")
+        try:
+            cursor.execute(f"PREPARE {name}({parameter_type}) AS {sql_text}")
+        except psycopg2.errors.DuplicatePreparedStatement:
+            # Prepared on this session before we started tracking it
+            if savepoint:
+                cursor.execute("ROLLBACK TO SAVEPOINT prepare_statement")
+        else:
+            if savepoint:
+                cursor.execute("RELEASE SAVEPOINT prepare_statement")
+        prepare_ms = (time.perf_counter() - started) * 1000
+        prepared[name] = True
+        while len(prepared) > self.max_per_connection:
+            evicted, _ = prepared.popitem(last=False)
+            cursor.execute(f"DEALLOCATE {evicted}")
+        with self._lock:
+            shape["prepares"] += 1
+            shape["prepare_ms_total"] += prepare_ms
+        return name
+
+    def sample_due(self, name: str) -> bool:
+        """
+        True when the next execution of `name` is one whose planning time is sampled.
+        """
+        with self._lock:
+            shape = self._shapes.get(name)
+            executions = shape["executions"] + 1 if shape is not None else 1
+        return executions == 1 or bool(self.plan_timing_every and executions % self.plan_timing_every == 0)
+
+    def explain(self, cursor, name: str, parameter) -> dict:
+        """
+        Plans the prepared statement for `parameter` without running it and
+        returns query_guard.plan_estimate() of the plan.
+        """
+        cursor.execute(f"EXPLAIN (FORMAT JSON, SUMMARY) EXECUTE {name}(%s)", (parameter,))
+        plan = query_guard.plan_estimate(cursor.fetchone()[0])
+        with self._lock:
+            shape = self._shapes.get(name)
+            if shape is not None and plan["planning_ms"] is not None:
+                shape["planning_samples"] += 1
+                shape["planning_ms_total"] += plan["planning_ms"]
+                shape["planning_ms_last"] = plan["planning_ms"]
+        return plan
+
+    def execute(self, connection, cursor, name: str, parameter, plan: dict = None):
+        """
+        Executes the prepared statement `name`; fetch the rows from the cursor afterwards.
+        """
+        started = time.perf_counter()
+        try:
+            cursor.execute(f"EXECUTE {name}(%s)", (parameter,))
+        except psycopg2.errors.InvalidSqlStatementName:
+            # The session lost the statement; prepare it again next time
+            connection.prepared_statements.pop(name, None)
+            raise
+        execute_ms = (time.perf_counter() - started) * 1000
+
+        with self._lock:
+            shape = self._shapes.get(name)
+            executions = 0
+            if shape is not None:
+                shape["executions"] += 1
+                executions = shape["executions"]
+        planning_ms = plan["planning_ms"] if plan else None
+        logger.log("INFO", f"Query {name}: execution #{executions}, "
+                           f"planning {'%.2f ms' % planning_ms if planning_ms is not None else 'not sampled'}, "
+                           f"execute {execute_ms:.1f} ms")
+
+    def stats(self, top: int = 10) -> dict:
+        with self._lock:
+            shapes = sorted(self._shapes.values(), key=lambda shape: shape["executions"], reverse=True)
+            executions = sum(shape["executions"] for shape in shapes)
+            prepares = sum(shape["prepares"] for shape in shapes)
+            return {
+                "shapes": len(shapes),
+                "executions": executions,
+                "prepares": prepares,
+                "prepared_reuse_ratio": round(1 - prepares / executions, 4) if executions else None,
+                "top": [
+                    dict(shape,
+                         prepare_ms_total=round(shape["prepare_ms_total"], 3),
+                         planning_ms_avg=round(shape["planning_ms_total"] / shape["planning_samples"], 3)
+                         if shape["planning_samples"] else None)
+                    for shape in shapes[:top]
+                ],
+            }
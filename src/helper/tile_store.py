@@ -0,0 +1,64 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from helper import result_cache
+
+
+class ResultSet:
+    """
+    A generated query over an AOI that is served piecewise (as vector tiles
+    or keyset pages) instead of being run once in full.
+    """
+
+    def __init__(self, result_set_id: str, sql: str, aoi, include_properties: bool, plan: dict = None,
+                 zoom: int = None):
+        self.id = result_set_id
+        self.sql = sql
+        self.aoi = aoi
+        self.include_properties = include_properties
+        self.plan = plan
+        self.zoom = zoom
+        self.created_at = time.time()
+
+
+def result_set_id(sql: str, aoi, *options) -> str:
+    # The same query over the same AOI maps to the same id, so its tiles are shared
+    return result_cache.make_key(sql, aoi, *options)[:24]
+
+
+class ResultSetStore:
+    """
+    In-process LRU of result sets, each kept for ttl seconds after its last use.
+    """
+
+    def __init__(self, max_sets: int = 1000, ttl: float = 3600):
+        self.max_sets = max_sets
+        self.ttl = ttl
+        self._sets = OrderedDict()  # id -> (last_used, ResultSet)
+        self._lock = threading.Lock()
+
+    def put(self, result_set: ResultSet):
+        with self._lock:
+            self._sets.pop(result_set.id, None)
+            self._sets[result_set.id] = (time.monotonic(), result_set)
+            while len(self._sets) > self.max_sets:
+                self._sets.popitem(last=False)
+
+    def get(self, result_set_id: str) -> Optional[ResultSet]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sets.get(result_set_id)
+            if entry is None:
+                return None
+            if now - entry[0] > self.ttl:
+                del self._sets[result_set_id]
+                return None
+            self._sets[result_set_id] = (now, entry[1])
+            self._sets.move_to_end(result_set_id)
+            return entry[1]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"result_sets": len(self._sets), "max_sets": self.max_sets, "ttl": self.ttl}
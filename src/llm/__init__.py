@@ -1,8 +1,12 @@
 import re
+import requests
 from langchain_community.llms import Ollama
 from langchain.chains import LLMChain
-from helper import prompt_helper, logger
+from helper import prompt_helper, logger, metrics
+from llm import ollama_client
+from llm.circuit_breaker import llm_breaker
 from langchain.cache import InMemoryCache
+from langchain_core.callbacks import BaseCallbackHandler
 from langchain.globals import set_llm_cache
 
 MODEL_NAME = "mistral"
@@ -15,10 +19,37 @@ def extract_query_tag(response: str) -> str:
     match = re.search(r"<Query:\s*(.*?)\s*>", response, re.DOTALL)
     return match.group(1) if match else "No <Query> tag found in the response."
 
-def generate_responses(user_query: str):
-    llm = Ollama(model=MODEL_NAME, temperature=0,top_p=0, top_k=1)
+class GenerationMetrics(BaseCallbackHandler):
+    """
+    Records Ollama's timings and token counts of each generation the chain
+    runs (prompts answered from the LLM cache are not generated, so not recorded).
+    """
+
+    def on_llm_end(self, response, **kwargs):
+        for generations in response.generations:
+            for generation in generations:
+                metrics.record_llm(generation.generation_info)
+
+def generate_responses(user_query: str, engine: str = None, context: dict = None):
+    """
+    Runs the SQL chain for user_query. Pass a context already built with
+    prompt_helper.get_sql_context() to keep that work outside an LLM slot.
+    """
+    # Same host as /chat ([llm] in server.conf), not LangChain's localhost default
+    llm = Ollama(base_url=ollama_client.LLM_CONFIG["base_url"], model=MODEL_NAME, temperature=0,top_p=0, top_k=1)
     query_chain = LLMChain(llm=llm, prompt=prompt_helper.get_prompt_template())
-    response = query_chain.run({"user_query": user_query, "metadata": prompt_helper.get_metadata()})
+    if context is None:
+        context = prompt_helper.get_sql_context(user_query, engine=engine)
+    metrics.record_tokens("prompt_estimate", prompt_helper.estimate_tokens(
+        query_chain.prompt.format(user_query=user_query, **context)))
+    llm_breaker.check()
+    try:
+        with metrics.span("llm"):
+            response = query_chain.run({"user_query": user_query, **context}, callbacks=[GenerationMetrics()])
+    except requests.exceptions.ConnectionError:
+        llm_breaker.record_failure()
+        raise
+    llm_breaker.record_success()
     logger.log("INFO", f"LLM Resposne : {response}")
     return response
 
@@ -0,0 +1,127 @@
+import math
+import os
+import threading
+import time
+from configparser import ConfigParser
+
+from helper import logger
+
+CONF_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "conf", "server.conf")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a backend that is known to be down."""
+    status = 503
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker. After failure_threshold connection
+    failures in a row the circuit opens and calls fail immediately for
+    reset_timeout seconds; then a single trial call is let through and its
+    outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 10.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_started = None
+        self._times_opened = 0
+        self._rejected = 0
+
+    def check(self):
+        """
+        Raises CircuitOpenError unless a call may go to the backend now.
+        """
+        with self._lock:
+            if self._state == CLOSED:
+                return
+            now = time.monotonic()
+            if self._state == OPEN:
+                remaining = self._opened_at + self.reset_timeout - now
+                if remaining > 0:
+                    self._rejected += 1
+                    raise CircuitOpenError(f"{self.name} backend is unavailable", math.ceil(remaining))
+                self._state = HALF_OPEN
+                self._trial_started = now
+                return
+            # Half-open: one trial at a time; a trial that never reported back expires
+            if self._trial_started is not None and now - self._trial_started < self.reset_timeout:
+                self._rejected += 1
+                raise CircuitOpenError(f"{self.name} backend is unavailable", 1)
+            self._trial_started = now
+
+    def precheck(self):
+        """
+        Early check for callers about to queue for a backend call: raises while
+        the circuit is open and cooling down, but never claims the half-open trial.
+        """
+        with self._lock:
+            if self._state == OPEN:
+                remaining = self._opened_at + self.reset_timeout - time.monotonic()
+                if remaining > 0:
+                    self._rejected += 1
+                    raise CircuitOpenError(f"{self.name} backend is unavailable", math.ceil(remaining))
+
+    def record_success(self):
+        with self._lock:
+            if self._state != CLOSED:
+                logger.log("INFO", f"{self.name} circuit closed")
+            self._state = CLOSED
+            self._failures = 0
+            self._trial_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._trial_started = None
+                self._times_opened += 1
+                logger.log("WARNING", f"{self.name} circuit opened after {self._failures} consecutive failures")
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "times_opened": self._times_opened,
+                "rejected": self._rejected,
+            }
+
+
+def load_breaker() -> CircuitBreaker:
+    """
+    Builds the LLM breaker from the [circuit_breaker] section of conf/server.conf:
+        failure_threshold = 3
+        reset_timeout = 10
+    """
+    config = ConfigParser()
+    config.read(CONF_PATH)
+    return CircuitBreaker(
+        "LLM",
+        failure_threshold=config.getint("circuit_breaker", "failure_threshold", fallback=3),
+        reset_timeout=config.getfloat("circuit_breaker", "reset_timeout", fallback=10.0),
+    )
+
+
+llm_breaker = load_breaker()
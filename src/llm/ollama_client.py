@@ -0,0 +1,190 @@
+import json
+import os
+import threading
+from configparser import ConfigParser
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from llm.circuit_breaker import llm_breaker
+
+CONF_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "conf", "server.conf")
+
+
+def load_config() -> dict:
+    """
+    Reads the [llm] section of conf/server.conf.
+    """
+    config = ConfigParser()
+    config.read(CONF_PATH)
+    host = config.get("llm", "host", fallback="localhost")
+    port = config.get("llm", "port", fallback="11434")
+    return {
+        "base_url": f"http://{host}:{port}",
+        "model": config.get("llm", "model", fallback="llama3:latest"),
+        "timeout": config.getfloat("llm", "timeout", fallback=30.0),
+        "connect_timeout": config.getfloat("llm", "connect_timeout", fallback=5.0),
+        "max_connections": config.getint("llm", "max_connections", fallback=200),
+        "max_keepalive_connections": config.getint("llm", "max_keepalive_connections", fallback=50),
+        "keepalive_expiry": config.getfloat("llm", "keepalive_expiry", fallback=60.0),
+        # How long Ollama keeps the model (and its prompt cache) loaded after a call
+        "keep_alive": config.get("llm", "keep_alive", fallback="30m"),
+        # Pinned context size; changing num_ctx between calls reloads the model
+        "num_ctx": config.getint("llm", "num_ctx", fallback=0) or None,
+        "warm_up": config.getboolean("llm", "warm_up", fallback=True),
+        "reuse_context": config.getboolean("llm", "reuse_context", fallback=False),
+    }
+
+
+LLM_CONFIG = load_config()
+GENERATE_URL = f"{LLM_CONFIG['base_url']}/api/generate"
+CHAT_URL = f"{LLM_CONFIG['base_url']}/api/chat"
+TAGS_URL = f"{LLM_CONFIG['base_url']}/api/tags"
+
+_session = None
+_session_lock = threading.Lock()
+_async_client = None
+
+
+def get_session() -> requests.Session:
+    """
+    Long-lived keep-alive session for the blocking (Flask / CLI) callers.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=LLM_CONFIG["max_keepalive_connections"])
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+def _record(status_code: int):
+    # A 5xx from Ollama (e.g. model failed to load) counts against the breaker like a refused connection
+    if status_code >= 500:
+        llm_breaker.record_failure()
+    else:
+        llm_breaker.record_success()
+
+
+def generate(payload: dict, timeout: float = None) -> requests.Response:
+    """
+    Blocking /api/generate call; fails fast with CircuitOpenError while Ollama is down.
+    """
+    llm_breaker.check()
+    try:
+        response = get_session().post(GENERATE_URL, json=payload, timeout=timeout or LLM_CONFIG["timeout"])
+    except requests.exceptions.ConnectionError:
+        llm_breaker.record_failure()
+        raise
+    except requests.exceptions.Timeout:
+        # The connection was accepted, so the server is up, just slow
+        llm_breaker.record_success()
+        raise
+    _record(response.status_code)
+    return response
+
+
+def stream(path: str, payload: dict, timeout: float = None):
+    """
+    Posts with "stream": true and yields Ollama's NDJSON chunks as dicts
+    (works for /api/generate and /api/chat).
+    """
+    payload = dict(payload, stream=True)
+    url = f"{LLM_CONFIG['base_url']}{path}"
+    llm_breaker.check()
+    try:
+        response = get_session().post(url, json=payload, stream=True, timeout=timeout or LLM_CONFIG["timeout"])
+    except requests.exceptions.ConnectionError:
+        llm_breaker.record_failure()
+        raise
+    except requests.exceptions.Timeout:
+        # No first chunk in time, but the connection was accepted: slow, not down
+        llm_breaker.record_success()
+        raise
+    _record(response.status_code)
+    with response:
+        if response.status_code >= 400:
+            # Buffer the error body so e.response.text still works after the response closes
+            response.content
+        response.raise_for_status()
+        try:
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+            # requests reports a read timeout mid-stream as a ConnectionError; the server had answered
+            llm_breaker.record_success()
+            raise
+
+
+async def open_async_client() -> httpx.AsyncClient:
+    """
+    Creates the shared AsyncClient; call once from the event loop that serves requests.
+    """
+    global _async_client
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(
+            base_url=LLM_CONFIG["base_url"],
+            timeout=httpx.Timeout(LLM_CONFIG["timeout"], connect=LLM_CONFIG["connect_timeout"]),
+            limits=httpx.Limits(
+                max_connections=LLM_CONFIG["max_connections"],
+                max_keepalive_connections=LLM_CONFIG["max_keepalive_connections"],
+                keepalive_expiry=LLM_CONFIG["keepalive_expiry"],
+            ),
+        )
+    return _async_client
+
+
+async def close_async_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+def get_async_client() -> httpx.AsyncClient:
+    if _async_client is None:
+        raise RuntimeError("Async LLM client is not open; call open_async_client() at startup")
+    return _async_client
+
+
+async def agenerate(payload: dict, timeout: float = None) -> httpx.Response:
+    kwargs = {"timeout": timeout} if timeout else {}
+    llm_breaker.check()
+    try:
+        response = await get_async_client().post("/api/generate", json=payload, **kwargs)
+    except (httpx.ConnectError, httpx.ConnectTimeout):
+        llm_breaker.record_failure()
+        raise
+    except httpx.TimeoutException:
+        llm_breaker.record_success()
+        raise
+    _record(response.status_code)
+    return response
+
+
+async def astream(path: str, payload: dict):
+    """
+    Async twin of stream(): yields Ollama's NDJSON chunks as they arrive.
+    """
+    payload = dict(payload, stream=True)
+    llm_breaker.check()
+    try:
+        async with get_async_client().stream("POST", path, json=payload) as response:
+            _record(response.status_code)
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line:
+                    yield json.loads(line)
+    except (httpx.ConnectError, httpx.ConnectTimeout):
+        llm_breaker.record_failure()
+        raise
+    except httpx.TimeoutException:
+        # Waiting for the first chunk or a later one; the connection was accepted
+        llm_breaker.record_success()
+        raise
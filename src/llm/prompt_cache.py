@@ -0,0 +1,134 @@
+import threading
+from typing import List, Optional
+
+from helper import logger, prompt_helper
+from llm import ollama_client
+
+
+class PrefixCache:
+    """
+    Keeps a fixed prompt prefix warm in Ollama and measures what that saves.
+
+    Every payload is built as <prefix><suffix> with the same model, options and
+    keep_alive, so the model stays resident and Ollama's runner can reuse the
+    KV cache of the longest shared token prefix. warm_up() evaluates the prefix
+    once ahead of the first request and records its token count and cold
+    prompt-eval speed; with reuse_context the returned "context" token state is
+    kept and later requests send it instead of re-sending the prefix text.
+    """
+
+    def __init__(self, prefix: str, options: dict, reuse_context: bool = False):
+        self.prefix = prefix
+        self.options = options
+        self.reuse_context = reuse_context
+        self.context: Optional[List[int]] = None
+        self.prefix_tokens = 0
+        self.cold_ns_per_token = None
+        # Model tokens per estimate_tokens() unit, calibrated on the prefix
+        self.token_ratio = 1.0
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._prompt_eval_tokens = 0
+        self._prompt_eval_ns = 0
+        self._reused_tokens = 0
+        self._saved_ns = 0
+
+    def build_payload(self, suffix: str) -> dict:
+        payload = {
+            "model": ollama_client.LLM_CONFIG["model"],
+            "prompt": self.prefix + suffix,
+            "stream": False,
+            "keep_alive": ollama_client.LLM_CONFIG["keep_alive"],
+            "options": self.options
+        }
+        if self.reuse_context and self.context:
+            payload["prompt"] = suffix
+            payload["context"] = self.context
+        return payload
+
+    def _warm_up_payload(self) -> dict:
+        return {
+            "model": ollama_client.LLM_CONFIG["model"],
+            "prompt": self.prefix,
+            "stream": False,
+            "keep_alive": ollama_client.LLM_CONFIG["keep_alive"],
+            "options": dict(self.options, num_predict=1)
+        }
+
+    def _remember_warm_up(self, llm_json: dict):
+        prompt_tokens = llm_json.get("prompt_eval_count") or 0
+        prompt_ns = llm_json.get("prompt_eval_duration") or 0
+        with self._lock:
+            self.prefix_tokens = prompt_tokens
+            if prompt_tokens and prompt_ns:
+                self.cold_ns_per_token = prompt_ns / prompt_tokens
+                self.token_ratio = prompt_tokens / max(prompt_helper.estimate_tokens(self.prefix), 1)
+            context = llm_json.get("context")
+            if context:
+                # Drop the token sampled by the warm-up so only the prefix state is reused
+                generated = llm_json.get("eval_count") or 0
+                self.context = context[:len(context) - generated] if generated else context
+        logger.log("INFO", f"LLM prompt prefix warmed up: {prompt_tokens} tokens in {prompt_ns / 1e6:.1f} ms")
+
+    def warm_up(self) -> bool:
+        try:
+            response = ollama_client.generate(self._warm_up_payload())
+            response.raise_for_status()
+            self._remember_warm_up(response.json())
+            return True
+        except Exception as e:
+            logger.log("WARNING", f"LLM prompt prefix warm-up failed: {e}")
+            return False
+
+    async def awarm_up(self) -> bool:
+        try:
+            response = await ollama_client.agenerate(self._warm_up_payload())
+            response.raise_for_status()
+            self._remember_warm_up(response.json())
+            return True
+        except Exception as e:
+            logger.log("WARNING", f"LLM prompt prefix warm-up failed: {e}")
+            return False
+
+    def record(self, llm_json: dict, suffix: str) -> dict:
+        """
+        Compares a request's prompt evaluation with evaluating the whole prompt
+        cold: tokens Ollama did not have to evaluate are counted as reused and
+        priced at the warm-up's per-token cost.
+        """
+        prompt_tokens = llm_json.get("prompt_eval_count")
+        prompt_ns = llm_json.get("prompt_eval_duration")
+        if prompt_tokens is None or prompt_ns is None:
+            return {}
+        expected_tokens = self.prefix_tokens + round(prompt_helper.estimate_tokens(suffix) * self.token_ratio)
+        reused_tokens = max(expected_tokens - prompt_tokens, 0) if self.prefix_tokens else 0
+        saved_ns = reused_tokens * self.cold_ns_per_token if self.cold_ns_per_token else 0
+        with self._lock:
+            self._requests += 1
+            self._prompt_eval_tokens += prompt_tokens
+            self._prompt_eval_ns += prompt_ns
+            self._reused_tokens += reused_tokens
+            self._saved_ns += saved_ns
+        measurement = {
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_ms": round(prompt_ns / 1e6, 3),
+            "prompt_tokens_reused": reused_tokens,
+            "prompt_eval_saved_ms": round(saved_ns / 1e6, 3),
+        }
+        logger.log("INFO", f"LLM prompt eval: {measurement}")
+        return measurement
+
+    def stats(self) -> dict:
+        with self._lock:
+            requests = self._requests or 1
+            return {
+                "warmed_up": self.prefix_tokens > 0,
+                "reuse_context": self.reuse_context and self.context is not None,
+                "prefix_tokens": self.prefix_tokens,
+                "cold_prompt_eval_ms_per_token": round(self.cold_ns_per_token / 1e6, 4) if self.cold_ns_per_token else None,
+                "requests": self._requests,
+                "avg_prompt_eval_ms": round(self._prompt_eval_ns / requests / 1e6, 3),
+                "avg_prompt_tokens_reused": round(self._reused_tokens / requests, 1),
+                "avg_prompt_eval_saved_ms": round(self._saved_ns / requests / 1e6, 3),
+                "total_prompt_eval_saved_ms": round(self._saved_ns / 1e6, 3),
+            }
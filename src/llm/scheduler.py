@@ -0,0 +1,246 @@
+import abc
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import deque
+from configparser import ConfigParser
+
+from helper import logger, metrics
+
+CONF_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "conf", "server.conf")
+
+
+def load_config() -> dict:
+    """
+    Reads the [scheduler] section of conf/server.conf:
+        max_concurrency = 4    (default OLLAMA_NUM_PARALLEL, else 4)
+        max_queue = 32         requests allowed to wait for a slot
+        queue_timeout = 20     seconds a request may wait before giving up
+    """
+    config = ConfigParser()
+    config.read(CONF_PATH)
+    return {
+        "max_concurrency": config.getint("scheduler", "max_concurrency",
+                                         fallback=int(os.environ.get("OLLAMA_NUM_PARALLEL") or 4)),
+        "max_queue": config.getint("scheduler", "max_queue", fallback=32),
+        "queue_timeout": config.getfloat("scheduler", "queue_timeout", fallback=20.0),
+    }
+
+
+SCHEDULER_CONFIG = load_config()
+
+
+class SchedulerRejected(Exception):
+    """Raised when an LLM call is not admitted; carries the HTTP status and Retry-After."""
+    status = 503
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class QueueFullError(SchedulerRejected):
+    status = 429
+
+
+class QueueTimeoutError(SchedulerRejected):
+    status = 503
+
+
+class Ticket:
+    """
+    An admitted LLM call. Release it (or leave its with-block) when the
+    generation is over; releasing twice is harmless.
+    """
+
+    def __init__(self, scheduler, queue_wait: float):
+        self.scheduler = scheduler
+        self.queue_wait = queue_wait
+        self.started_at = time.monotonic()
+        self.released = False
+
+    def release(self):
+        if self.released:
+            return
+        self.released = True
+        self.scheduler._finish(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class _SchedulerBase(abc.ABC):
+    """
+    Bounded concurrency in front of the Ollama host with a FIFO waiting
+    queue: at most max_concurrency generations run at once, at most
+    max_queue requests wait (in arrival order) and none waits longer than
+    its deadline. Freed slots are handed straight to the oldest waiter.
+    """
+
+    def __init__(self, max_concurrency: int = 4, max_queue: int = 32, queue_timeout: float = 20.0):
+        if max_concurrency < 1 or max_queue < 0:
+            raise ValueError(f"Invalid scheduler limits: concurrency={max_concurrency}, queue={max_queue}")
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._waiters = deque()
+        self._active = 0
+        self._stats_lock = threading.Lock()
+        self._admitted = 0
+        self._rejected_full = 0
+        self._rejected_timeout = 0
+        self._queue_wait_total = 0.0
+        self._queue_wait_max = 0.0
+        self._generation_count = 0
+        self._generation_total = 0.0
+        self._generation_max = 0.0
+
+    def retry_after(self) -> int:
+        """
+        Seconds until a slot is likely free: the queue ahead drained at the
+        observed average generation time.
+        """
+        with self._stats_lock:
+            average = self._generation_total / self._generation_count if self._generation_count else 5.0
+        return max(1, math.ceil(average * (len(self._waiters) + 1) / self.max_concurrency))
+
+    def _admit(self, arrived: float) -> Ticket:
+        queue_wait = time.monotonic() - arrived
+        metrics.record("llm_queue", queue_wait)
+        with self._stats_lock:
+            self._admitted += 1
+            self._queue_wait_total += queue_wait
+            self._queue_wait_max = max(self._queue_wait_max, queue_wait)
+        return Ticket(self, queue_wait)
+
+    def _queue_full(self) -> QueueFullError:
+        with self._stats_lock:
+            self._rejected_full += 1
+        return QueueFullError(f"LLM queue is full ({self.max_queue} waiting)", self.retry_after())
+
+    def _queue_timeout(self, waited: float) -> QueueTimeoutError:
+        with self._stats_lock:
+            self._rejected_timeout += 1
+        return QueueTimeoutError(f"No LLM slot became free within {waited:.1f}s", self.retry_after())
+
+    def _finish(self, ticket: Ticket):
+        generation = time.monotonic() - ticket.started_at
+        with self._stats_lock:
+            self._generation_count += 1
+            self._generation_total += generation
+            self._generation_max = max(self._generation_max, generation)
+        self._release_slot()
+        logger.log("INFO", f"LLM call: queue wait {ticket.queue_wait * 1000:.1f} ms, generation {generation * 1000:.1f} ms")
+
+    @abc.abstractmethod
+    def _release_slot(self):
+        """
+        Hands the finished call's slot to the oldest waiter, or frees it.
+        """
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            admitted = self._admitted or 1
+            generations = self._generation_count or 1
+            return {
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "in_flight": self._active,
+                "queued": len(self._waiters),
+                "admitted": self._admitted,
+                "rejected_queue_full": self._rejected_full,
+                "rejected_queue_timeout": self._rejected_timeout,
+                "queue_wait_avg_s": round(self._queue_wait_total / admitted, 6),
+                "queue_wait_max_s": round(self._queue_wait_max, 6),
+                "generation_avg_s": round(self._generation_total / generations, 6),
+                "generation_max_s": round(self._generation_max, 6),
+            }
+
+
+class LLMScheduler(_SchedulerBase):
+    """
+    Thread-based scheduler for the Flask app and other blocking callers.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: float = None) -> Ticket:
+        """
+        Waits for a generation slot; raises QueueFullError straight away when
+        the queue is full and QueueTimeoutError once `timeout` (default
+        queue_timeout) has passed.
+        """
+        arrived = time.monotonic()
+        timeout = self.queue_timeout if timeout is None else timeout
+        with self._lock:
+            if self._active < self.max_concurrency and not self._waiters:
+                self._active += 1
+                return self._admit(arrived)
+            if len(self._waiters) >= self.max_queue:
+                raise self._queue_full()
+            waiter = threading.Event()
+            self._waiters.append(waiter)
+
+        waiter.wait(timeout)
+        with self._lock:
+            # The slot is handed over under the lock, so this check cannot race it
+            if not waiter.is_set():
+                self._waiters.remove(waiter)
+                raise self._queue_timeout(time.monotonic() - arrived)
+        return self._admit(arrived)
+
+    def _release_slot(self):
+        with self._lock:
+            if self._waiters:
+                self._waiters.popleft().set()
+            else:
+                self._active -= 1
+
+
+class AsyncLLMScheduler(_SchedulerBase):
+    """
+    asyncio twin of LLMScheduler for the aiohttp app; use it from one event loop.
+    """
+
+    async def acquire(self, timeout: float = None) -> Ticket:
+        arrived = time.monotonic()
+        timeout = self.queue_timeout if timeout is None else timeout
+        if self._active < self.max_concurrency and not self._waiters:
+            self._active += 1
+            return self._admit(arrived)
+        if len(self._waiters) >= self.max_queue:
+            raise self._queue_full()
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait({waiter}, timeout=timeout)
+        except BaseException:
+            # Cancelled while queued: give back a slot that was already handed over
+            if waiter.done():
+                self._release_slot()
+            else:
+                self._waiters.remove(waiter)
+                waiter.cancel()
+            raise
+        if not waiter.done():
+            self._waiters.remove(waiter)
+            waiter.cancel()
+            raise self._queue_timeout(time.monotonic() - arrived)
+        return self._admit(arrived)
+
+    def _release_slot(self):
+        if self._waiters:
+            self._waiters.popleft().set_result(None)
+        else:
+            self._active -= 1
+
+
+llm_scheduler = LLMScheduler(**SCHEDULER_CONFIG)
@@ -0,0 +1,129 @@
+# src/matcher/keyword_index.py
+
+from collections import deque
+from difflib import SequenceMatcher
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Set
+
+import numpy as np
+
+
+class PhraseAutomaton:
+    """
+    Aho-Corasick automaton over multi-word keywords. A single scan of the
+    query reports every phrase that occurs in it as a substring.
+    """
+
+    def __init__(self, phrases: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Set[str]] = [set()]
+
+        for phrase in phrases:
+            state = 0
+            for char in phrase:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(set())
+                state = next_state
+            self._output[state].add(phrase)
+
+        # Breadth-first pass to wire failure links
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                self._output[next_state] |= self._output[self._fail[next_state]]
+
+    def search(self, text: str) -> Set[str]:
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            if self._output[state]:
+                found |= self._output[state]
+        return found
+
+
+class KeywordIndex:
+    """
+    Compiled form of the matcher's keyword -> category mappings.
+
+    - single-word keywords go into an exact token hash index
+    - multi-word keywords go into a phrase automaton
+    - fuzzy hits are pre-filtered with a character-count matrix (an upper
+      bound on difflib's ratio, computed for every keyword at once) before
+      difflib's ratio is run on the few survivors
+
+    Returns exactly the categories the original per-keyword difflib loop did,
+    in mapping order.
+    """
+
+    def __init__(self, keyword_mappings: Dict[str, List[str]], cutoff: float = 0.8, word_cache_size: int = 4096):
+        self.cutoff = cutoff
+        self._order = {category: position for position, category in enumerate(keyword_mappings)}
+        self._exact: Dict[str, Set[str]] = {}
+        self._phrase_categories: Dict[str, Set[str]] = {}
+
+        for category, keywords in keyword_mappings.items():
+            for keyword in keywords:
+                if " " in keyword:
+                    self._phrase_categories.setdefault(keyword, set()).add(category)
+                else:
+                    self._exact.setdefault(keyword, set()).add(category)
+
+        self._keywords = list(self._exact)
+        self._alphabet = {char: column for column, char in enumerate(sorted({c for k in self._keywords for c in k}))}
+        self._char_counts = np.zeros((len(self._keywords), len(self._alphabet)), dtype=np.int32)
+        for row, keyword in enumerate(self._keywords):
+            for char in keyword:
+                self._char_counts[row, self._alphabet[char]] += 1
+        self._lengths = np.array([len(k) for k in self._keywords], dtype=np.float64)
+
+        self._phrases = PhraseAutomaton(self._phrase_categories)
+        self._match_word = lru_cache(maxsize=word_cache_size)(self._match_word_uncached)
+
+    def _fuzzy_candidates(self, word: str) -> List[str]:
+        if not self._keywords:
+            return []
+        word_counts = np.zeros(len(self._alphabet), dtype=np.int32)
+        for char in word:
+            column = self._alphabet.get(char)
+            if column is not None:
+                word_counts[column] += 1
+        # Shared characters bound the matching characters M in ratio = 2*M / (a+b)
+        upper = np.minimum(self._char_counts, word_counts).sum(axis=1)
+        bound = 2.0 * upper / (self._lengths + len(word))
+        return [self._keywords[row] for row in np.flatnonzero(bound >= self.cutoff)]
+
+    def _match_word_uncached(self, word: str) -> FrozenSet[str]:
+        matched = set(self._exact.get(word, ()))
+        for keyword in self._fuzzy_candidates(word):
+            categories = self._exact[keyword]
+            if categories <= matched:
+                continue
+            if SequenceMatcher(None, word, keyword).ratio() >= self.cutoff:
+                matched |= categories
+        return frozenset(matched)
+
+    def match(self, words: List[str]) -> List[str]:
+        """
+        Returns matched categories for already lower-cased, spell-corrected words.
+        """
+        matched = set()
+        for phrase in self._phrases.search(" ".join(words)):
+            matched |= self._phrase_categories[phrase]
+        for word in set(words):
+            matched |= self._match_word(word)
+        return sorted(matched, key=self._order.__getitem__)
@@ -1,163 +1,172 @@
 # src/matcher/matcher.py
 
-import json
-import os
 from typing import Dict, List
-from spellchecker import SpellChecker
-from difflib import get_close_matches
-
-spell = SpellChecker()
+from helper import metadata_registry, metrics, spell_helper
+from matcher.keyword_index import KeywordIndex
+from matcher import retrieval
+
+KEYWORD_MAPPINGS = {
+    'soil': ['soil', 'erosion', 'texture', 'productivity', 'sandy', 'alluvial', 'loam'],
+    'roads': ['road', 'highway', 'path', 'track', 'transport', 'national highway', 'state highway'],
+    'forest': ['forest', 'tree', 'vegetation', 'evergreen', 'deciduous', 'plantation'],
+    'drainage': ['river', 'stream', 'canal', 'drain', 'water', 'drainage', 'tributary'],
+    'lulc': ['land use', 'lulc', 'urban', 'rural', 'agriculture', 'built', 'settlement'],
+    'earthquake': ['earthquake', 'seismic', 'zone', 'fault', 'thrust'],
+    'flood': ['flood', 'plain', 'flooding'],
+    'folds': ['fold', 'anticline', 'syncline', 'geology'],
+    'contour': ['elevation', 'contour', 'height', 'altitude', 'topography'],
+    'districts': ['district', 'administrative', 'boundary', 'almora', 'dehradun', 'nainital'],
+    'irrigation': ['irrigation', 'irrigated', 'farming', 'agriculture'],
+    'glacier': ['glacier', 'ice', 'glacial', 'snow'],
+    'glacial_lakes': ['glacial lake', 'lake', 'pond', 'water body', 'moraine', 'supra']
+}
+
+CATEGORY_TO_DATASET = {
+    'soil': ['Uttarakhand Soil Data'],
+    'roads': ['Uttarakhand Roads Data'],
+    'forest': ['Uttarakhand Forest Data'],
+    'drainage': ['Uttarakhand Drainage Data'],
+    'lulc': ['Uttarakhand LULC (Land Use Land Cover) Data - 2015'],
+    'earthquake': ['Uttarakhand earthqake Zone Data', 'Uttarakhand Fault Data'],
+    'flood': ['Uttarakhand Flood Plains Data'],
+    'folds': ['Uttarakhand Folds Data'],
+    'contour': ['Uttarakhand Contour 100 meter Data', 'Uttarakhand Contour 200 meter Data', 'Uttarakhand Contour 500 meter Data'],
+    'districts': ['Uttarakhand Districts Data'],
+    'irrigation': ['Uttarakhand Irrigation Data'],
+    'glacier': ['Uttarakhand Glacier area 2020', 'Uttarakhand Glacier area 2021', 'Uttarakhand Glacier area 2022', 'Uttarakhand Glacier area 2023'],
+    'glacial_lakes': ['Uttarakhand Glacial Lakes Data', 'Pre Monsoon Glacial Lakes 2020', 'Pre Monsoon Glacial Lakes 2021', 'Pre Monsoon Glacial Lakes 2022', 'Pre Monsoon Glacial Lakes 2023', 'Post Monsoon Glacial Lakes 2020', 'Post Monsoon Glacial Lakes 2021', 'Post Monsoon Glacial Lakes 2022', 'Post Monsoon Glacial Lakes 2023']
+}
+
+DISTRICTS = ['almora', 'tehri garhwal', 'udham singh nagar', 'uttarkashi', 
+             'haridwar', 'nainital', 'chamoli', 'bageshwar', 'champawat', 
+             'pithoragarh', 'pauri garhwal', 'rudraprayag', 'dehradun']
+
+# Compiled once per process; matching cost no longer scales with categories x keywords
+keyword_index = KeywordIndex(KEYWORD_MAPPINGS, cutoff=0.8)
+
+# Sampled values that say nothing about a dataset
+GENERIC_VALUES = {'not available', 'not avaiable', 'na', 'none', 'others', 'other', 'unknown'}
+
+_value_index = None
+_value_index_key = None
+
+def get_value_index() -> Dict[str, List[str]]:
+    """
+    Lower-cased column values sampled by the metadata builder (table_stats.json)
+    mapped to the datasets that contain them, rebuilt when either file changes.
+    """
+    global _value_index, _value_index_key
+    snapshot = metadata_registry.get_snapshot()
+    stats_snapshot = metadata_registry.get_table_stats_snapshot()
+    key = (snapshot.digest, stats_snapshot.digest)
+    if _value_index is None or _value_index_key != key:
+        index = {}
+        for name, info in snapshot.metadata.items():
+            stats = stats_snapshot.metadata.get(info.get("table_name"), {})
+            for values in stats.get("samples", {}).values():
+                for value in values:
+                    value = " ".join(str(value).lower().split())
+                    if len(value) >= 4 and value not in GENERIC_VALUES:
+                        index.setdefault(value, [])
+                        if name not in index[value]:
+                            index[value].append(name)
+        _value_index, _value_index_key = index, key
+    return _value_index
+
+def match_values(query: str) -> List[str]:
+    """
+    Datasets with a sampled column value that appears verbatim in the query
+    (e.g. "tarai soils", "national highway").
+    """
+    padded = f" {' '.join(query.lower().split())} "
+    matched = []
+    for value, datasets in get_value_index().items():
+        if f" {value} " in padded:
+            matched.extend(datasets)
+    return matched
 
 def load_metadata() -> Dict:
-    """Load metadata from JSON file"""
-    try:
-        # Get the path relative to the project root
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        project_root = os.path.dirname(os.path.dirname(current_dir))
-        metadata_path = os.path.join(project_root, "metadata", "metadata.json")
-
-        with open(metadata_path, 'r', encoding='utf-8') as f:
-            metadata = json.load(f)
-            print(f"✅ Loaded {len(metadata)} metadata entries.")
-            return metadata
-    except FileNotFoundError:
-        print(f" metadata.json not found at {metadata_path}")
-        return {}
-    except json.JSONDecodeError as e:
-        print(f" Error parsing metadata.json: {e}")
-        return {}
-
-def extract_keywords_from_query(query: str) -> List[str]:
-    """Extract relevant keywords from user query with spell correction."""
-
-    query_lower = query.lower()
-    words = query_lower.split()
+    """Return metadata from the shared in-process registry"""
+    snapshot = metadata_registry.get_snapshot()
+    if snapshot.error:
+        print(f" {snapshot.error}")
+    return snapshot.metadata
 
-    # Correct spelling of each word
-    corrected_words = []
-    for w in words:
-        corrected = spell.correction(w)
-        corrected_words.append(corrected if corrected else w)
+def extract_keywords_from_query(query: str, spell_corrected: bool = False) -> List[str]:
+    """
+    Extract relevant keywords from user query.
+    Pass spell_corrected=True when the caller already ran spell_helper.correct_query.
+    """
 
-    corrected_query = " ".join(corrected_words)
+    if not spell_corrected:
+        query = spell_helper.correct_query(query)
+    corrected_words = query.lower().split()
 
     # Uncomment below lines for debugging
     # print(f"Original Query: {query}")
-    # print(f"Corrected Query: {corrected_query}")
-
-    keyword_mappings = {
-        'soil': ['soil', 'erosion', 'texture', 'productivity', 'sandy', 'alluvial', 'loam'],
-        'roads': ['road', 'highway', 'path', 'track', 'transport', 'national highway', 'state highway'],
-        'forest': ['forest', 'tree', 'vegetation', 'evergreen', 'deciduous', 'plantation'],
-        'drainage': ['river', 'stream', 'canal', 'drain', 'water', 'drainage', 'tributary'],
-        'lulc': ['land use', 'lulc', 'urban', 'rural', 'agriculture', 'built', 'settlement'],
-        'earthquake': ['earthquake', 'seismic', 'zone', 'fault', 'thrust'],
-        'flood': ['flood', 'plain', 'flooding'],
-        'folds': ['fold', 'anticline', 'syncline', 'geology'],
-        'contour': ['elevation', 'contour', 'height', 'altitude', 'topography'],
-        'districts': ['district', 'administrative', 'boundary', 'almora', 'dehradun', 'nainital'],
-        'irrigation': ['irrigation', 'irrigated', 'farming', 'agriculture'],
-        'glacier': ['glacier', 'ice', 'glacial', 'snow'],
-        'glacial_lakes': ['glacial lake', 'lake', 'pond', 'water body', 'moraine', 'supra']
-    }
-
-    matched_categories = []
-
-    for category, keywords in keyword_mappings.items():
-        for keyword in keywords:
-            # If keyword is a phrase, check if phrase in corrected_query directly
-            if " " in keyword:
-                if keyword in corrected_query:
-                    matched_categories.append(category)
-                    break
-            else:
-                # For single keywords, check exact or approximate match
-                for cw in corrected_words:
-                    if keyword == cw:
-                        matched_categories.append(category)
-                        break
-                    # Approximate match using difflib (tolerance: cutoff=0.8)
-                    close_matches = get_close_matches(keyword, [cw], n=1, cutoff=0.8)
-                    if close_matches:
-                        matched_categories.append(category)
-                        break
-                else:
-                    continue
-                break  # break outer if inner loop matched
+    # print(f"Corrected Query: {' '.join(corrected_words)}")
+
+    matched_categories = keyword_index.match(corrected_words)
 
     # Uncomment below for debugging
     # print(f"Matched categories: {matched_categories}")
 
     return matched_categories
 
-def get_relevant_metadata(query: str) -> str:
+def get_relevant_datasets(query: str, spell_corrected: bool = False, engine: str = None) -> List[str]:
     """
-    Get relevant dataset metadata based on user query
-    Returns formatted context for LLM or empty string if no match
+    Get names of the datasets relevant to the user query, in match order
+    Returns an empty list if nothing matched
+    engine: "rules" (keyword mappings) or "tfidf" (matcher.retrieval);
+    defaults to [matcher] engine in server.conf
     """
     if not query.strip():
-        return ""
-
-    metadata = load_metadata()
+        return []
+    # Corrected before the "match" span starts, so the two stages do not overlap
+    if not spell_corrected:
+        query = spell_helper.correct_query(query)
+    with metrics.span("match"):
+        return _match_datasets(query, engine)
+
+def _match_datasets(query: str, engine: str = None) -> List[str]:
+    if (engine or retrieval.MATCHER_CONFIG["engine"]) == "tfidf":
+        return retrieval.retrieve_datasets(query, spell_corrected=True)
+
+    metadata = metadata_registry.get_snapshot().metadata
     if not metadata:
-        return ""
+        return []
 
-    matched_categories = extract_keywords_from_query(query)
+    matched_categories = extract_keywords_from_query(query, spell_corrected=True)
 
     query_lower = query.lower()
-    districts = ['almora', 'tehri garhwal', 'udham singh nagar', 'uttarkashi', 
-                'haridwar', 'nainital', 'chamoli', 'bageshwar', 'champawat', 
-                'pithoragarh', 'pauri garhwal', 'rudraprayag', 'dehradun']
-
-    has_uttarakhand_context = any(d in query_lower for d in districts) or \
+    has_uttarakhand_context = any(d in query_lower for d in DISTRICTS) or \
                                'uttarakhand' in query_lower or \
                                'uttrakhand' in query_lower
 
     relevant_datasets = []
 
-    category_to_dataset = {
-        'soil': ['Uttarakhand Soil Data'],
-        'roads': ['Uttarakhand Roads Data'],
-        'forest': ['Uttarakhand Forest Data'],
-        'drainage': ['Uttarakhand Drainage Data'],
-        'lulc': ['Uttarakhand LULC (Land Use Land Cover) Data - 2015'],
-        'earthquake': ['Uttarakhand earthqake Zone Data', 'Uttarakhand Fault Data'],
-        'flood': ['Uttarakhand Flood Plains Data'],
-        'folds': ['Uttarakhand Folds Data'],
-        'contour': ['Uttarakhand Contour 100 meter Data', 'Uttarakhand Contour 200 meter Data', 'Uttarakhand Contour 500 meter Data'],
-        'districts': ['Uttarakhand Districts Data'],
-        'irrigation': ['Uttarakhand Irrigation Data'],
-        'glacier': ['Uttarakhand Glacier area 2020', 'Uttarakhand Glacier area 2021', 'Uttarakhand Glacier area 2022', 'Uttarakhand Glacier area 2023'],
-        'glacial_lakes': ['Uttarakhand Glacial Lakes Data', 'Pre Monsoon Glacial Lakes 2020', 'Pre Monsoon Glacial Lakes 2021', 'Pre Monsoon Glacial Lakes 2022', 'Pre Monsoon Glacial Lakes 2023', 'Post Monsoon Glacial Lakes 2020', 'Post Monsoon Glacial Lakes 2021', 'Post Monsoon Glacial Lakes 2022', 'Post Monsoon Glacial Lakes 2023']
-    }
-
     for category in matched_categories:
-        if category in category_to_dataset:
-            relevant_datasets.extend(category_to_dataset[category])
+        if category in CATEGORY_TO_DATASET:
+            relevant_datasets.extend(CATEGORY_TO_DATASET[category])
+    relevant_datasets.extend(match_values(query))
 
     if not relevant_datasets and has_uttarakhand_context:
         relevant_datasets = list(metadata.keys())
 
+    # Remove duplicates while preserving order
+    return [name for name in dict.fromkeys(relevant_datasets) if name in metadata]
+
+def get_relevant_metadata(query: str, spell_corrected: bool = False, engine: str = None) -> str:
+    """
+    Get relevant dataset metadata based on user query
+    Returns formatted context for LLM or empty string if no match
+    """
+    relevant_datasets = get_relevant_datasets(query, spell_corrected, engine)
     if not relevant_datasets:
         return ""
 
-    # Remove duplicates while preserving order
-    relevant_datasets = list(dict.fromkeys(relevant_datasets))
-
-    context_parts = []
-    for dataset_name in relevant_datasets:
-        if dataset_name in metadata:
-            dataset_info = metadata[dataset_name]
-            context_part = f"""
-Dataset: {dataset_name}
-Table: {dataset_info.get('table_name', 'N/A')}
-Description: {dataset_info.get('description', 'N/A')}
-Columns:"""
-
-            for col_name, col_desc in dataset_info.get('columns', {}).items():
-                context_part += f"\n  - {col_name}: {col_desc}"
-
-            context_parts.append(context_part)
+    snapshot = metadata_registry.get_snapshot()
+    context_parts = [snapshot.context_blocks[name] for name in relevant_datasets if name in snapshot.context_blocks]
 
     return "\n" + "="*50 + "\n".join(context_parts) + "\n" + "="*50
 
@@ -0,0 +1,172 @@
+# src/matcher/retrieval.py
+
+import math
+import os
+import re
+import threading
+from configparser import ConfigParser
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from helper import metadata_registry, spell_helper
+
+CONF_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "conf", "server.conf")
+
+ENGINES = ("rules", "tfidf")
+
+_word_pattern = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = {
+    'a', 'an', 'the', 'of', 'in', 'on', 'at', 'to', 'for', 'and', 'or', 'with', 'by', 'from', 'near',
+    'is', 'are', 'was', 'be', 'me', 'show', 'find', 'get', 'list', 'give', 'what', 'which', 'where',
+    'all', 'any', 'data', 'dataset', 'describes', 'type', 'types', 'details', 'other', 'not', 'available',
+}
+
+
+def load_config() -> dict:
+    """
+    Reads the [matcher] section of conf/server.conf:
+        engine = rules           default engine: rules (keyword mappings) or tfidf
+        top_k = 5                most datasets the tfidf engine returns
+        threshold = 0.1          minimum cosine similarity
+        relative_threshold = 0.6 minimum share of the best score
+    """
+    config = ConfigParser()
+    config.read(CONF_PATH)
+    engine = config.get("matcher", "engine", fallback="rules").lower()
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown matcher engine: {engine}")
+    return {
+        "engine": engine,
+        "top_k": config.getint("matcher", "top_k", fallback=5),
+        "threshold": config.getfloat("matcher", "threshold", fallback=0.1),
+        "relative_threshold": config.getfloat("matcher", "relative_threshold", fallback=0.6),
+    }
+
+
+MATCHER_CONFIG = load_config()
+
+
+def features(text: str, ngram_range: Tuple[int, int] = (3, 5)) -> Dict[str, int]:
+    """
+    Word tokens plus the character n-grams of each word (padded with spaces,
+    so prefixes and suffixes count), with their counts. The n-grams make
+    misspellings and inflections ("raods", "glaciers") land near the right words.
+    """
+    counts = {}
+    for word in _word_pattern.findall(text.lower()):
+        if word in STOPWORDS:
+            continue
+        counts[f"w:{word}"] = counts.get(f"w:{word}", 0) + 1
+        padded = f" {word} "
+        for n in range(ngram_range[0], ngram_range[1] + 1):
+            for i in range(len(padded) - n + 1):
+                gram = f"c:{padded[i:i + n]}"
+                counts[gram] = counts.get(gram, 0) + 1
+    return counts
+
+
+def dataset_document(name: str, info: Dict, stats: Dict) -> str:
+    """
+    Everything that describes a dataset: its name, table, description, column
+    names and descriptions, and the values the metadata builder sampled.
+    """
+    parts = [name, info.get("table_name", "").replace("_", " "), info.get("description", "")]
+    for column, description in info.get("columns", {}).items():
+        parts.append(column.replace("_", " "))
+        parts.append(str(description))
+    for values in stats.get("samples", {}).values():
+        parts.extend(str(value) for value in values)
+    return " ".join(parts)
+
+
+class TfidfIndex:
+    """
+    Dense TF-IDF matrix (datasets x features, rows L2-normalized). A query is
+    scored against every dataset with one product of the matrix columns it
+    touches and its own weights.
+    """
+
+    def __init__(self, documents: Dict[str, str]):
+        self.names = list(documents)
+        doc_features = [features(documents[name]) for name in self.names]
+        self.vocabulary = {}
+        for counts in doc_features:
+            for feature in counts:
+                self.vocabulary.setdefault(feature, len(self.vocabulary))
+
+        matrix = np.zeros((len(self.names), len(self.vocabulary)), dtype=np.float32)
+        for row, counts in enumerate(doc_features):
+            for feature, count in counts.items():
+                matrix[row, self.vocabulary[feature]] = 1.0 + math.log(count)
+        document_frequency = np.count_nonzero(matrix, axis=0)
+        self.idf = (np.log((1 + len(self.names)) / (1 + document_frequency)) + 1).astype(np.float32)
+        matrix *= self.idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        self.matrix = matrix / np.where(norms == 0, 1, norms)
+
+    def scores(self, query: str) -> np.ndarray:
+        counts = features(query)
+        columns = [self.vocabulary[feature] for feature in counts if feature in self.vocabulary]
+        if not columns:
+            return np.zeros(len(self.names), dtype=np.float32)
+        weights = np.array([1.0 + math.log(counts[feature]) for feature in counts if feature in self.vocabulary],
+                           dtype=np.float32) * self.idf[columns]
+        # Features no dataset uses only add to the query norm, with the idf of an unseen feature
+        unseen_idf = math.log(1 + len(self.names)) + 1
+        unseen = sum(((1.0 + math.log(count)) * unseen_idf) ** 2
+                     for feature, count in counts.items() if feature not in self.vocabulary)
+        norm = math.sqrt(float(weights @ weights) + unseen)
+        return self.matrix[:, columns] @ weights / norm
+
+    def search(self, query: str, top_k: int = 5, threshold: float = 0.1,
+               relative_threshold: float = 0.6) -> List[Tuple[str, float]]:
+        """
+        Up to top_k (name, score) pairs, best first, scoring at least
+        `threshold` and at least relative_threshold times the best score.
+        """
+        scores = self.scores(query)
+        if not len(scores):
+            return []
+        best = float(scores.max())
+        cutoff = max(threshold, best * relative_threshold)
+        order = np.argsort(-scores, kind="stable")[:top_k]
+        return [(self.names[i], float(scores[i])) for i in order if scores[i] >= cutoff]
+
+
+_index = None
+_index_key = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> TfidfIndex:
+    """
+    The index over the current metadata (and table stats), rebuilt when either changes.
+    """
+    global _index, _index_key
+    snapshot = metadata_registry.get_snapshot()
+    stats_snapshot = metadata_registry.get_table_stats_snapshot()
+    key = (snapshot.digest, stats_snapshot.digest)
+    if _index is None or _index_key != key:
+        with _index_lock:
+            if _index is None or _index_key != key:
+                _index = TfidfIndex({
+                    name: dataset_document(name, info, stats_snapshot.metadata.get(info.get("table_name"), {}))
+                    for name, info in snapshot.metadata.items()
+                })
+                _index_key = key
+    return _index
+
+
+def retrieve_datasets(query: str, spell_corrected: bool = False) -> List[str]:
+    """
+    Names of the datasets the TF-IDF engine ranks for the query, best first.
+    """
+    if not query.strip():
+        return []
+    if not spell_corrected:
+        query = spell_helper.correct_query(query)
+    return [name for name, _ in get_index().search(
+        query, MATCHER_CONFIG["top_k"], MATCHER_CONFIG["threshold"], MATCHER_CONFIG["relative_threshold"]
+    )]
@@ -1,10 +1,17 @@
+import threading
 from flask import Flask
 
 def create_app():
     app = Flask(__name__)
     
     # Register blueprints (if needed)
-    from .routes import main
-    app.register_blueprint(main)
+    from .routes import routes
+    app.register_blueprint(routes)
+
+    from llm import ollama_client
+    from .chat_pipeline import prefix_cache
+    if ollama_client.LLM_CONFIG["warm_up"]:
+        # Evaluate the fixed /chat prompt prefix before the first request needs it
+        threading.Thread(target=prefix_cache.warm_up, daemon=True).start()
     
-    return app
\ No newline at end of file
+    return app
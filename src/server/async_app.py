@@ -0,0 +1,211 @@
+import asyncio
+from configparser import ConfigParser
+
+import httpx
+from aiohttp import web
+
+from helper import metadata_registry, database_helper, metrics
+from llm import ollama_client
+from llm.scheduler import AsyncLLMScheduler, SchedulerRejected, SCHEDULER_CONFIG
+from llm.circuit_breaker import llm_breaker, CircuitOpenError
+from matcher.retrieval import ENGINES
+from . import chat_pipeline, health
+
+LLM_URL = ollama_client.GENERATE_URL
+
+
+@web.middleware
+async def timing_middleware(request: web.Request, handler):
+    """
+    Times each request (see helper.metrics); streamed handlers finish their
+    body before returning, so their whole stream is counted.
+    """
+    resource = request.match_info.route.resource
+    if resource is None or resource.canonical == "/metrics":
+        return await handler(request)
+    trace = metrics.start_trace(resource.canonical)
+    if trace is None:
+        return await handler(request)
+    try:
+        response = await handler(request)
+        trace.status = response.status
+    except web.HTTPException as e:
+        trace.status = e.status
+        raise
+    finally:
+        trace.end()
+    if not response.prepared and metrics.wants_server_timing(request.headers):
+        response.headers["Server-Timing"] = trace.server_timing()
+    return response
+
+
+def rejected(error) -> web.Response:
+    return web.json_response({"error": str(error)}, status=error.status,
+                             headers={"Retry-After": str(error.retry_after)})
+
+
+async def chat(request: web.Request) -> web.Response:
+    try:
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        if not data or not data.get("query", "").strip():
+            return web.json_response({"error": "Query is required"}, status=400)
+        if data.get("matcher") is not None and data["matcher"] not in ENGINES:
+            return web.json_response({"error": f"matcher must be one of {', '.join(ENGINES)}"}, status=400)
+
+        # Spell correction and matching are CPU-bound; keep them off the event loop
+        # (to_thread carries the request's metrics trace into the worker thread)
+        prepared = await asyncio.to_thread(chat_pipeline.prepare_chat, data["query"], data.get("matcher"))
+        cached = await asyncio.to_thread(chat_pipeline.cached_answer, prepared)
+        if cached is not None:
+            return web.json_response(cached)
+
+        # Fail fast while Ollama is known to be down instead of queueing for it
+        llm_breaker.precheck()
+        with await request.app["llm_scheduler"].acquire():
+            with metrics.span("llm"):
+                response = await ollama_client.agenerate(prepared["payload"])
+
+        if response.status_code == 200:
+            llm_json = response.json()
+            chat_pipeline.measure(prepared, llm_json)
+            result = chat_pipeline.chat_result(llm_json, prepared["context"])
+            result = await asyncio.to_thread(chat_pipeline.store_answer, prepared, result)
+            with metrics.span("serialize"):
+                return web.json_response(result)
+        else:
+            return web.json_response({
+                "error": f"LLM server error: HTTP {response.status_code}",
+                "details": response.text
+            }, status=500)
+
+    except (SchedulerRejected, CircuitOpenError) as e:
+        return rejected(e)
+    except httpx.TimeoutException:
+        return web.json_response({"error": "Request to LLM server timed out"}, status=504)
+    except httpx.TransportError:
+        return web.json_response({"error": f"Cannot connect to LLM server at {LLM_URL}"}, status=503)
+    except Exception as e:
+        return web.json_response({"error": f"Internal server error: {str(e)}"}, status=500)
+
+
+async def chat_stream(request: web.Request) -> web.StreamResponse:
+    """
+    /chat with Ollama's token stream relayed as Server-Sent Events.
+    """
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    if not data or not data.get("query", "").strip():
+        return web.json_response({"error": "Query is required"}, status=400)
+    if data.get("matcher") is not None and data["matcher"] not in ENGINES:
+        return web.json_response({"error": f"matcher must be one of {', '.join(ENGINES)}"}, status=400)
+
+    try:
+        prepared = await asyncio.to_thread(chat_pipeline.prepare_chat, data["query"], data.get("matcher"))
+        cached = await asyncio.to_thread(chat_pipeline.cached_answer, prepared)
+        ticket = None
+        if cached is None:
+            # Admission is decided before the event stream starts so a full queue can still answer 429/503
+            llm_breaker.precheck()
+            ticket = await request.app["llm_scheduler"].acquire()
+    except (SchedulerRejected, CircuitOpenError) as e:
+        return rejected(e)
+    except Exception as e:
+        return web.json_response({"error": f"Internal server error: {str(e)}"}, status=500)
+
+    response = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+    if cached is not None:
+        await response.prepare(request)
+        await response.write(chat_pipeline.sse_event("done", cached).encode("utf-8"))
+        await response.write_eof()
+        return response
+
+    stream = chat_pipeline.ChatStream(prepared["context"])
+    try:
+        await response.prepare(request)
+        with metrics.span("llm"):
+            async for chunk in ollama_client.astream("/api/generate", prepared["payload"]):
+                event = stream.feed(chunk)
+                if event:
+                    await response.write(event.encode("utf-8"))
+        chat_pipeline.measure(prepared, stream.final_chunk)
+        result = await asyncio.to_thread(chat_pipeline.store_answer, prepared, stream.finish())
+        await response.write(chat_pipeline.sse_event("done", result).encode("utf-8"))
+    except ConnectionResetError:
+        # Client went away; leaving the async-with closes the upstream stream
+        return response
+    except httpx.TimeoutException:
+        await response.write(stream.error("Request to LLM server timed out").encode("utf-8"))
+    except httpx.TransportError:
+        await response.write(stream.error(f"Cannot connect to LLM server at {LLM_URL}").encode("utf-8"))
+    except Exception as e:
+        await response.write(stream.error(f"LLM server error: {str(e)}").encode("utf-8"))
+    finally:
+        # Runs on cancellation too, so a disconnected client never keeps its slot
+        ticket.release()
+    await response.write_eof()
+    return response
+
+
+async def health_check(request: web.Request) -> web.Response:
+    report = await health.ahealth_report()
+    report.update({
+        "db_pool": database_helper.get_pool_stats(),
+        "prompt_cache": chat_pipeline.prefix_cache.stats(),
+        "llm_scheduler": request.app["llm_scheduler"].stats()
+    })
+    return web.json_response(report)
+
+
+async def prometheus_metrics(request: web.Request) -> web.Response:
+    return web.Response(body=metrics.render(), headers={"Content-Type": metrics.CONTENT_TYPE})
+
+
+async def get_datasets(request: web.Request) -> web.Response:
+    snapshot = metadata_registry.get_snapshot()
+    return web.json_response({"datasets": snapshot.datasets})
+
+
+async def _llm_client_context(app: web.Application):
+    await ollama_client.open_async_client()
+    if ollama_client.LLM_CONFIG["warm_up"]:
+        # Evaluate the fixed /chat prompt prefix before the first request needs it
+        asyncio.ensure_future(chat_pipeline.prefix_cache.awarm_up())
+    yield
+    await ollama_client.close_async_client()
+
+
+def create_async_app() -> web.Application:
+    """
+    Async variant of create_app for /chat, /chat/stream, /health, /datasets and /metrics. One worker
+    keeps many LLM calls in flight over a shared keep-alive AsyncClient
+    instead of pinning a thread per generation.
+    """
+    app = web.Application(middlewares=[timing_middleware])
+    app["llm_scheduler"] = AsyncLLMScheduler(**SCHEDULER_CONFIG)
+    app.cleanup_ctx.append(_llm_client_context)
+    app.router.add_post("/chat", chat)
+    app.router.add_post("/chat/stream", chat_stream)
+    app.router.add_get("/health", health_check)
+    app.router.add_get("/datasets", get_datasets)
+    app.router.add_get("/metrics", prometheus_metrics)
+    return app
+
+
+if __name__ == "__main__":
+    config = ConfigParser()
+    config.read(ollama_client.CONF_PATH)
+    web.run_app(
+        create_async_app(),
+        host=config.get("server", "host", fallback="0.0.0.0"),
+        port=config.getint("server", "port", fallback=5000)
+    )
@@ -0,0 +1,127 @@
+import json
+
+from matcher.matcher import get_relevant_metadata
+from helper import spell_helper, prompt_helper, metrics
+from helper.answer_cache import answer_cache, make_key
+from llm import ollama_client
+from llm.prompt_cache import PrefixCache
+
+GENERATION_OPTIONS = {
+    "temperature": 0.1,
+    "top_p": 0.9,
+    "max_tokens": 500
+}
+if ollama_client.LLM_CONFIG["num_ctx"]:
+    GENERATION_OPTIONS["num_ctx"] = ollama_client.LLM_CONFIG["num_ctx"]
+
+# The prefix is fixed, so its size is estimated once
+PREFIX_TOKENS = prompt_helper.estimate_tokens(prompt_helper.CHAT_PROMPT_PREFIX)
+
+prefix_cache = PrefixCache(
+    prompt_helper.CHAT_PROMPT_PREFIX, GENERATION_OPTIONS,
+    reuse_context=ollama_client.LLM_CONFIG["reuse_context"]
+)
+
+
+def prepare_chat(query: str, engine: str = None) -> dict:
+    """
+    Everything /chat does before calling the LLM: spell correction, metadata
+    matching (with the given matcher engine) and prompt assembly. Shared by
+    the Flask and async apps.
+    """
+    # Corrected once here; the matcher reuses it instead of correcting again
+    query = spell_helper.correct_query(query.strip())
+
+    context = get_relevant_metadata(query, spell_corrected=True, engine=engine)
+
+    # Fixed prefix + request-specific suffix, so Ollama can reuse the prefix's KV cache
+    with metrics.span("prompt"):
+        suffix = prompt_helper.get_chat_prompt_suffix(context, query)
+        payload = prefix_cache.build_payload(suffix)
+    metrics.record_tokens("prompt_estimate", PREFIX_TOKENS + prompt_helper.estimate_tokens(suffix))
+    prepared = {"query": query, "context": context, "suffix": suffix, "payload": payload, "cache_key": None}
+    if answer_cache is not None:
+        prepared["cache_key"] = make_key(query, context, payload["model"], payload["options"])
+    return prepared
+
+
+def cached_answer(prepared: dict):
+    """
+    Returns the cached /chat body (marked as a hit) or None.
+    """
+    if prepared["cache_key"] is None:
+        return None
+    result = answer_cache.get(prepared["cache_key"])
+    if result is None:
+        return None
+    return dict(result, cache="hit")
+
+
+def store_answer(prepared: dict, result: dict) -> dict:
+    """
+    Caches a fresh /chat body (as built by chat_result, for /chat and
+    /chat/stream alike) and returns it marked as a miss.
+    """
+    if prepared["cache_key"] is not None:
+        answer_cache.put(prepared["cache_key"], result)
+    return dict(result, cache="miss")
+
+
+def measure(prepared: dict, llm_json: dict) -> dict:
+    """
+    Records prompt-eval timings of a finished generation against the warm
+    prefix, and Ollama's durations and token counts as request metrics.
+    """
+    metrics.record_llm(llm_json)
+    return prefix_cache.record(llm_json, prepared["suffix"])
+
+
+def chat_result(llm_json: dict, context: str) -> dict:
+    """
+    Shapes the Ollama /api/generate JSON into the /chat response body: the
+    raw answer plus its parsed "LLM Response" / "View Operation" sections.
+    """
+    llm_output = llm_json.get("response") or "No response from LLM."
+    has_data = not llm_output.strip().startswith("Sorry, no data found as per your query")
+    result = {
+        "response": llm_output,
+        "has_data": has_data,
+        "context_length": len(context)
+    }
+    result.update(prompt_helper.parse_chat_response(llm_output))
+    return result
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class ChatStream:
+    """
+    Turns Ollama stream chunks into Server-Sent Events: one "token" event per
+    chunk. Once the stream ends, finish() gives the /chat body for the final
+    "done" event.
+    """
+
+    def __init__(self, context: str):
+        self.context = context
+        self.parts = []
+        self.final_chunk = {}
+
+    def feed(self, chunk: dict) -> str:
+        if chunk.get("error"):
+            raise RuntimeError(chunk["error"])
+        token = chunk.get("response", "")
+        if chunk.get("done"):
+            self.final_chunk = chunk
+        if not token:
+            return ""
+        self.parts.append(token)
+        return sse_event("token", {"token": token})
+
+    def finish(self) -> dict:
+        return chat_result({"response": "".join(self.parts)}, self.context)
+
+    @staticmethod
+    def error(message: str) -> str:
+        return sse_event("error", {"error": message})
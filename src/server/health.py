@@ -0,0 +1,152 @@
+import asyncio
+import threading
+import time
+from configparser import ConfigParser
+
+from helper import database_helper
+from llm import ollama_client
+from llm.circuit_breaker import llm_breaker
+
+
+def load_config() -> dict:
+    """
+    Reads the [health] section of conf/server.conf:
+        cache_seconds = 5    how long a probe result is reused
+        probe_timeout = 2    seconds allowed for each backend probe
+    """
+    config = ConfigParser()
+    config.read(ollama_client.CONF_PATH)
+    return {
+        "cache_seconds": config.getfloat("health", "cache_seconds", fallback=5.0),
+        "probe_timeout": config.getfloat("health", "probe_timeout", fallback=2.0),
+    }
+
+
+HEALTH_CONFIG = load_config()
+
+_lock = threading.Lock()
+_report = None
+_expires_at = 0.0
+_refreshing = False
+
+
+def _llm_result(started: float, models=None, error: Exception = None) -> dict:
+    # Probe outcomes feed the same breaker /chat uses, so a dead Ollama is
+    # noticed (and a recovered one re-admitted) even without chat traffic
+    if error is not None:
+        llm_breaker.record_failure()
+        return {"status": "disconnected", "error": str(error), "circuit": llm_breaker.stats()}
+    llm_breaker.record_success()
+    return {
+        "status": "connected",
+        "latency_ms": round((time.monotonic() - started) * 1000, 1),
+        "model": ollama_client.LLM_CONFIG["model"],
+        "model_available": ollama_client.LLM_CONFIG["model"] in models,
+        "circuit": llm_breaker.stats(),
+    }
+
+
+def _models(tags: dict) -> list:
+    return [model.get("name") for model in tags.get("models", [])]
+
+
+def probe_llm() -> dict:
+    """
+    Lists the installed models (/api/tags): proves Ollama answers without
+    making it generate anything.
+    """
+    started = time.monotonic()
+    try:
+        response = ollama_client.get_session().get(ollama_client.TAGS_URL, timeout=HEALTH_CONFIG["probe_timeout"])
+        response.raise_for_status()
+        return _llm_result(started, models=_models(response.json()))
+    except Exception as e:
+        return _llm_result(started, error=e)
+
+
+async def aprobe_llm() -> dict:
+    started = time.monotonic()
+    try:
+        response = await ollama_client.get_async_client().get("/api/tags", timeout=HEALTH_CONFIG["probe_timeout"])
+        response.raise_for_status()
+        return _llm_result(started, models=_models(response.json()))
+    except Exception as e:
+        return _llm_result(started, error=e)
+
+
+def probe_database() -> dict:
+    """
+    Borrows a pooled connection and runs SELECT 1.
+    """
+    started = time.monotonic()
+    try:
+        database_helper.get_pool().ping(timeout=HEALTH_CONFIG["probe_timeout"])
+    except Exception as e:
+        return {"status": "disconnected", "error": str(e)}
+    return {"status": "connected", "latency_ms": round((time.monotonic() - started) * 1000, 1)}
+
+
+def _build_report(llm: dict, database: dict) -> dict:
+    healthy = llm["status"] == "connected" and database["status"] == "connected"
+    return {
+        "status": "healthy" if healthy else "degraded",
+        "llm_server": ollama_client.GENERATE_URL,
+        "llm_status": llm["status"],
+        "llm": llm,
+        "database": database,
+        "checked_at": time.time(),
+    }
+
+
+def _cached_report():
+    """
+    Returns (report, must_refresh). While another caller refreshes an expired
+    report, the stale one is served instead of probing again.
+    """
+    global _refreshing
+    with _lock:
+        if _report is not None and (time.monotonic() < _expires_at or _refreshing):
+            return _report, False
+        _refreshing = True
+        return None, True
+
+
+def _store_report(report: dict):
+    global _report, _expires_at, _refreshing
+    with _lock:
+        if report is not None:
+            _report = report
+            _expires_at = time.monotonic() + HEALTH_CONFIG["cache_seconds"]
+        _refreshing = False
+
+
+def health_report() -> dict:
+    """
+    LLM and database liveness, probed at most once per cache_seconds.
+    """
+    report, must_refresh = _cached_report()
+    if not must_refresh:
+        return dict(report, cached=True)
+    try:
+        report = _build_report(probe_llm(), probe_database())
+    finally:
+        _store_report(report)
+    return dict(report, cached=False)
+
+
+async def ahealth_report() -> dict:
+    """
+    Async twin of health_report(); the database probe runs in the default executor.
+    """
+    report, must_refresh = _cached_report()
+    if not must_refresh:
+        return dict(report, cached=True)
+    try:
+        llm, database = await asyncio.gather(
+            aprobe_llm(),
+            asyncio.get_running_loop().run_in_executor(None, probe_database)
+        )
+        report = _build_report(llm, database)
+    finally:
+        _store_report(report)
+    return dict(report, cached=False)
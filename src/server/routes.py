@@ -1,37 +1,48 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context, url_for
+import psycopg2
 import requests
-from configparser import ConfigParser
-from src.matcher.matcher import get_relevant_metadata
-import os
-from spellchecker import SpellChecker
+from helper import metadata_registry, database_helper, response_helper, aoi_registry, mvt_encoder, geojson_encoder, metrics, prompt_helper
+from helper.db_pool import PoolTimeoutError
+from helper.query_guard import QueryRejected
+from llm import generate_responses, ollama_client
+from llm.scheduler import llm_scheduler, SchedulerRejected
+from llm.circuit_breaker import llm_breaker, CircuitOpenError
+from matcher.retrieval import ENGINES
+from . import chat_pipeline, health
 
 routes = Blueprint("routes", __name__)
 
-# Initialize spell checker instance
-spell = SpellChecker()
+LLM_URL = ollama_client.GENERATE_URL
 
-def correct_spelling(text):
-    words = text.split()
-    corrected_words = []
-    for word in words:
-        corrected = spell.correction(word)
-        corrected_words.append(corrected if corrected else word)
-    return " ".join(corrected_words)
+@routes.before_request
+def start_timing():
+    # Labelled by the URL rule, so /tiles/<id>/... is one route however many ids there are
+    if request.url_rule is not None and request.url_rule.rule != "/metrics":
+        metrics.start_trace(request.url_rule.rule)
 
-# Load LLM configuration
-def load_config():
-    config = ConfigParser()
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    project_root = os.path.dirname(os.path.dirname(current_dir))
-    config_path = os.path.join(project_root, "conf", "server.conf")
+@routes.after_request
+def finish_timing(response):
+    trace = metrics.current_trace()
+    if trace is None or trace.ended:
+        return response
+    trace.status = response.status_code
+    if response.is_streamed:
+        # Its stages are not over when the headers go out; they only reach /metrics
+        response.call_on_close(trace.end)
+        return response
+    if metrics.wants_server_timing(request.headers):
+        response.headers["Server-Timing"] = trace.server_timing()
+    trace.end()
+    return response
 
-    config.read(config_path)
+def rejected(error):
+    return jsonify({"error": str(error)}), error.status, {"Retry-After": str(error.retry_after)}
 
-    host = config.get("llm", "host", fallback="localhost")
-    port = config.get("llm", "port", fallback="11434")
-    return f"http://{host}:{port}/api/generate"
-
-LLM_URL = load_config()
+def invalid_matcher(data):
+    # "matcher" picks the dataset matcher for one request: rules or tfidf
+    if data.get("matcher") is not None and data["matcher"] not in ENGINES:
+        return jsonify({"error": f"matcher must be one of {', '.join(ENGINES)}"}), 400
+    return None
 
 @routes.route("/chat", methods=["POST"])
 def chat():
@@ -39,84 +50,36 @@ def chat():
         data = request.get_json()
         if not data or not data.get("query", "").strip():
             return jsonify({"error": "Query is required"}), 400
+        error = invalid_matcher(data)
+        if error:
+            return error
 
-        query = data["query"].strip()
-        query = correct_spelling(query)
-
-        context = get_relevant_metadata(query)
-
-        system_prompt = (
-          "You are a GIS data assistant for Uttarakhand. Follow these STRICT rules:\n"
-    "1. Response format MUST be EXACTLY:\n"
-    "   LLM Response: The <objects> are: <comma-separated values from type column>.\n"
-    "   View Operation: SELECT DISTINCT type FROM <correct_table>;\n"
-    "\n"
-    "2. For 'show me <objects>' queries:\n"
-    "   - List ALL distinct values from the 'type' column (or equivalent)\n"
-    "   - Use EXACT values as stored in the database\n"
-    "   - Maintain original capitalization and formatting\n"
-    "\n"
-    "3. Never:\n"
-    "   - Summarize or categorize data\n"
-    "   - Add explanations or interpretations\n"
-    "   - Skip any values from the 'type' column\n"
-    "\n"
-    "4. If no matching data exists, respond EXACTLY:\n"
-    "   LLM Response: No data found for this query.\n"
-    "   View Operation: SELECT * FROM unknown_table;\n"
-    "\n"
-    "5. Example responses REQUIRED:\n"
-    "   For 'show me roads':\n"
-    "   LLM Response: The roads are: Foot path, Village road (Pucca), Cart track, District road, National highway, Village road (Kuchha), City road, State highway.\n"
-    "   View Operation: SELECT DISTINCT type FROM uttarakhand_roads;\n"
-    "\n"
-    "   For 'show me forests':\n"
-    "   LLM Response: The forests are: Forest Evergreen/Semi Evergreen - Dense/Close, Forest Evergreen/Semi Evergreen - Open, Forest - Deciduous (Dry/Moist/Thorn) - Dense/Close, Forest - Forest Blank, Forest - Scrub Forest, Forest - Deciduous (Dry/Moist/Thorn) - Open, Forest - Forest Plantation.\n"
-    "   View Operation: SELECT DISTINCT forest_description FROM uttarakhand_forest;"
-        )
-
-        full_prompt = f"""{system_prompt}
-
-Dataset Context:
-{context}
-
-User Query: {query}
-
-You must return both:
-1. LLM Response: Answer to the user query.
-2. View Operation: A SQL SELECT query matching the query. If no data matches, write: SELECT * FROM unknown_table WHERE condition;
-
-Begin your response:
+        prepared = chat_pipeline.prepare_chat(data["query"], data.get("matcher"))
+        cached = chat_pipeline.cached_answer(prepared)
+        if cached is not None:
+            return jsonify(cached)
 
-LLM Response:"""
-
-        payload = {
-            "model": "llama3:latest",
-            "prompt": full_prompt,
-            "stream": False,
-            "options": {
-                "temperature": 0.1,
-                "top_p": 0.9,
-                "max_tokens": 500
-            }
-        }
-
-        response = requests.post(LLM_URL, json=payload, timeout=30)
+        # Fail fast while Ollama is known to be down instead of queueing for it
+        llm_breaker.precheck()
+        with llm_scheduler.acquire():
+            with metrics.span("llm"):
+                response = ollama_client.generate(prepared["payload"])
 
         if response.status_code == 200:
-            llm_output = response.json().get("response", "No response from LLM.")
-            has_data = not llm_output.strip().startswith("Sorry, no data found as per your query")
-            return jsonify({
-                "response": llm_output,
-                "has_data": has_data,
-                "context_length": len(context)
-            })
+            llm_json = response.json()
+            chat_pipeline.measure(prepared, llm_json)
+            result = chat_pipeline.chat_result(llm_json, prepared["context"])
+            result = chat_pipeline.store_answer(prepared, result)
+            with metrics.span("serialize"):
+                return jsonify(result)
         else:
             return jsonify({
                 "error": f"LLM server error: HTTP {response.status_code}",
                 "details": response.text
             }), 500
 
+    except (SchedulerRejected, CircuitOpenError) as e:
+        return rejected(e)
     except requests.exceptions.Timeout:
         return jsonify({"error": "Request to LLM server timed out"}), 504
     except requests.exceptions.ConnectionError:
@@ -124,36 +87,270 @@ LLM Response:"""
     except Exception as e:
         return jsonify({"error": f"Internal server error: {str(e)}"}), 500
 
-@routes.route("/health", methods=["GET"])
-def health_check():
+@routes.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    """
+    /chat with Ollama's token stream relayed as Server-Sent Events.
+    """
+    data = request.get_json()
+    if not data or not data.get("query", "").strip():
+        return jsonify({"error": "Query is required"}), 400
+    error = invalid_matcher(data)
+    if error:
+        return error
+
     try:
-        test_payload = {
-            "model": "llama3:latest",
-            "prompt": "Test",
-            "stream": False,
-            "options": {"max_tokens": 1}
-        }
-        response = requests.post(LLM_URL, json=test_payload, timeout=5)
-        llm_status = "connected" if response.status_code == 200 else "disconnected"
-    except:
-        llm_status = "disconnected"
+        prepared = chat_pipeline.prepare_chat(data["query"], data.get("matcher"))
+        cached = chat_pipeline.cached_answer(prepared)
+        ticket = None
+        if cached is None:
+            # Admission is decided before any event is sent so a full queue can still answer 429/503
+            llm_breaker.precheck()
+            ticket = llm_scheduler.acquire()
+    except (SchedulerRejected, CircuitOpenError) as e:
+        return rejected(e)
+    except Exception as e:
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+    def generate():
+        if cached is not None:
+            yield chat_pipeline.sse_event("done", cached)
+            return
+
+        stream = chat_pipeline.ChatStream(prepared["context"])
+        try:
+            with metrics.span("llm"):
+                for chunk in ollama_client.stream("/api/generate", prepared["payload"]):
+                    event = stream.feed(chunk)
+                    if event:
+                        yield event
+            chat_pipeline.measure(prepared, stream.final_chunk)
+            result = chat_pipeline.store_answer(prepared, stream.finish())
+            yield chat_pipeline.sse_event("done", result)
+        except requests.exceptions.Timeout:
+            yield stream.error("Request to LLM server timed out")
+        except requests.exceptions.ConnectionError:
+            yield stream.error(f"Cannot connect to LLM server at {LLM_URL}")
+        except Exception as e:
+            yield stream.error(f"LLM server error: {str(e)}")
+        finally:
+            ticket.release()
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    if ticket is not None:
+        # Also frees the slot when the client disconnects before the stream starts
+        response.call_on_close(ticket.release)
+    return response
 
+@routes.route("/query", methods=["POST"])
+def query_layers():
+    """
+    Generates SQL for the query through the LangChain path and runs it over the AOI.
+    The AOI is WKT in "aoi" or the id of a registered AOI in "aoi_id".
+    With "stream": true the FeatureCollection is written out as rows arrive;
+    with "format": "mvt" nothing is run yet and the response names a result
+    set served as vector tiles from /tiles/<id>/<z>/<x>/<y>.mvt.
+    "properties": true/false overrides INCLUDE_PROPERTIES from database.conf;
+    "zoom" (web map zoom level) or "resolution" (degrees per pixel) returns
+    geometries simplified and rounded for that map scale.
+    "matcher": "rules" or "tfidf" overrides the dataset matcher for this request.
+    With "paginate": true (or a "page_size") the first page is returned in
+    gid order with a cursor for GET /query/page.
+    """
+    data = request.get_json()
+    if not data or not data.get("query", "").strip() or not (data.get("aoi", "").strip() or data.get("aoi_id")):
+        return jsonify({"error": "Query and AOI are required"}), 400
+    error = invalid_matcher(data)
+    if error:
+        return error
+    try:
+        zoom = requested_zoom(data)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid zoom/resolution: {e}"}), 400
+    try:
+        max_features = requested_int(data, "max_features", minimum=0)
+        max_bytes = requested_int(data, "max_bytes", minimum=0)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid stream limit: {e}"}), 400
+    try:
+        page_size = requested_int(data, "page_size", minimum=1)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid page_size: {e}"}), 400
+
+    aoi = data.get("aoi")
+    if data.get("aoi_id"):
+        try:
+            registered = aoi_registry.describe_aoi(data["aoi_id"])
+        except (PoolTimeoutError, psycopg2.OperationalError) as e:
+            return jsonify({"error": f"Database unavailable: {str(e)}"}), 503
+        except Exception as e:
+            return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+        if registered is None:
+            return jsonify({"error": f"Unknown AOI id: {data['aoi_id']}"}), 404
+        aoi = aoi_registry.RegisteredAOI(data["aoi_id"])
+
+    try:
+        # Fail fast while Ollama is known to be down instead of queueing for it
+        llm_breaker.precheck()
+        user_query = data["query"].strip()
+        # Spell-fix, matching and prompt building don't need an LLM slot
+        context = prompt_helper.get_sql_context(user_query, engine=data.get("matcher"))
+        with llm_scheduler.acquire():
+            llm_response = generate_responses(user_query, context=context)
+    except (SchedulerRejected, CircuitOpenError) as e:
+        return rejected(e)
+    except Exception as e:
+        return jsonify({"error": f"LLM error: {str(e)}"}), 503
+
+    if data.get("format") == "mvt":
+        return tile_result_set(llm_response, aoi, data.get("properties"))
+    if data.get("paginate") or page_size:
+        ok, response = response_helper.first_page_from_db(
+            llm_response, aoi,
+            page_size=page_size,
+            include_properties=data.get("properties"),
+            zoom=zoom
+        )
+        return response
+    if data.get("stream"):
+        ok, response = response_helper.stream_result_from_db(
+            llm_response, aoi,
+            max_features=max_features,
+            max_bytes=max_bytes,
+            include_properties=data.get("properties"),
+            zoom=zoom
+        )
+    else:
+        ok, response = response_helper.get_result_from_db(llm_response, aoi, data.get("properties"), zoom)
+    # Error responses carry their own status (422 for SQL the query guard refused)
+    return response
+
+@routes.route("/query/page", methods=["GET"])
+def query_page():
+    """
+    Next page of a paginated /query result; "cursor" is the previous page's next_cursor.
+    """
+    cursor = request.args.get("cursor", "")
+    if not cursor:
+        return jsonify({"error": "cursor is required"}), 400
+    ok, response = response_helper.next_page_from_db(cursor)
+    return response
+
+def requested_zoom(data):
+    # A resolution is mapped to its zoom level so that only MAX_ZOOM + 1 query shapes exist
+    if data.get("zoom") is not None:
+        zoom = int(data["zoom"])
+        if not 0 <= zoom <= geojson_encoder.MAX_ZOOM:
+            raise ValueError(f"zoom must be between 0 and {geojson_encoder.MAX_ZOOM}")
+        return zoom
+    if data.get("resolution") is not None:
+        return geojson_encoder.zoom_for_resolution(float(data["resolution"]))
+    return None
+
+def requested_int(data, key, minimum):
+    # Absent means the configured default; anything else must be a whole number >= minimum
+    if data.get(key) is None:
+        return None
+    value = data[key]
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(f"{key} must be a whole number")
+    value = int(value)
+    if value < minimum:
+        raise ValueError(f"{key} must be at least {minimum}")
+    return value
+
+def tile_result_set(llm_response, aoi, include_properties):
+    try:
+        result_set = database_helper.create_result_set(llm_response, aoi, include_properties)
+    except QueryRejected as e:
+        return jsonify({"sql_query": llm_response, "error": str(e), "plan": dict(e.plan or {}, rejected=True)}), 422
+    except Exception as e:
+        return jsonify({"sql_query": llm_response, "error": str(e)}), 500
+    # TileJSON-style description of the result set
+    template = url_for("routes.get_tile", result_set_id=result_set.id, z=0, x=0, y=0, _external=True)
+    template = template.replace("/0/0/0.mvt", "/{z}/{x}/{y}.mvt")
     return jsonify({
-        "status": "healthy",
-        "llm_server": LLM_URL,
-        "llm_status": llm_status
+        "sql_query": llm_response,
+        "result_set": result_set.id,
+        "tiles": [template],
+        "minzoom": 0,
+        "maxzoom": mvt_encoder.MAX_ZOOM,
+        "layer": mvt_encoder.LAYER_NAME,
+        "plan": result_set.plan
     })
 
-@routes.route("/datasets", methods=["GET"])
-def get_datasets():
-    from src.matcher.matcher import load_metadata
-    metadata = load_metadata()
+@routes.route("/tiles/<result_set_id>/<int:z>/<int:x>/<int:y>.mvt", methods=["GET"])
+def get_tile(result_set_id, z, x, y):
+    """
+    One Mapbox Vector Tile of a result set created by /query with "format": "mvt".
+    """
+    result_set = database_helper.get_result_sets().get(result_set_id)
+    if result_set is None:
+        return jsonify({"error": f"Unknown or expired result set: {result_set_id}"}), 404
+    if not mvt_encoder.valid_tile(z, x, y):
+        return jsonify({"error": f"Invalid tile: {z}/{x}/{y}"}), 400
+    try:
+        tile = database_helper.get_tile(result_set, z, x, y)
+    except Exception as e:
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+    if not tile:
+        return "", 204
+    return Response(tile, mimetype=mvt_encoder.CONTENT_TYPE, headers={"Cache-Control": "max-age=60"})
+
+@routes.route("/aoi", methods=["POST"])
+def register_aoi():
+    """
+    Registers a WKT AOI (EPSG:4326) once; later /query calls pass its "aoi_id".
+    """
+    data = request.get_json()
+    if not data or not data.get("aoi", "").strip():
+        return jsonify({"error": "AOI is required"}), 400
+    try:
+        return jsonify(aoi_registry.register_aoi(data["aoi"].strip())), 201
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+@routes.route("/aoi/<aoi_id>", methods=["GET"])
+def get_aoi(aoi_id):
+    try:
+        aoi = aoi_registry.describe_aoi(aoi_id)
+    except Exception as e:
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+    if aoi is None:
+        return jsonify({"error": f"Unknown AOI id: {aoi_id}"}), 404
+    return jsonify(aoi)
 
-    datasets = [{
-        "name": name,
-        "table_name": info.get("table_name"),
-        "description": info.get("description"),
-        "columns": list(info.get("columns", {}).keys())
-    } for name, info in metadata.items()]
+@routes.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """
+    Request, stage and LLM token histograms in the Prometheus text format.
+    """
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
-    return jsonify({"datasets": datasets})
+@routes.route("/health", methods=["GET"])
+def health_check():
+    """
+    Cached LLM (/api/tags) and database liveness plus live pool, scheduler
+    and prompt cache stats. Never makes the model generate.
+    """
+    report = health.health_report()
+    report.update({
+        "db_pool": database_helper.get_pool_stats(),
+        "result_cache": database_helper.get_result_cache_stats(),
+        "statements": database_helper.get_statement_stats(),
+        "tiles": database_helper.get_tile_stats(),
+        "prompt_cache": chat_pipeline.prefix_cache.stats(),
+        "llm_scheduler": llm_scheduler.stats()
+    })
+    return jsonify(report)
+
+@routes.route("/datasets", methods=["GET"])
+def get_datasets():
+    snapshot = metadata_registry.get_snapshot()
+    return jsonify({"datasets": snapshot.datasets})